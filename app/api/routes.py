@@ -1,23 +1,116 @@
-from fastapi import APIRouter, HTTPException
-from app.schemas import FailureInput, TriageOutput, TriageResultList
-from app.services.triage_service import process_failure
-from app.services import storage_service
+import json
+from datetime import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+from app.schemas import (
+    FailureInput,
+    TriageOutput,
+    TriageDebugOutput,
+    TriageResultList,
+    SimilarTriageResult,
+    SimilarTriageResultList,
+    BatchTriageItem,
+    BatchTriageOutput,
+    TriageJobAccepted,
+    TriageJobStatus,
+)
+from app.services.triage_service import (
+    process_failure_async,
+    process_failures_batch,
+    stream_failure_async,
+    schedule_description_enrichment,
+    pending_enrichments,
+    DESCRIPTION_PENDING,
+)
+from app.services import storage_service, job_queue
+from app.services.failure_signature import description_cache
+from app.services.local_classifier import local_classifier
+from app.services.metrics import collect_timings
+from app.services.prompt_compaction import compaction_stats
+from app.services.similarity_index import find_similar_results, MIN_SIMILARITY
+from app.utils.source_maps import source_map_cache
+from app.services.single_flight import ollama_flight, bert_flight
+from app.services.circuit_breaker import ollama_breaker, bert_breaker
+from app.services.scheduler import ollama_bulkhead, bert_bulkhead, priority_scope, PRIORITY_BATCH
 
 router = APIRouter()
 
 
-@router.post("/triage", response_model=TriageOutput)
-def triage_failure(payload: FailureInput):
+def _sse(event: str, data: dict) -> str:
+    """Format one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@router.post(
+    "/triage",
+    response_model=TriageOutput,
+    responses={202: {"model": TriageJobAccepted, "description": "Queued (mode=async)"}},
+)
+async def triage_failure(
+    payload: FailureInput,
+    request: Request,
+    response: Response,
+    mode: Optional[str] = None,
+    debug: Optional[str] = None
+):
     """
     Process a test failure and return triage results.
     The result is automatically stored and can be retrieved later via GET endpoints.
+
+    With `?mode=async` the failure is queued instead: the response is 202 with a
+    job ID, and the result is available from GET /triage/jobs/{job_id}.
+
+    With `?mode=deferred` the result is returned (and stored) without waiting
+    for the LLM: its description is templated and `description_status` is
+    "pending" until the generated description replaces it in the stored
+    result (GET /triage/{id}).
+
+    Every response carries a `Server-Timing` header with the time spent per
+    stage; `?debug=timings` also adds it to the body (`debug`, see
+    TriageDebugOutput), with the prompt token counts and the model name.
     """
+    with collect_timings() as timings:
+        result = await _triage_failure(payload, request, mode)
+
+    server_timing = timings.server_timing()
+    if isinstance(result, Response):
+        result.headers["Server-Timing"] = server_timing
+        return result
+    if debug == "timings":
+        details = {"timings_ms": timings.timings_ms(), "model": payload.llm_model, **timings.details}
+        # Response copy only: the stored result has no debug payload. Returned
+        # as is, since response_model (TriageOutput) would drop the field
+        fields = result.model_dump() if isinstance(result, TriageOutput) else result
+        body = TriageDebugOutput(**fields, debug=details)
+        return JSONResponse(content=body.model_dump(mode="json"), headers={"Server-Timing": server_timing})
+    response.headers["Server-Timing"] = server_timing
+    return result
+
+
+async def _triage_failure(payload: FailureInput, request: Request, mode: Optional[str]):
+    if mode == "async":
+        job_id = await run_in_threadpool(job_queue.enqueue_job, payload)
+        accepted = TriageJobAccepted(
+            job_id=job_id,
+            status="queued",
+            status_url=str(request.url_for("get_triage_job", job_id=job_id)),
+        )
+        return JSONResponse(status_code=202, content=accepted.model_dump())
+
     try:
-        result = process_failure(payload)
+        deferred = mode == "deferred"
+        result = await process_failure_async(payload, defer_description=deferred)
         
-        # Store the result and add the ID to the response
-        result_id = storage_service.store_result(result)
+        # Store the result and add the ID to the response (SQLite writes and
+        # compression block: keep them off the event loop)
+        result_id = await run_in_threadpool(storage_service.store_result, result)
         result["id"] = result_id
+
+        if deferred and result.get("description_status") == DESCRIPTION_PENDING:
+            schedule_description_enrichment(result_id, payload)
         
         return result
     except Exception as e:
@@ -30,6 +123,145 @@ def triage_failure(payload: FailureInput):
         )
 
 
+@router.post("/triage/stream")
+async def triage_failure_stream(payload: FailureInput):
+    """
+    Process a test failure and stream the triage result as Server-Sent Events.
+
+    Events: `title`, `error_line` and `test_url` are sent immediately,
+    `triage_label` when classification finishes, `description` chunks while the
+    LLM writes, and finally `done` with the stored result ID (or `error`).
+    """
+    async def event_stream():
+        try:
+            async for event, data in stream_failure_async(payload):
+                if event == "result":
+                    result_id = await run_in_threadpool(storage_service.store_result, data)
+                    yield _sse("done", {"id": result_id})
+                else:
+                    yield _sse(event, data)
+        except Exception as e:
+            yield _sse("error", {"detail": f"Error while processing triage request: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.post("/triage/batch", response_model=BatchTriageOutput)
+async def triage_failure_batch(payloads: List[FailureInput], max_concurrency: Optional[int] = None):
+    """
+    Process many test failures in one request.
+    Failures are triaged concurrently (bounded by max_concurrency) and every
+    successful result is stored. Results come back in input order; a failure
+    that could not be triaged gets its `error` slot set instead of `result`.
+    Failures with the same probable root cause share one generated description
+    and a `cluster_id`.
+    """
+    # Bulk CI submissions queue behind interactive single triage for LLM/BERT slots
+    with priority_scope(PRIORITY_BATCH):
+        outcomes = await process_failures_batch(payloads, max_concurrency=max_concurrency)
+
+    items = []
+    for index, (result, error) in enumerate(outcomes):
+        if result is not None:
+            try:
+                result["id"] = await run_in_threadpool(storage_service.store_result, result)
+            except Exception as e:
+                result, error = None, f"Error while storing triage result: {str(e)}"
+        items.append(BatchTriageItem(index=index, result=result, error=error))
+
+    succeeded = sum(1 for item in items if item.result is not None)
+    return BatchTriageOutput(
+        total=len(items),
+        succeeded=succeeded,
+        failed=len(items) - succeeded,
+        clusters=len({item.result.cluster_id for item in items if item.result is not None}),
+        results=items
+    )
+
+
+@router.get("/triage/cache/stats")
+def get_description_cache_stats():
+    """
+    Statistics of the failure-signature description cache
+    (hits, misses, evictions and the most reused signatures),
+    plus how many identical in-flight Ollama/BERT calls were coalesced,
+    the parsed source map cache and the prompt tokens saved by compaction.
+    """
+    return {
+        **description_cache.stats(),
+        "coalescing": {
+            "ollama": ollama_flight.stats(),
+            "bert": bert_flight.stats(),
+        },
+        "source_maps": source_map_cache.stats(),
+        "prompt_compaction": compaction_stats.stats(),
+    }
+
+
+@router.get("/triage/classifier/stats")
+def get_local_classifier_stats():
+    """
+    Statistics of the in-process label classifier: results learned per label,
+    and how many label decisions were answered locally instead of by BERT.
+    """
+    return local_classifier.stats()
+
+
+@router.get("/triage/jobs/{job_id}", response_model=TriageJobStatus)
+def get_triage_job(job_id: str):
+    """
+    Retrieve the state of an asynchronous triage job (queued, running, done or failed).
+    The final triage result is included once the job is done.
+    """
+    job = job_queue.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Triage job with ID '{job_id}' not found")
+    return job
+
+
+@router.get("/scheduler/stats")
+def get_scheduler_stats():
+    """
+    Queue depth, active calls and wait times of the Ollama / BERT bulkheads
+    (per priority class), plus the async job queue depth and the deferred
+    descriptions still being generated.
+    """
+    return {
+        "ollama": ollama_bulkhead.stats(),
+        "bert": bert_bulkhead.stats(),
+        "jobs": {"queued": job_queue.get_queue_depth()},
+        "deferred_descriptions": {"pending": pending_enrichments()},
+    }
+
+
+@router.get("/dependencies/status")
+def get_dependency_status():
+    """
+    Circuit breaker state of Ollama and BERT: closed (normal), open (calls
+    rejected, heuristic fallbacks used) or half_open (probing), with the
+    failure and slow-call rates of the rolling window.
+    """
+    return {
+        "ollama": ollama_breaker.stats(),
+        "bert": bert_breaker.stats(),
+    }
+
+
+@router.get("/storage/stats")
+def get_storage_stats():
+    """
+    Footprint of the result store (entries, estimated bytes, oldest result),
+    the retention limits, the number of results evicted per reason
+    (ttl, max_entries, max_bytes) and, for the memory backend, the
+    compression ratio of the stored text fields.
+    """
+    return storage_service.get_storage_stats()
+
+
 @router.get("/triage/latest", response_model=TriageOutput)
 def get_latest_triage_result():
     """
@@ -53,20 +285,89 @@ def get_triage_result(result_id: str):
     return result
 
 
-@router.get("/triage", response_model=TriageResultList)
-def list_triage_results():
+@router.get("/triage/{result_id}/similar", response_model=SimilarTriageResultList)
+def get_similar_triage_results(
+    result_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    min_similarity: float = Query(MIN_SIMILARITY, ge=0.0, le=1.0),
+):
     """
-    List all stored triage results.
-    Returns results sorted by creation time (newest first).
+    Stored results that are near-duplicates of this one (similar error message
+    and stack trace), most similar first. Found through the MinHash/LSH index,
+    without comparing against every stored result.
     """
-    results = storage_service.get_all_results()
-    return TriageResultList(
-        total=len(results),
-        results=results
+    similar = find_similar_results(result_id, limit, min_similarity)
+    if similar is None:
+        raise HTTPException(status_code=404, detail=f"Triage result with ID '{result_id}' not found")
+    return SimilarTriageResultList(
+        id=result_id,
+        total=len(similar),
+        results=[SimilarTriageResult(similarity=score, result=result) for result, score in similar],
     )
 
 
+def _normalize_timestamp(name: str, value: Optional[str]) -> Optional[str]:
+    """
+    Parse an ISO 8601 query parameter into the local-time format used by created_at.
+    """
+    if value is None:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name}: expected an ISO 8601 timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed.isoformat()
+
 
+@router.get("/triage", response_model=TriageResultList)
+def list_triage_results(
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    triage_label: Optional[str] = None,
+    test_name: Optional[str] = Query(None, description="Test name prefix"),
+    error_file: Optional[str] = Query(None, description="Error file name, e.g. checkout.spec.js"),
+    status: Optional[str] = None,
+    created_after: Optional[str] = Query(None, description="ISO 8601 timestamp (inclusive)"),
+    created_before: Optional[str] = Query(None, description="ISO 8601 timestamp (exclusive)"),
+):
+    """
+    List stored triage results, sorted by creation time (newest first).
+
+    Optional filters: `triage_label`, `test_name` (prefix), `error_file`, `status`
+    and a `created_after` / `created_before` range; `total` is then the number
+    of matches. Without `limit` every match is returned. With `limit`, one page
+    is returned together with `next_cursor`; pass it back as `cursor` to get
+    the next page.
+    """
+    filters = {
+        "triage_label": triage_label,
+        "test_name": test_name,
+        "error_file": error_file,
+        "status": status,
+        "created_after": _normalize_timestamp("created_after", created_after),
+        "created_before": _normalize_timestamp("created_before", created_before),
+    }
+
+    if limit is None and cursor is None and not any(v is not None for v in filters.values()):
+        results = storage_service.get_all_results()
+        return TriageResultList(
+            total=len(results),
+            results=results
+        )
+
+    if limit is None and cursor is not None:
+        limit = 100
+    try:
+        results, next_cursor, total = storage_service.query_results(limit, cursor, **filters)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return TriageResultList(
+        total=total,
+        results=results,
+        next_cursor=next_cursor
+    )
 
 
 @router.delete("/triage/{result_id}")
@@ -1,7 +1,110 @@
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+
+import anyio.to_thread
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
 from app.api.routes import router as api_router
+from app.services import job_queue, metrics, storage_service
+from app.services.circuit_breaker import ollama_breaker, bert_breaker
+from app.services.scheduler import ollama_bulkhead, bert_bulkhead
+from app.services.triage_service import pending_enrichments
+from app.services.local_classifier import start_local_classifier, stop_local_classifier
+from app.services.similarity_index import start_similarity_index, stop_similarity_index
+from app.services.http_clients import aclose_clients
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers for ?mode=async triage jobs (resumes jobs left in the queue)
+    job_queue.start_workers()
+    # Expires old results and keeps the result store within its size limits
+    storage_service.start_retention_sweeper()
+    # Label model learning from stored results (answers confident labels without BERT)
+    start_local_classifier()
+    # Near-duplicate search index over the stored results
+    start_similarity_index()
+    # Stored results by triage label for /metrics
+    storage_service.add_listener(metrics.on_storage_event)
+    yield
+    storage_service.remove_listener(metrics.on_storage_event)
+    stop_similarity_index()
+    stop_local_classifier()
+    storage_service.stop_retention_sweeper()
+    job_queue.stop_workers()
+    # Release pooled keep-alive connections to Ollama / BERT
+    await aclose_clients()
 
-app = FastAPI(title="Bug Triage Engine")
+
+app = FastAPI(title="Bug Triage Engine", lifespan=lifespan)
 
 # All API routes will be under /api/...
 app.include_router(api_router, prefix="/api")
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    started = time.perf_counter()
+    response = await call_next(request)
+    # Route template (not the raw path) keeps the label set small;
+    # streaming responses are timed until their headers are sent
+    route = request.scope.get("route")
+    metrics.HTTP_REQUEST_SECONDS.observe(
+        time.perf_counter() - started,
+        route=getattr(route, "path", "unmatched"),
+        method=request.method,
+        status=str(response.status_code),
+    )
+    return response
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: stage / request latency histograms, Ollama
+    token counts and speed, label sources, plus gauges for the result store,
+    the worker threadpool, the Ollama / BERT bulkheads and circuit breakers.
+    """
+    storage = await run_in_threadpool(storage_service.get_storage_stats)
+    jobs_queued = await run_in_threadpool(job_queue.get_queue_depth)
+    # Sync endpoints and run_in_threadpool calls share this limiter
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    bulkheads = {"ollama": ollama_bulkhead.stats(), "bert": bert_bulkhead.stats()}
+    breakers = {"ollama": ollama_breaker.stats(), "bert": bert_breaker.stats()}
+
+    gauges = [
+        metrics.render_gauge("triage_store_results", "Triage results in the store.", [({}, storage["entries"])]),
+        metrics.render_gauge("triage_store_bytes", "Estimated size of the stored triage results.", [({}, storage["bytes"])]),
+        metrics.render_gauge(
+            "triage_threadpool_busy_threads", "Worker threads in use (sync endpoints, storage calls).",
+            [({}, limiter.borrowed_tokens)],
+        ),
+        metrics.render_gauge("triage_threadpool_max_threads", "Worker threadpool size.", [({}, limiter.total_tokens)]),
+        metrics.render_gauge(
+            "triage_dependency_active_calls", "Calls in flight per dependency (bulkhead slots in use).",
+            [({"dependency": name}, stats["active"]) for name, stats in bulkheads.items()],
+        ),
+        metrics.render_gauge(
+            "triage_dependency_max_concurrency", "Bulkhead slots per dependency.",
+            [({"dependency": name}, stats["max_concurrency"]) for name, stats in bulkheads.items()],
+        ),
+        metrics.render_gauge(
+            "triage_dependency_queued_calls", "Calls waiting for a bulkhead slot per dependency.",
+            [({"dependency": name}, stats["queue_depth"]) for name, stats in bulkheads.items()],
+        ),
+        metrics.render_gauge(
+            "triage_dependency_circuit_state", "Circuit breaker state per dependency (1 = current state).",
+            [
+                ({"dependency": name, "state": state}, 1 if stats["state"] == state else 0)
+                for name, stats in breakers.items()
+                for state in ("closed", "open", "half_open")
+            ],
+        ),
+        metrics.render_gauge("triage_jobs_queued", "Async triage jobs waiting.", [({}, jobs_queued)]),
+        metrics.render_gauge(
+            "triage_deferred_descriptions_pending", "Deferred descriptions still being generated.",
+            [({}, pending_enrichments())],
+        ),
+    ]
+    return PlainTextResponse(metrics.render_metrics(gauges), media_type="text/plain; version=0.0.4; charset=utf-8")
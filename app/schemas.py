@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 
 class FailureInput(BaseModel):
@@ -16,6 +16,7 @@ class FailureInput(BaseModel):
     test_url: Optional[str] = None       # optional URL of the page being tested (e.g., "https://example.com/login")
     playwright_script_url: Optional[str] = None  # optional playwright script URL (e.g., "file:///C:/tests/login.spec.js#L25")
     playwright_script_endpoint: Optional[str] = None  # optional endpoint URL to retrieve/execute Playwright scripts (e.g., "http://playwright-service.com/api/scripts/login-test")
+    resolve_source_maps: Optional[bool] = False  # map transpiled stack frames back to the original source via the .map file next to them
 
 
 class TriageOutput(BaseModel):
@@ -29,12 +30,72 @@ class TriageOutput(BaseModel):
     test_url: Optional[str] = None  # Clickable URL of the page being tested (e.g., https://example.com/login)
     playwright_script_endpoint: Optional[str] = None  # Endpoint URL for external Playwright script service
     triage_label: Optional[str] = None  # Intelligent label for error categorization (e.g., "Assertion: Title Mismatch", "Timeout Error")
+    label_source: Optional[str] = None  # Where triage_label came from: local | bert | bert_circuit_open | bert_error | rules
+    failure_signature: Optional[str] = None  # Hash of the normalized error message + stack trace (same value = same failure)
+    test_name: Optional[str] = None  # Name of the failed test (from the request)
+    error_file: Optional[str] = None  # File the error was located in (e.g., "login.spec.js")
+    similar_result_id: Optional[str] = None  # Most similar previously stored result (near-duplicate failure), if any
+    similarity: Optional[float] = None  # Estimated similarity (0-1) to similar_result_id
+    description_status: Optional[str] = None  # mode=deferred only: pending (templated description) | ready | failed
+    cluster_id: Optional[str] = None  # Batch triage only: same value = same probable root cause (shared description)
     # Metadata fields (added when stored)
     id: Optional[str] = None
     created_at: Optional[str] = None
 
 
+class TriageDebugOutput(TriageOutput):
+    """Response model for POST /triage?debug=timings"""
+    debug: Dict[str, Any]  # Not stored: stage timings_ms, prompt token counts, model
+
+
 class TriageResultList(BaseModel):
     """Response model for listing multiple triage results"""
     total: int
     results: List[TriageOutput]
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to get the next page (None on the last page)
+
+
+class SimilarTriageResult(BaseModel):
+    """One near-duplicate of a stored result"""
+    similarity: float  # Estimated Jaccard similarity (0-1) of the error message + stack trace
+    result: TriageOutput
+
+
+class SimilarTriageResultList(BaseModel):
+    """Response model for GET /triage/{id}/similar"""
+    id: str
+    total: int
+    results: List[SimilarTriageResult]
+
+
+class BatchTriageItem(BaseModel):
+    """One entry of a batch triage response (same position as in the request)"""
+    index: int
+    result: Optional[TriageOutput] = None
+    error: Optional[str] = None
+
+
+class BatchTriageOutput(BaseModel):
+    """Response model for POST /triage/batch"""
+    total: int
+    succeeded: int
+    failed: int
+    clusters: int = 0  # Distinct root causes in the batch (= LLM descriptions generated)
+    results: List[BatchTriageItem]
+
+
+class TriageJobAccepted(BaseModel):
+    """Response model for POST /triage?mode=async (202 Accepted)"""
+    job_id: str
+    status: str
+    status_url: str
+
+
+class TriageJobStatus(BaseModel):
+    """Response model for GET /triage/jobs/{job_id}"""
+    job_id: str
+    status: str                          # queued | running | done | failed
+    result: Optional[TriageOutput] = None
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
@@ -0,0 +1,299 @@
+"""
+Circuit breakers for the slow dependencies (Ollama, BERT).
+
+Each breaker watches the outcome and duration of the calls made in a rolling
+time window. Once enough calls failed or were too slow, it opens: callers are
+rejected at once with CircuitOpenError (and fall back to heuristics) instead
+of each waiting out a timeout. After a cool-down it lets probe calls through
+(half-open) and closes again as soon as they succeed.
+
+Only the dependency's own faults count as failures: connection errors,
+timeouts and 5xx responses. A 4xx response (unknown model, invalid input) is
+the caller's fault and is passed through without a verdict, so a few bad
+requests cannot open the breaker for everyone.
+
+Usage, with the admission check ahead of the bulkhead so rejected calls never
+queue for a slot, and the guard inside it so only the dependency's own
+latency is measured:
+
+    breaker.check()
+    with bulkhead.slot(), breaker.guard():
+        ...call the dependency...
+"""
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from typing import Optional
+
+import httpx
+import requests
+
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# Rolling window the failure / slow-call rates are computed over
+BREAKER_WINDOW_SECONDS = 60.0
+# Calls needed in the window before the rates are trusted
+BREAKER_MIN_CALLS = 5
+BREAKER_FAILURE_RATE = 0.5
+BREAKER_SLOW_CALL_RATE = 0.8
+# How long an open breaker rejects calls before probing the dependency again
+BREAKER_OPEN_SECONDS = 30.0
+# Probe calls that must succeed (and be allowed concurrently) while half-open
+BREAKER_HALF_OPEN_PROBES = 1
+
+# Calls slower than this count against the dependency
+OLLAMA_SLOW_CALL_SECONDS = 180.0
+BERT_SLOW_CALL_SECONDS = 5.0
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a dependency whose circuit breaker is open.
+    """
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit breaker is open (retry in {retry_in:.0f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def is_dependency_failure(error: BaseException) -> bool:
+    """
+    Whether an exception raised by a dependency call counts against the
+    dependency: connection errors, timeouts and 5xx responses do; 4xx
+    responses and anything else do not.
+    """
+    if isinstance(error, (
+        requests.ConnectionError,
+        requests.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        httpx.TransportError,
+        ConnectionError,
+        TimeoutError,
+    )):
+        return True
+    # requests.HTTPError / httpx.HTTPStatusError from raise_for_status()
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status is not None and status >= 500
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker with a rolling failure-rate and slow-call-rate
+    window and half-open probing.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        slow_call_seconds: float,
+        window_seconds: float = BREAKER_WINDOW_SECONDS,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+        open_seconds: float = BREAKER_OPEN_SECONDS,
+        half_open_probes: int = BREAKER_HALF_OPEN_PROBES
+    ):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = max(1, half_open_probes)
+
+        self._lock = threading.Lock()
+        self._state = STATE_CLOSED
+        self._opened_at = 0.0
+        self._open_reason: Optional[str] = None
+        # (finished_at, failed, slow) of the calls in the window, with running counts
+        self._window: deque = deque()
+        self._failures = 0
+        self._slow = 0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _prune(self, now: float) -> None:
+        horizon = now - self.window_seconds
+        while self._window and self._window[0][0] < horizon:
+            _, failed, slow = self._window.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _open(self, now: float, reason: str) -> None:
+        self._state = STATE_OPEN
+        self._opened_at = now
+        self._open_reason = reason
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self.times_opened += 1
+        print(f"Circuit breaker '{self.name}' opened: {reason}")
+
+    def _close(self) -> None:
+        self._state = STATE_CLOSED
+        self._open_reason = None
+        self._window.clear()
+        self._failures = 0
+        self._slow = 0
+        print(f"Circuit breaker '{self.name}' closed")
+
+    def _reject_locked(self, now: float) -> Optional[CircuitOpenError]:
+        if self._state == STATE_OPEN:
+            if now - self._opened_at < self.open_seconds:
+                return CircuitOpenError(self.name, self.open_seconds - (now - self._opened_at))
+            self._state = STATE_HALF_OPEN
+        if self._state == STATE_HALF_OPEN and self._probes_in_flight >= self.half_open_probes:
+            return CircuitOpenError(self.name, 0.0)
+        return None
+
+    def check(self) -> None:
+        """
+        Raise CircuitOpenError if a call would be rejected right now.
+        """
+        with self._lock:
+            error = self._reject_locked(time.monotonic())
+            if error is not None:
+                self.rejected += 1
+                raise error
+
+    def _admit(self) -> bool:
+        with self._lock:
+            error = self._reject_locked(time.monotonic())
+            if error is not None:
+                self.rejected += 1
+                raise error
+            if self._state == STATE_HALF_OPEN:
+                self._probes_in_flight += 1
+                return True
+            return False
+
+    def _record(self, probe: bool, failed: bool, duration: float) -> None:
+        slow = duration >= self.slow_call_seconds
+        now = time.monotonic()
+        with self._lock:
+            if probe:
+                if self._state != STATE_HALF_OPEN:
+                    return
+                self._probes_in_flight -= 1
+                if failed or slow:
+                    self._open(now, "probe call " + ("failed" if failed else f"took {duration:.1f}s"))
+                else:
+                    self._probe_successes += 1
+                    if self._probe_successes >= self.half_open_probes:
+                        self._close()
+                return
+
+            self._window.append((now, failed, slow))
+            self._failures += failed
+            self._slow += slow
+            self._prune(now)
+            if self._state != STATE_CLOSED or len(self._window) < self.min_calls:
+                return
+            calls = len(self._window)
+            if self._failures / calls >= self.failure_rate:
+                self._open(now, f"{self._failures}/{calls} calls failed in the last {self.window_seconds:.0f}s")
+            elif self._slow / calls >= self.slow_call_rate:
+                self._open(
+                    now,
+                    f"{self._slow}/{calls} calls took over {self.slow_call_seconds:g}s "
+                    f"in the last {self.window_seconds:.0f}s"
+                )
+
+    def _abandon(self, probe: bool) -> None:
+        # No verdict on the call (cancellation, early close, a caller error)
+        if probe:
+            with self._lock:
+                if self._state == STATE_HALF_OPEN:
+                    self._probes_in_flight -= 1
+
+    def _record_error(self, probe: bool, error: Exception, duration: float) -> None:
+        if is_dependency_failure(error):
+            self._record(probe, True, duration)
+        else:
+            # The caller's fault (e.g. 4xx): says nothing about the dependency
+            self._abandon(probe)
+
+    @contextmanager
+    def guard(self):
+        """
+        Run the enclosed dependency call through the breaker: rejected with
+        CircuitOpenError while open, its outcome and duration recorded otherwise.
+        Exceptions count as failures when is_dependency_failure() says so and
+        are re-raised without a verdict otherwise.
+        """
+        probe = self._admit()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._record_error(probe, e, time.monotonic() - started)
+            raise
+        except BaseException:
+            self._abandon(probe)
+            raise
+        self._record(probe, False, time.monotonic() - started)
+
+    @asynccontextmanager
+    async def async_guard(self):
+        """
+        Async variant of guard() (also usable around an async generator's body).
+        """
+        probe = self._admit()
+        started = time.monotonic()
+        try:
+            yield
+        except Exception as e:
+            self._record_error(probe, e, time.monotonic() - started)
+            raise
+        except BaseException:
+            self._abandon(probe)
+            raise
+        self._record(probe, False, time.monotonic() - started)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._close()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            state = self._state
+            if state == STATE_OPEN and now - self._opened_at >= self.open_seconds:
+                # Next call will be let through as a probe
+                state = STATE_HALF_OPEN
+            calls = len(self._window)
+            return {
+                "state": state,
+                "open_reason": self._open_reason,
+                "retry_in_seconds": (
+                    round(self.open_seconds - (now - self._opened_at), 1) if state == STATE_OPEN else 0.0
+                ),
+                "window": {
+                    "seconds": self.window_seconds,
+                    "calls": calls,
+                    "failure_rate": round(self._failures / calls, 4) if calls else 0.0,
+                    "slow_call_rate": round(self._slow / calls, 4) if calls else 0.0,
+                },
+                "thresholds": {
+                    "min_calls": self.min_calls,
+                    "failure_rate": self.failure_rate,
+                    "slow_call_rate": self.slow_call_rate,
+                    "slow_call_seconds": self.slow_call_seconds,
+                    "open_seconds": self.open_seconds,
+                },
+                "times_opened": self.times_opened,
+                "rejected_calls": self.rejected,
+            }
+
+
+ollama_breaker = CircuitBreaker("ollama", OLLAMA_SLOW_CALL_SECONDS)
+bert_breaker = CircuitBreaker("bert", BERT_SLOW_CALL_SECONDS)
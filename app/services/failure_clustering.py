@@ -0,0 +1,112 @@
+"""
+Root-cause clustering of the failures of one batch (e.g. a CI build).
+
+One broken deploy typically fails hundreds of tests the same way. Failures are
+grouped by Playwright assertion type, normalized first error line and top
+stack frames (and the requested LLM model, since members share its output);
+batch triage then generates one LLM description per cluster and shares it with
+every member, so LLM cost follows the number of distinct root causes instead
+of the number of failing tests. The shared description was written from the
+cluster's first failure: every member's copy opens with a header naming the
+member's own test and error location (member_description()).
+
+Unlike the failure signature (whole error message + stack trace), the cluster
+key ignores everything below the top frames and every number in the error
+line, so e.g. the same locator timeout hit from different tests ends up in one
+cluster.
+"""
+import hashlib
+import re
+from typing import Dict, List, Optional
+
+from app.schemas import FailureInput
+from app.services.failure_signature import normalize_failure_text
+from app.services.playwright_label_detector import _detect_playwright_assertion_type
+from app.services.rule_engine import FeatureSet, extract_features
+
+
+# Stack frames (from the top) that take part in the cluster key
+CLUSTER_STACK_FRAMES = 3
+
+_NUMBER_RE = re.compile(r'\d+')
+
+
+def _first_error_line(error_message: Optional[str]) -> str:
+    for line in (error_message or "").splitlines():
+        normalized = normalize_failure_text(line)
+        if normalized:
+            return _NUMBER_RE.sub('<n>', normalized)
+    return ""
+
+
+def _top_frames(stack_trace: Optional[str]) -> List[str]:
+    frames = []
+    for line in (stack_trace or "").splitlines():
+        stripped = line.strip()
+        if not stripped.startswith("at "):
+            continue
+        # "at fn (/abs/path/file.ts:12:5)" -> "at fn (file.ts:<n>)"
+        frames.append(normalize_failure_text(stripped))
+        if len(frames) >= CLUSTER_STACK_FRAMES:
+            break
+    return frames
+
+
+def compute_cluster_id(payload: FailureInput, features: Optional[FeatureSet] = None) -> str:
+    """
+    Cluster key of a failure (same value = same probable root cause).
+
+    Args:
+        payload: Failure to cluster
+        features: The failure's FeatureSet, if already built
+
+    Returns:
+        16-character hex digest
+    """
+    if features is None:
+        features = extract_features(error_message=payload.error_message, stack_trace=payload.stack_trace)
+    parts = [
+        payload.llm_model or "",
+        _detect_playwright_assertion_type(payload.error_message, features) or "",
+        _first_error_line(payload.error_message),
+        *_top_frames(payload.stack_trace),
+    ]
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
+def member_description(
+    shared_description: str,
+    test_name: Optional[str],
+    error_file: Optional[str],
+    error_line: Optional[int],
+    representative_test: Optional[str] = None
+) -> str:
+    """
+    Description of one cluster member: a header with the member's own test
+    and error location, then the description shared by the cluster.
+
+    Args:
+        shared_description: Description generated for the cluster
+        test_name / error_file / error_line: The member's own fields
+        representative_test: Test the shared description was generated from
+    """
+    lines = [f"Test: {test_name or 'unknown'}"]
+    if error_file:
+        lines.append(f"Error location: {error_file}" + (f":{error_line}" if error_line else ""))
+    if representative_test and representative_test != test_name:
+        lines.append(f"Root cause shared with other failures; description written for: {representative_test}")
+    return "\n".join(lines) + "\n\n" + shared_description
+
+
+def cluster_failures(payloads: List[FailureInput]) -> Dict[str, List[int]]:
+    """
+    Group failures by cluster key.
+
+    Returns:
+        Cluster id -> indexes of its members in payloads, in input order
+        (clusters in order of their first member)
+    """
+    clusters: Dict[str, List[int]] = {}
+    for index, payload in enumerate(payloads):
+        clusters.setdefault(compute_cluster_id(payload), []).append(index)
+    return clusters
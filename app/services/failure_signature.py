@@ -0,0 +1,159 @@
+"""
+Failure signatures and the LLM description cache.
+
+A signature is a hash of the error message and stack trace after removing the
+parts that change between runs of the same failure (timestamps, durations,
+line/column numbers, absolute paths, ANSI colour codes). Failures with the same
+signature reuse one generated title and description.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+
+# Maximum number of distinct signatures kept in the description cache
+DESCRIPTION_CACHE_SIZE = 2048
+
+_ANSI_RE = re.compile(r'\x1b\[[0-9;?]*[A-Za-z]')
+_TIMESTAMP_RE = re.compile(
+    r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?'
+)
+_CLOCK_RE = re.compile(r'\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b')
+_DURATION_RE = re.compile(
+    r'\b\d+(?:\.\d+)?\s*(?:ms|milliseconds?|s|secs?|seconds?|m|mins?|minutes?)\b',
+    re.IGNORECASE
+)
+_LINE_COL_RE = re.compile(r':\d+(?::\d+)?\b')
+_LINE_WORD_RE = re.compile(r'\b(line|column|col)\s+\d+', re.IGNORECASE)
+_FILE_URL_RE = re.compile(r'file:///?')
+# Absolute POSIX or Windows path prefixes: keep only the last path segment
+_ABS_PATH_RE = re.compile(r'(?:[A-Za-z]:)?[\\/](?:[^\s\\/:()\'"<>]+[\\/])+')
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_failure_text(text: Optional[str]) -> str:
+    """
+    Strip run-specific noise from an error message or stack trace.
+
+    Args:
+        text: Raw error message or stack trace
+
+    Returns:
+        Normalized text, stable across runs of the same failure
+    """
+    if not text:
+        return ""
+
+    text = _ANSI_RE.sub('', text)
+    text = _TIMESTAMP_RE.sub('<ts>', text)
+    text = _CLOCK_RE.sub('<ts>', text)
+    text = _DURATION_RE.sub('<dur>', text)
+    text = _FILE_URL_RE.sub('', text)
+    text = _ABS_PATH_RE.sub('', text)
+    text = _LINE_COL_RE.sub(':<n>', text)
+    text = _LINE_WORD_RE.sub(r'\1 <n>', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+_ERROR_MESSAGE_RE = re.compile(r'^Error Message: (.*?)\nStack Trace: ', re.MULTILINE | re.DOTALL)
+
+
+def extract_error_message(failure_text: Optional[str]) -> Optional[str]:
+    """
+    Error message of a stored result, from its raw failure text
+    ("Error Message: ..." up to the "Stack Trace:" line, so it may span lines).
+    """
+    match = _ERROR_MESSAGE_RE.search(failure_text or "")
+    return match.group(1) if match else None
+
+
+def compute_failure_signature(error_message: Optional[str], stack_trace: Optional[str]) -> str:
+    """
+    Hash the normalized error message and stack trace into a failure signature.
+
+    Returns:
+        32-character hex digest
+    """
+    normalized = f"{normalize_failure_text(error_message)}\n{normalize_failure_text(stack_trace)}"
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:32]
+
+
+class DescriptionCache:
+    """
+    Thread-safe LRU cache of generated bug reports keyed by model + signature,
+    with per-signature hit counts.
+    """
+
+    def __init__(self, max_entries: int = DESCRIPTION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _key(model_name: str, signature: str) -> str:
+        return f"{model_name}:{signature}"
+
+    def get(self, model_name: str, signature: str) -> Optional[dict]:
+        """
+        Return a copy of the cached report ({"title", "description"}) or None.
+        """
+        key = self._key(model_name, signature)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry["hits"] += 1
+            self.hits += 1
+            return {"title": entry["title"], "description": entry["description"]}
+
+    def put(self, model_name: str, signature: str, report: dict) -> None:
+        key = self._key(model_name, signature)
+        with self._lock:
+            existing = self._entries.get(key)
+            self._entries[key] = {
+                "title": report.get("title", ""),
+                "description": report.get("description", ""),
+                "hits": existing["hits"] if existing else 0,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self, top: int = 10) -> dict:
+        """
+        Cache statistics, including the most frequently reused signatures.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            top_entries: List[Dict[str, object]] = sorted(
+                (
+                    {"key": key, "hits": entry["hits"], "title": entry["title"]}
+                    for key, entry in self._entries.items()
+                ),
+                key=lambda e: e["hits"],
+                reverse=True,
+            )[:top]
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "evictions": self.evictions,
+                "top_signatures": top_entries,
+            }
+
+
+description_cache = DescriptionCache()
@@ -0,0 +1,75 @@
+"""
+Shared HTTP clients for the Ollama and BERT dependencies.
+Connections are kept alive and reused instead of opening a new one per call.
+"""
+import asyncio
+import threading
+from typing import Optional
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+
+# Connection pool sizing (per host)
+POOL_MAX_CONNECTIONS = 64
+POOL_MAX_KEEPALIVE = 32
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+_async_client: Optional[httpx.AsyncClient] = None
+_async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_session() -> requests.Session:
+    """
+    Return the process-wide keep-alive session used by the synchronous code paths.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=POOL_MAX_KEEPALIVE,
+                    pool_maxsize=POOL_MAX_CONNECTIONS,
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                _session = session
+    return _session
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    Return the keep-alive async client bound to the running event loop.
+    A new client is created if the loop changed (e.g. after a reload).
+    """
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client is None or _async_client.is_closed or _async_client_loop is not loop:
+        _async_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=POOL_MAX_KEEPALIVE,
+            ),
+        )
+        _async_client_loop = loop
+    return _async_client
+
+
+async def aclose_clients() -> None:
+    """
+    Close the shared clients (called on application shutdown).
+    """
+    global _async_client, _async_client_loop, _session
+    if _async_client is not None and _async_client_loop is asyncio.get_running_loop():
+        await _async_client.aclose()
+    _async_client = None
+    _async_client_loop = None
+
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
@@ -0,0 +1,268 @@
+"""
+Durable background job queue for asynchronous triage requests.
+
+Jobs are persisted in a local SQLite file, so queued (and interrupted running)
+jobs survive a restart of the triage engine. A small pool of worker threads
+drains the queue through process_failure and stores every result.
+
+Several worker processes (uvicorn --workers) can share the queue. A running
+job is leased to the process that claimed it, which renews the lease with a
+heartbeat while it works; a job is only taken over by another worker once its
+lease has expired, i.e. its process stopped or died.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import List, Optional
+
+from app.schemas import FailureInput
+from app.services import storage_service
+from app.services.scheduler import PRIORITY_BACKGROUND, set_thread_priority
+from app.services.triage_service import process_failure
+from app.utils.sqlite_utils import get_thread_connection
+
+
+JOB_DB_PATH = os.environ.get(
+    "TRIAGE_JOB_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "triage_jobs.db"),
+)
+JOB_WORKERS = 4
+# How long an idle worker sleeps before checking the database again
+# (new jobs from this process wake workers immediately)
+JOB_POLL_INTERVAL = 1.0
+# Seconds a claimed job stays leased to its process without a heartbeat
+JOB_LEASE_SECONDS = 60.0
+JOB_HEARTBEAT_INTERVAL = JOB_LEASE_SECONDS / 4
+
+# Lease owner of the jobs claimed by this process
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+_wakeup = threading.Event()
+_stop = threading.Event()
+_workers: List[threading.Thread] = []
+_heartbeat: Optional[threading.Thread] = None
+
+
+def _connect() -> sqlite3.Connection:
+    return get_thread_connection(JOB_DB_PATH)
+
+
+def init_queue() -> None:
+    """
+    Create the jobs table (adding the lease columns to older databases).
+
+    Jobs left running by a stopped process are not requeued here: they are
+    claimed again once their lease expires, so the jobs of other live
+    worker processes are left alone.
+    """
+    conn = _connect()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS triage_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            lease_owner TEXT,
+            lease_expires_at REAL
+        )
+        """
+    )
+    columns = {row["name"] for row in conn.execute("PRAGMA table_info(triage_jobs)")}
+    for column, column_type in (("lease_owner", "TEXT"), ("lease_expires_at", "REAL")):
+        if column not in columns:
+            try:
+                conn.execute(f"ALTER TABLE triage_jobs ADD COLUMN {column} {column_type}")
+            except sqlite3.OperationalError as e:
+                # Another worker process added it first
+                if "duplicate column" not in str(e):
+                    raise
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_triage_jobs_status ON triage_jobs (status, created_at)"
+    )
+
+
+def enqueue_job(payload: FailureInput) -> str:
+    """
+    Persist a new triage job and wake a worker.
+
+    Returns:
+        The unique job ID
+    """
+    job_id = str(uuid.uuid4())
+    now = datetime.now().isoformat()
+    _connect().execute(
+        "INSERT INTO triage_jobs (id, status, payload, created_at, updated_at) VALUES (?, 'queued', ?, ?, ?)",
+        (job_id, payload.model_dump_json(), now, now)
+    )
+    _wakeup.set()
+    return job_id
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    """
+    Retrieve a job's state.
+
+    Returns:
+        Dict with job_id, status, created_at, updated_at, result and error; None if unknown
+    """
+    row = _connect().execute(
+        "SELECT id, status, result, error, created_at, updated_at FROM triage_jobs WHERE id = ?",
+        (job_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    return {
+        "job_id": row["id"],
+        "status": row["status"],
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def get_queue_depth() -> int:
+    row = _connect().execute(
+        "SELECT COUNT(*) FROM triage_jobs WHERE status = 'queued'"
+    ).fetchone()
+    return row[0]
+
+
+def _claim_next_job() -> Optional[sqlite3.Row]:
+    """
+    Atomically lease the oldest queued job (or running job whose lease
+    expired) to this process, move it to 'running' and return it.
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        now = time.time()
+        # A NULL lease is a job left running before leases existed
+        row = conn.execute(
+            """
+            SELECT id, payload FROM triage_jobs
+            WHERE status = 'queued'
+               OR (status = 'running' AND (lease_expires_at IS NULL OR lease_expires_at < ?))
+            ORDER BY created_at LIMIT 1
+            """,
+            (now,)
+        ).fetchone()
+        if row is not None:
+            conn.execute(
+                """
+                UPDATE triage_jobs SET status = 'running', lease_owner = ?, lease_expires_at = ?, updated_at = ?
+                WHERE id = ?
+                """,
+                (WORKER_ID, now + JOB_LEASE_SECONDS, datetime.now().isoformat(), row["id"])
+            )
+        conn.execute("COMMIT")
+        return row
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def _renew_leases() -> None:
+    """
+    Extend the leases of the jobs this process is running.
+    """
+    _connect().execute(
+        "UPDATE triage_jobs SET lease_expires_at = ? WHERE status = 'running' AND lease_owner = ?",
+        (time.time() + JOB_LEASE_SECONDS, WORKER_ID)
+    )
+
+
+def _finish_job(job_id: str, status: str, result: Optional[dict] = None, error: Optional[str] = None) -> None:
+    # Only while this process still holds the lease (it may have been taken over after a stall)
+    cursor = _connect().execute(
+        """
+        UPDATE triage_jobs SET status = ?, result = ?, error = ?, lease_owner = NULL, lease_expires_at = NULL,
+            updated_at = ?
+        WHERE id = ? AND lease_owner = ?
+        """,
+        (
+            status, json.dumps(result) if result is not None else None, error, datetime.now().isoformat(),
+            job_id, WORKER_ID,
+        )
+    )
+    if cursor.rowcount == 0:
+        print(f"Triage job {job_id} finished after its lease was taken over: outcome dropped")
+
+
+def _run_job(row: sqlite3.Row) -> None:
+    try:
+        payload = FailureInput.model_validate_json(row["payload"])
+        result = process_failure(payload)
+        result_id = storage_service.store_result(result)
+        _finish_job(row["id"], "done", result=storage_service.get_result(result_id) or {**result, "id": result_id})
+    except Exception as e:
+        _finish_job(row["id"], "failed", error=f"Error while processing triage job: {str(e)}")
+
+
+def _worker_loop() -> None:
+    # Queued jobs yield the LLM to interactive requests
+    set_thread_priority(PRIORITY_BACKGROUND)
+    while not _stop.is_set():
+        _wakeup.clear()
+        try:
+            row = _claim_next_job()
+        except sqlite3.OperationalError as e:
+            # Database busy/locked by another process: retry after a pause
+            print(f"Triage job queue unavailable: {e}")
+            row = None
+
+        if row is None:
+            _wakeup.wait(JOB_POLL_INTERVAL)
+            continue
+
+        _run_job(row)
+
+
+def _heartbeat_loop() -> None:
+    while not _stop.wait(JOB_HEARTBEAT_INTERVAL):
+        try:
+            _renew_leases()
+        except sqlite3.OperationalError as e:
+            print(f"Triage job lease renewal failed: {e}")
+
+
+def start_workers(count: int = JOB_WORKERS) -> None:
+    """
+    Initialize the queue and start the background worker threads and the
+    lease heartbeat.
+    """
+    global _heartbeat
+    init_queue()
+    _stop.clear()
+    for i in range(count):
+        worker = threading.Thread(target=_worker_loop, name=f"triage-job-{i}", daemon=True)
+        worker.start()
+        _workers.append(worker)
+    _heartbeat = threading.Thread(target=_heartbeat_loop, name="triage-job-heartbeat", daemon=True)
+    _heartbeat.start()
+
+
+def stop_workers(timeout: float = 5.0) -> None:
+    """
+    Signal the workers to stop after their current job.
+    Jobs still running at exit are claimed again (by any worker process) once
+    their lease expires.
+    """
+    global _heartbeat
+    _stop.set()
+    _wakeup.set()
+    for worker in _workers:
+        worker.join(timeout)
+    _workers.clear()
+    if _heartbeat is not None:
+        _heartbeat.join(timeout)
+        _heartbeat = None
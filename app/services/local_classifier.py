@@ -0,0 +1,266 @@
+"""
+In-process triage label classifier trained on the stored triage history.
+
+Texts are turned into hashed unigram/bigram features (a hashing vectorizer:
+no vocabulary to keep in sync) and classified with a multinomial Naive Bayes
+model, whose counts are updated incrementally every time a result is stored.
+The label detector asks this model first and only calls the remote BERT
+server when the local answer is not confident enough, so most label decisions
+never leave the process.
+
+Only results labelled by BERT (label_source "bert") are learned: learning the
+model's own predictions, or the first-candidate fallback used when BERT is
+down, would feed its guesses back into it until they pass the threshold.
+
+Deleted or evicted results are not unlearned: retention bounds the result
+store, while the model keeps summarizing everything it has seen.
+"""
+import math
+import os
+import re
+import threading
+import time
+import zlib
+from collections import Counter, OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.services import storage_service
+from app.services.failure_signature import extract_error_message
+
+
+LOCAL_CLASSIFIER_ENABLED = os.environ.get("TRIAGE_LOCAL_CLASSIFIER", "1").lower() not in ("0", "false", "no")
+# Minimum probability of the best candidate for the local label to be used
+LOCAL_CLASSIFIER_THRESHOLD = float(os.environ.get("TRIAGE_LOCAL_CLASSIFIER_THRESHOLD", "0.9"))
+# Results the model must have learned from before it answers at all
+LOCAL_CLASSIFIER_MIN_RESULTS = int(os.environ.get("TRIAGE_LOCAL_CLASSIFIER_MIN_RESULTS", "50"))
+
+HASH_FEATURES = 1 << 18
+SMOOTHING = 1.0
+# Characters of the stack trace used for classification (same as sent to BERT)
+STACK_TRACE_CHARS = 500
+BOOTSTRAP_PAGE_SIZE = 1000
+# Label sources whose results are learned
+LEARNED_LABEL_SOURCES = ("bert",)
+# Recently learned result ids remembered so a result is not learned twice
+# (history scan and store listener overlap while the model bootstraps)
+LEARNED_IDS_MAX = 10000
+
+_TOKEN_RE = re.compile(r'[a-z_][a-z0-9_]*')
+
+
+def classification_text(error_message: str, stack_trace: Optional[str]) -> str:
+    """
+    Text a failure is classified on, locally and by the BERT server.
+    """
+    return f"{error_message}\n{(stack_trace or '')[:STACK_TRACE_CHARS]}"
+
+
+def _record_text(record: dict) -> Optional[str]:
+    error_message = extract_error_message(record.get("raw_failure_text"))
+    if error_message is None:
+        return None
+    return classification_text(error_message, record.get("stack_trace"))
+
+
+def hash_features(text: str) -> Counter:
+    """
+    Hashed unigram + bigram counts of a text (numbers and punctuation dropped).
+    """
+    tokens = _TOKEN_RE.findall(text.lower())
+    grams = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    return Counter(zlib.crc32(gram.encode("utf-8")) & (HASH_FEATURES - 1) for gram in grams)
+
+
+class NaiveBayesClassifier:
+    """
+    Thread-safe incremental multinomial Naive Bayes over hashed features.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._docs: Dict[str, int] = {}
+        self._tokens: Dict[str, int] = {}
+        self._counts: Dict[str, Dict[int, int]] = {}
+        self.trained = 0
+
+    def learn(self, text: str, label: str) -> None:
+        features = hash_features(text)
+        with self._lock:
+            counts = self._counts.setdefault(label, {})
+            for feature, count in features.items():
+                counts[feature] = counts.get(feature, 0) + count
+            self._docs[label] = self._docs.get(label, 0) + 1
+            self._tokens[label] = self._tokens.get(label, 0) + sum(features.values())
+            self.trained += 1
+
+    def probabilities(self, text: str, labels: List[str]) -> Dict[str, float]:
+        """
+        Posterior probability of each of the given labels (labels never seen in
+        training only get the smoothed prior).
+        """
+        features = hash_features(text)
+        with self._lock:
+            total_docs = self.trained
+            scores = {}
+            for label in labels:
+                docs = self._docs.get(label, 0)
+                counts = self._counts.get(label, {})
+                denominator = math.log(self._tokens.get(label, 0) + SMOOTHING * HASH_FEATURES)
+                score = math.log((docs + SMOOTHING) / (total_docs + SMOOTHING * len(labels)))
+                for feature, count in features.items():
+                    score += count * (math.log(counts.get(feature, 0) + SMOOTHING) - denominator)
+                scores[label] = score
+
+        top = max(scores.values())
+        weights = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(weights.values())
+        return {label: weight / total for label, weight in weights.items()}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "trained": self.trained,
+                "labels": dict(sorted(self._docs.items(), key=lambda item: item[1], reverse=True)),
+            }
+
+
+class LocalLabelClassifier:
+    """
+    The triage label model fed by the result store: learns every stored result
+    labelled by BERT and answers only when it is confident.
+    """
+
+    def __init__(
+        self,
+        threshold: float = LOCAL_CLASSIFIER_THRESHOLD,
+        min_results: int = LOCAL_CLASSIFIER_MIN_RESULTS,
+        enabled: bool = LOCAL_CLASSIFIER_ENABLED
+    ):
+        self.threshold = threshold
+        self.min_results = min_results
+        self.enabled = enabled
+        self.model = NaiveBayesClassifier()
+        self._stats_lock = threading.Lock()
+        self.predictions = 0
+        self.confident = 0
+        self._predict_seconds = 0.0
+        self._learned_ids: "OrderedDict[str, None]" = OrderedDict()
+
+    def learn_record(self, record: dict) -> bool:
+        """
+        Learn a stored result, unless it was not labelled by BERT or was
+        learned already.
+
+        Returns:
+            True if the model learned from it
+        """
+        label = record.get("triage_label")
+        if not label or record.get("label_source") not in LEARNED_LABEL_SOURCES:
+            return False
+        text = _record_text(record)
+        if text is None:
+            return False
+        result_id = record.get("id")
+        if result_id is not None:
+            with self._stats_lock:
+                if result_id in self._learned_ids:
+                    return False
+                self._learned_ids[result_id] = None
+                if len(self._learned_ids) > LEARNED_IDS_MAX:
+                    self._learned_ids.popitem(last=False)
+        self.model.learn(text, label)
+        return True
+
+    def on_storage_event(self, event: str, result_id: str, record: Optional[dict]) -> None:
+        if event == "stored" and record is not None:
+            self.learn_record(record)
+
+    def predict(self, text: str, candidate_labels: List[str]) -> Optional[str]:
+        """
+        Best candidate label if the model is trained and confident enough,
+        None otherwise (the caller then asks BERT).
+        """
+        if not self.enabled or not candidate_labels:
+            return None
+        started = time.perf_counter()
+        label = None
+        confident = False
+        if self.model.trained >= self.min_results:
+            probabilities = self.model.probabilities(text, list(dict.fromkeys(candidate_labels)))
+            # max() keeps the first candidate on ties, like the detector's own fallback
+            label = max(probabilities, key=probabilities.get)
+            confident = probabilities[label] >= self.threshold
+        with self._stats_lock:
+            self.predictions += 1
+            self.confident += confident
+            self._predict_seconds += time.perf_counter() - started
+        return label if confident else None
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            predictions, confident, seconds = self.predictions, self.confident, self._predict_seconds
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "min_results": self.min_results,
+            "predictions": predictions,
+            "answered_locally": confident,
+            "sent_to_bert": predictions - confident,
+            "local_ratio": round(confident / predictions, 4) if predictions else 0.0,
+            "avg_predict_us": round(seconds / predictions * 1e6, 1) if predictions else 0.0,
+            **self.model.stats(),
+        }
+
+
+local_classifier = LocalLabelClassifier()
+
+_bootstrap: Optional[threading.Thread] = None
+_stopped = threading.Event()
+
+
+def _learn_history(**filters: Optional[str]) -> int:
+    learned = 0
+    cursor = None
+    while True:
+        results, cursor, _ = storage_service.query_results(limit=BOOTSTRAP_PAGE_SIZE, cursor=cursor, **filters)
+        learned += sum(local_classifier.learn_record(result) for result in results)
+        if cursor is None:
+            return learned
+
+
+def _bootstrap_from_history() -> None:
+    learned = 0
+    started = datetime.now().isoformat()
+    try:
+        learned += _learn_history()
+    except Exception as e:
+        print(f"Local classifier bootstrap stopped: {e}")
+    # Follow new results from now on, then catch up with the ones stored during
+    # the scan (newest first, so it missed them); learn_record() skips repeats
+    if _stopped.is_set():
+        return
+    storage_service.add_listener(local_classifier.on_storage_event)
+    try:
+        learned += _learn_history(created_after=started)
+    except Exception as e:
+        print(f"Local classifier catch-up stopped: {e}")
+    print(f"Local classifier learned {learned} stored triage result(s)")
+
+
+def start_local_classifier() -> None:
+    """
+    Learn the existing history in the background, then follow newly stored results.
+    """
+    global _bootstrap
+    if not local_classifier.enabled:
+        return
+    _stopped.clear()
+    if _bootstrap is None or not _bootstrap.is_alive():
+        _bootstrap = threading.Thread(target=_bootstrap_from_history, name="triage-classifier-bootstrap", daemon=True)
+        _bootstrap.start()
+
+
+def stop_local_classifier() -> None:
+    _stopped.set()
+    storage_service.remove_listener(local_classifier.on_storage_event)
@@ -0,0 +1,299 @@
+"""
+Prometheus metrics in the text exposition format (version 0.0.4), without a
+client library: counters and histograms are registered here and rendered by
+GET /metrics (app/main.py), together with gauges read from the services'
+own stats at scrape time.
+
+Triage stages are timed with stage_timer() / timed_stage(), so every stage
+shows up in one histogram, triage_stage_seconds{stage=...}. Inside
+collect_timings() (one API request), the same timers also add up the stage
+durations of that request, for its Server-Timing header and debug payload.
+"""
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Dict, Iterable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# Seconds; triage stages range from microseconds (features) to minutes (LLM)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _label_values(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"Metric {self.name} takes labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter, optionally split by labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help_text, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._label_values(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(list(zip(self.labelnames, key)))} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Histogram(_Metric):
+    """
+    Cumulative-bucket histogram, optionally split by labels.
+    """
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [per-bucket counts (+Inf last), sum]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._label_values(labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = sorted((key, list(counts), total) for key, (counts, total) in self._series.items())
+        lines = []
+        for key, counts, total in series:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = _format_labels(labels + [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+def render_gauge(name: str, help_text: str, samples: Iterable[Tuple[Dict[str, str], float]]) -> str:
+    """
+    Render a gauge whose values are read at scrape time.
+
+    Args:
+        samples: (labels, value) pairs
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+    for labels, value in samples:
+        lines.append(f"{name}{_format_labels(sorted(labels.items()))} {_format_value(value)}")
+    return "\n".join(lines)
+
+
+def render_metrics(extra: Iterable[str] = ()) -> str:
+    """
+    All registered metrics, then the extra (scrape-time) blocks.
+    """
+    blocks = [metric.render() for metric in _registry]
+    blocks.extend(extra)
+    return "\n".join(blocks) + "\n"
+
+
+# ---- Triage metrics ----
+
+STAGE_SECONDS = Histogram(
+    "triage_stage_seconds",
+    "Time spent in each triage stage (features, description with its prompt / ollama / sanitize steps, "
+    "extraction, label, similarity, storage).",
+    ["stage"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "triage_http_request_seconds",
+    "HTTP request latency by route, method and status code.",
+    ["route", "method", "status"],
+)
+RESULTS_STORED = Counter(
+    "triage_results_stored_total",
+    "Triage results stored, by triage label.",
+    ["triage_label"],
+)
+LABEL_SOURCE = Counter(
+    "triage_label_source_total",
+    "Label decisions by source: local model, BERT, or a fallback (bert_circuit_open, bert_error, rules).",
+    ["source"],
+)
+
+PROMPT_TOKENS_SAVED = Counter(
+    "triage_prompt_tokens_saved_total",
+    "Estimated prompt tokens removed by failure text compaction before prompting Ollama.",
+)
+OLLAMA_TOKENS = Counter(
+    "ollama_tokens_total",
+    "Tokens processed by Ollama (kind: prompt or generated), from the response eval counts.",
+    ["kind"],
+)
+OLLAMA_SECONDS = Histogram(
+    "ollama_phase_seconds",
+    "Ollama time per call by phase (load, prompt_eval, eval), from the response durations.",
+    ["phase"],
+)
+OLLAMA_TOKENS_PER_SECOND = Histogram(
+    "ollama_generation_tokens_per_second",
+    "Ollama generation speed per call (eval_count / eval_duration).",
+    buckets=(1, 2, 5, 10, 15, 20, 30, 50, 75, 100, 150, 250),
+)
+
+
+class RequestTimings:
+    """
+    Stage durations (summed per stage) and details of one request.
+
+    Stages can nest (ollama is part of description) and run concurrently
+    (label and description), so they do not add up to the total.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages: Dict[str, float] = {}
+        self.details: Dict[str, Any] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def note(self, key: str, value: Any) -> None:
+        with self._lock:
+            self.details[key] = value
+
+    def timings_ms(self) -> Dict[str, float]:
+        with self._lock:
+            timings = {stage: round(seconds * 1000, 1) for stage, seconds in self.stages.items()}
+        timings["total"] = round((time.perf_counter() - self.started) * 1000, 1)
+        return timings
+
+    def server_timing(self) -> str:
+        """
+        Server-Timing header value, e.g. "features;dur=0.4, ollama;dur=41250.3, total;dur=41302.8".
+        """
+        return ", ".join(f"{stage};dur={ms}" for stage, ms in self.timings_ms().items())
+
+
+_request_timings: contextvars.ContextVar[Optional[RequestTimings]] = contextvars.ContextVar(
+    "triage_request_timings", default=None
+)
+
+
+@contextmanager
+def collect_timings():
+    """
+    Collect the stage timings of the enclosed code (and the tasks / threads it
+    starts) into a new RequestTimings.
+    """
+    timings = RequestTimings()
+    token = _request_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _request_timings.reset(token)
+
+
+def note_detail(key: str, value: Any) -> None:
+    """
+    Attach a detail (e.g. the prompt token count) to the current request's timings, if collected.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        timings.note(key, value)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    Time the enclosed block as a triage stage (also when it raises).
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(stage, elapsed)
+
+
+async def timed_stage(stage: str, awaitable: Awaitable[T]) -> T:
+    """
+    Await something, timed as a triage stage (for stages run as tasks).
+    """
+    with stage_timer(stage):
+        return await awaitable
+
+
+def on_storage_event(event: str, result_id: str, record: Optional[dict]) -> None:
+    if event == "stored" and record is not None:
+        RESULTS_STORED.inc(triage_label=record.get("triage_label") or "none")
@@ -1,37 +1,121 @@
-import requests
+import json
 import re
+from typing import AsyncIterator, Optional
+
+import httpx
+
+from app.services.circuit_breaker import CircuitOpenError, ollama_breaker
+from app.services.failure_signature import description_cache, extract_error_message
+from app.services.http_clients import get_session, get_async_client
+from app.services.metrics import (
+    OLLAMA_SECONDS,
+    OLLAMA_TOKENS,
+    OLLAMA_TOKENS_PER_SECOND,
+    note_detail,
+    stage_timer,
+)
+from app.services.prompt_compaction import compact_failure_text, estimate_tokens
+from app.services.rule_engine import FeatureSet, extract_features
+from app.services.scheduler import ollama_bulkhead
+from app.services.single_flight import ollama_flight, hash_key
 
 OLLAMA_API_URL = "http://localhost:11434/api/generate"
+OLLAMA_TIMEOUT = 600
+# An unreachable Ollama host fails fast instead of waiting out OLLAMA_TIMEOUT
+OLLAMA_CONNECT_TIMEOUT = 5
 
 
-def _call_ollama(model_name: str, prompt: str, num_predict: int = 800) -> str:
-    """
-    Low-level helper to call Ollama and return the raw `response` text.
-    """
-    payload = {
+def _ollama_payload(model_name: str, prompt: str, num_predict: int, stream: bool = False) -> dict:
+    return {
         "model": model_name,
         "prompt": prompt,
-        "stream": False,
+        "stream": stream,
         "num_predict": num_predict,
         "temperature": 0.7,
         "top_p": 0.9,
         "top_k": 40,
     }
 
-    resp = requests.post(OLLAMA_API_URL, json=payload, timeout=600)
-    resp.raise_for_status()
+
+def _record_generation_metrics(data: dict) -> None:
+    """
+    Token counts and phase durations of a finished generation (Ollama reports
+    durations in nanoseconds; fields are missing e.g. on a prompt cache hit).
+    """
+    for field, kind in (("prompt_eval_count", "prompt"), ("eval_count", "generated")):
+        if data.get(field):
+            OLLAMA_TOKENS.inc(data[field], kind=kind)
+            note_detail(f"{kind}_tokens", data[field])
+    for field, phase in (
+        ("load_duration", "load"),
+        ("prompt_eval_duration", "prompt_eval"),
+        ("eval_duration", "eval"),
+    ):
+        if data.get(field):
+            OLLAMA_SECONDS.observe(data[field] / 1e9, phase=phase)
+    if data.get("eval_count") and data.get("eval_duration"):
+        OLLAMA_TOKENS_PER_SECOND.observe(data["eval_count"] / (data["eval_duration"] / 1e9))
+
+
+def _async_timeout() -> httpx.Timeout:
+    return httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT)
+
+
+def _call_ollama(model_name: str, prompt: str, num_predict: int = 800) -> str:
+    """
+    Low-level helper to call Ollama and return the raw `response` text.
+    """
+    payload = _ollama_payload(model_name, prompt, num_predict)
+
+    ollama_breaker.check()
+    with ollama_bulkhead.slot(), ollama_breaker.guard():
+        resp = get_session().post(
+            OLLAMA_API_URL, json=payload, timeout=(OLLAMA_CONNECT_TIMEOUT, OLLAMA_TIMEOUT)
+        )
+        resp.raise_for_status()
     data = resp.json()
+    _record_generation_metrics(data)
     return data.get("response", "").strip()
 
 
-def _extract_error_message(failure_text: str) -> str:
+async def _call_ollama_async(model_name: str, prompt: str, num_predict: int = 800) -> str:
     """
-    Pull the 'Error Message:' line out of the combined failure_text.
+    Async variant of _call_ollama using the shared keep-alive client.
     """
-    for line in failure_text.splitlines():
-        if line.startswith("Error Message:"):
-            return line.split("Error Message:", 1)[1].strip()
-    return ""
+    payload = _ollama_payload(model_name, prompt, num_predict)
+
+    ollama_breaker.check()
+    async with ollama_bulkhead.async_slot(), ollama_breaker.async_guard():
+        resp = await get_async_client().post(OLLAMA_API_URL, json=payload, timeout=_async_timeout())
+        resp.raise_for_status()
+    data = resp.json()
+    _record_generation_metrics(data)
+    return data.get("response", "").strip()
+
+
+async def _stream_ollama_async(model_name: str, prompt: str, num_predict: int = 800) -> AsyncIterator[str]:
+    """
+    Call Ollama with streaming enabled and yield response tokens as they are generated.
+    """
+    payload = _ollama_payload(model_name, prompt, num_predict, stream=True)
+
+    ollama_breaker.check()
+    async with ollama_bulkhead.async_slot(), ollama_breaker.async_guard():
+        async with get_async_client().stream("POST", OLLAMA_API_URL, json=payload, timeout=_async_timeout()) as resp:
+            resp.raise_for_status()
+            # Ollama streams one JSON object per line
+            async for line in resp.aiter_lines():
+                if not line.strip():
+                    continue
+                data = json.loads(line)
+                if data.get("error"):
+                    raise RuntimeError(data["error"])
+                token = data.get("response", "")
+                if token:
+                    yield token
+                if data.get("done"):
+                    _record_generation_metrics(data)
+                    break
 
 
 def _extract_test_name(failure_text: str) -> str:
@@ -52,94 +136,34 @@ def _css_id_to_words(selector: str) -> str:
     return selector.capitalize()
 
 
-def _heuristic_bug_title(failure_text: str) -> str:
+def _heuristic_bug_title(failure_text: str, features: Optional[FeatureSet] = None) -> str:
     """
     Generate a human-friendly bug title using simple rules,
     instead of trusting the LLM (which keeps copying full error_message).
+
+    The keyword rules (Playwright assertions first, then generic error
+    classes) come from the shared rule engine; pass the request's FeatureSet
+    to reuse its keyword scan.
     """
-    error_msg = _extract_error_message(failure_text)
-    test_name = _extract_test_name(failure_text)
-    em_low = error_msg.lower()
-
-    # 🔹 Playwright-specific assertion failures - detect BEFORE generic cleaning
-    # toHaveTitle
-    if "tohavetitle" in em_low or "to have title" in em_low:
-        return "Page title does not match expected value"
-    
-    # toBeVisible
-    if "tobevisible" in em_low or "to be visible" in em_low:
-        if "button" in em_low:
-            return "Expected button element is not visible"
-        elif "input" in em_low:
-            return "Expected input field is not visible"
-        return "Expected UI element is not visible"
-    
-    # toHaveURL
-    if "tohaveurl" in em_low or "to have url" in em_low:
-        return "Page URL does not match expected value"
-    
-    # toHaveText
-    if "tohavetext" in em_low or "to have text" in em_low:
-        if "heading" in em_low or "h1" in em_low:
-            return "Heading text does not match expected value"
-        return "Element text content does not match expected value"
-    
-    # toHaveCount
-    if "tohavecount" in em_low or "to have count" in em_low:
-        if "paragraph" in em_low:
-            return "Paragraph count does not match expected value"
-        return "Element count does not match expected value"
-    
-    # toContainText
-    if "tocontaintext" in em_low or "to contain text" in em_low:
-        return "Element does not contain expected text"
-    
-    # toBeEnabled / toBeDisabled
-    if "tobeenabled" in em_low or "to be enabled" in em_low:
-        return "Element is not enabled as expected"
-    if "tobedisabled" in em_low or "to be disabled" in em_low:
-        return "Element is not disabled as expected"
-    
-    # toBeChecked
-    if "tobechecked" in em_low or "to be checked" in em_low:
-        return "Checkbox is not checked as expected"
-
-    # Strip anything after 'Traceback' or long technical noise
-    if "traceback" in em_low:
-        error_msg = error_msg.split("Traceback", 1)[0].strip()
-        em_low = error_msg.lower()
-
-    # UI / NoSuchElement-style errors
-    if "noselementexception" in em_low or "unable to locate element" in em_low:
-        m = re.search(r"#([\w\-]+)", error_msg)
-        if m:
-            elem_name = _css_id_to_words("#" + m.group(1))
-            return f"{elem_name} not found in UI"
-        return "Required UI element not found on page"
-
-    # React / JS / frontend TypeError
-    if "cannot read properties of undefined" in em_low or "cannot read property" in em_low:
-        return "Frontend component fails due to undefined value"
-
-    # Database / timeout / psycopg2 errors
-    if "psycopg2" in em_low or "database" in em_low or "connection timed out" in em_low:
-        return "Database timeout while retrieving data"
-
-    # 500 / internal server error-style failures
-    if "internal server error" in em_low or "status code 500" in em_low or " 500" in em_low:
-        if test_name:
-            return f"Internal server error during {test_name}"
-        return "Internal server error while processing request"
-
-    # TypeError / attribute errors etc.
-    if "typeerror" in em_low:
-        return "Type error due to invalid input or state"
-    if "attributeerror" in em_low:
-        return "Attribute error accessing invalid or None object"
-
-    # Generic assertion mismatch
-    if "assertionerror" in em_low:
-        return "Assertion failure in automated test"
+    if features is None:
+        features = extract_features(failure_text)
+
+    rule = features.rules.match_title(features)
+    # Anything after 'Traceback' is technical noise
+    error_msg = features.text("message_head")
+
+    if rule is not None:
+        if rule["handler"] == "missing_element":
+            m = re.search(r"#([\w\-]+)", error_msg)
+            if m:
+                elem_name = _css_id_to_words("#" + m.group(1))
+                return f"{elem_name} not found in UI"
+        if "{test_name}" in rule["title"]:
+            test_name = _extract_test_name(failure_text)
+            if test_name:
+                return rule["title"].format(test_name=test_name)
+            return rule["fallback_title"]
+        return rule["title"]
 
     # Fallback: shorten the error message into a title-ish phrase
     if error_msg:
@@ -171,46 +195,61 @@ def _heuristic_bug_title(failure_text: str) -> str:
     return "Automated test failure"
 
 
+def _is_dump_line(stripped: str, failure_lines: set) -> bool:
+    """
+    True if a (non-blank, stripped) description line just repeats the raw failure dump.
+    """
+    lower = stripped.lower()
+
+    # Remove exact failure lines
+    if stripped in failure_lines:
+        return True
+
+    # Remove obvious technical dump patterns
+    if stripped.startswith("Test Name:"):
+        return True
+    if stripped.startswith("File Path:"):
+        return True
+    if stripped.startswith("Error Message:"):
+        return True
+    if stripped.startswith("Stack Trace:"):
+        return True
+    if stripped.startswith("Logs:"):
+        return True
+    if "traceback (most recent call last):" in lower:
+        return True
+    if stripped.startswith("Traceback (most recent call last):"):
+        return True
+    if "file \"" in lower and " line " in lower and " in " in lower:
+        return True
+    if stripped.startswith("[") and "]" in stripped and ("error" in lower or "debug" in lower):
+        return True
+
+    return False
+
+
+def _failure_lines(failure_text: str) -> set:
+    return {
+        line.strip() for line in failure_text.splitlines() if line.strip()
+    }
+
+
 def _sanitize_description(bug_description: str, failure_text: str) -> str:
     """
     Remove raw lines that just repeat the failure text (Test Name, Stack Trace, Logs, etc),
     so the description looks like a clean explanation, not a dump.
     """
-    failure_lines = {
-        line.strip() for line in failure_text.splitlines() if line.strip()
-    }
+    failure_lines = _failure_lines(failure_text)
 
     cleaned_lines = []
     for line in bug_description.splitlines():
         stripped = line.strip()
-        lower = stripped.lower()
 
         if not stripped:
             cleaned_lines.append("")
             continue
 
-        # Remove exact failure lines
-        if stripped in failure_lines:
-            continue
-
-        # Remove obvious technical dump patterns
-        if stripped.startswith("Test Name:"):
-            continue
-        if stripped.startswith("File Path:"):
-            continue
-        if stripped.startswith("Error Message:"):
-            continue
-        if stripped.startswith("Stack Trace:"):
-            continue
-        if stripped.startswith("Logs:"):
-            continue
-        if "traceback (most recent call last):" in lower:
-            continue
-        if stripped.startswith("Traceback (most recent call last):"):
-            continue
-        if "file \"" in lower and " line " in lower and " in " in lower:
-            continue
-        if stripped.startswith("[") and "]" in stripped and ("error" in lower or "debug" in lower):
+        if _is_dump_line(stripped, failure_lines):
             continue
 
         cleaned_lines.append(stripped)
@@ -230,17 +269,108 @@ def _sanitize_description(bug_description: str, failure_text: str) -> str:
     return "\n".join(final_lines).strip()
 
 
-def generate_bug_report(model_name: str, failure_text: str) -> dict:
+class _StreamingSanitizer:
     """
-    - Title: generated heuristically from the error message.
-    - Description: generated by LLM, then cleaned to avoid raw dumps.
+    Incremental version of _sanitize_description for streamed LLM output.
+
+    Text is released one completed line at a time (a line can only be judged
+    once it is complete); the concatenation of everything returned by feed()
+    and flush() equals _sanitize_description() of the full text.
     """
 
-    # 1) TITLE (heuristic)
-    bug_title = _heuristic_bug_title(failure_text)
+    def __init__(self, failure_text: str):
+        self._failure_lines = _failure_lines(failure_text)
+        self._buffer = ""
+        self._emitted_any = False
+        self._blank_pending = False
 
-    # 2) DESCRIPTION (LLM)
-    desc_prompt = f"""
+    def _process_line(self, line: str) -> str:
+        stripped = line.strip()
+        if not stripped:
+            self._blank_pending = True
+            return ""
+        if _is_dump_line(stripped, self._failure_lines):
+            return ""
+        separator = ""
+        if self._emitted_any:
+            separator = "\n\n" if self._blank_pending else "\n"
+        self._emitted_any = True
+        self._blank_pending = False
+        return separator + stripped
+
+    def feed(self, text: str) -> str:
+        self._buffer += text
+        lines = self._buffer.splitlines(keepends=True)
+        # Keep the unfinished last line (and a lone trailing "\r" that may be half of "\r\n")
+        if lines and (lines[-1] == lines[-1].rstrip("\r\n\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029")
+                      or lines[-1].endswith("\r")):
+            self._buffer = lines.pop()
+        else:
+            self._buffer = ""
+        return "".join(self._process_line(line) for line in lines)
+
+    def flush(self) -> str:
+        rest, self._buffer = self._buffer, ""
+        return "".join(self._process_line(line) for line in rest.splitlines())
+
+
+_EXPECTED_RE = re.compile(r'^\s*Expected(?: string| value| pattern| substring)?\s*:\s*(.+?)\s*$', re.MULTILINE)
+_RECEIVED_RE = re.compile(r'^\s*Received(?: string| value)?\s*:\s*(.+?)\s*$', re.MULTILINE)
+
+_UNAVAILABLE_NOTE = (
+    "A detailed description could not be generated because the description "
+    "service is currently unavailable. Review the stack trace and logs of this "
+    "report to investigate the failure."
+)
+
+
+def _shorten(text: str, limit: int = 300) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 3].rstrip() + "..."
+
+
+def _templated_description(
+    failure_text: str,
+    bug_title: str,
+    features: Optional[FeatureSet] = None,
+    assertion_type: Optional[str] = None,
+    test_url: Optional[str] = None,
+    note: Optional[str] = _UNAVAILABLE_NOTE
+) -> str:
+    """
+    Plain, deterministic description built without the LLM: used while
+    Ollama's circuit breaker is open, and as the instant first version of a
+    deferred (background-enriched) description.
+    """
+    if features is None:
+        features = extract_features(failure_text)
+    test_name = _extract_test_name(failure_text) or "An automated test"
+    error_msg = _shorten(features.text("message_head"))
+
+    lines = [f"{test_name} failed: {bug_title.rstrip('.')}."]
+    if error_msg:
+        lines.append(f"The test reported: {error_msg}")
+    if assertion_type:
+        lines.append(f"Failure type: {assertion_type}")
+    full_message = extract_error_message(failure_text) or ""
+    expected = _EXPECTED_RE.search(full_message)
+    received = _RECEIVED_RE.search(full_message)
+    if expected:
+        lines.append(f"Expected: {_shorten(expected.group(1), 200)}")
+    if received:
+        lines.append(f"Received: {_shorten(received.group(1), 200)}")
+    if test_url:
+        lines.append(f"Page under test: {test_url}")
+    if note:
+        lines.append("")
+        lines.append(note)
+    return "\n".join(lines)
+
+
+def _build_description_prompt(failure_text: str) -> str:
+    # Bounded prompt size (and prompt-eval time) whatever the client sent
+    failure_text = compact_failure_text(failure_text)
+    prompt = f"""
 You are an expert QA engineer.
 
 Read the FAILED TEST DETAILS below and write a long, detailed, professional bug description
@@ -268,15 +398,168 @@ Content requirements:
 FAILED TEST DETAILS:
 {failure_text}
 """
+    note_detail("prompt_tokens_estimated", estimate_tokens(prompt))
+    return prompt
+
+
+def generate_bug_report(
+    model_name: str,
+    failure_text: str,
+    signature: Optional[str] = None,
+    features: Optional[FeatureSet] = None
+) -> dict:
+    """
+    - Title: generated heuristically from the error message (features: the
+      request's shared FeatureSet, built from failure_text if not given).
+    - Description: generated by LLM, then cleaned to avoid raw dumps.
+
+    If a failure signature is given, a previously generated report for the same
+    signature (and model) is reused instead of calling the LLM again.
+    While Ollama's circuit breaker is open, a templated description is
+    returned immediately instead.
+    """
+    if signature:
+        cached = description_cache.get(model_name, signature)
+        if cached is not None:
+            note_detail("description_cached", True)
+            return cached
+
+    # 1) TITLE (heuristic)
+    bug_title = _heuristic_bug_title(failure_text, features)
+
+    # 2) DESCRIPTION (LLM)
+    with stage_timer("prompt"):
+        desc_prompt = _build_description_prompt(failure_text)
 
+    generated = True
     try:
-        bug_description = _call_ollama(model_name, desc_prompt, num_predict=1200)
+        # Identical prompts already being generated are shared, not re-run
+        with stage_timer("ollama"):
+            bug_description = ollama_flight.do(
+                hash_key(model_name, desc_prompt, 1200),
+                lambda: _call_ollama(model_name, desc_prompt, num_predict=1200),
+            )
+    except CircuitOpenError:
+        # Ollama is known to be down: answer at once, without caching
+        return {"title": bug_title, "description": _templated_description(failure_text, bug_title, features)}
     except Exception as e:
         bug_description = f"Bug description generation failed: {str(e)}"
+        generated = False
 
-    bug_description = _sanitize_description(bug_description, failure_text)
+    with stage_timer("sanitize"):
+        bug_description = _sanitize_description(bug_description, failure_text)
 
-    return {
+    report = {
+        "title": bug_title,
+        "description": bug_description.strip(),
+    }
+    # Only successful generations are reused
+    if signature and generated:
+        description_cache.put(model_name, signature, report)
+    return report
+
+
+async def generate_bug_report_async(
+    model_name: str,
+    failure_text: str,
+    signature: Optional[str] = None,
+    features: Optional[FeatureSet] = None,
+    fallback: bool = True
+) -> dict:
+    """
+    Async variant of generate_bug_report (same title/description/cache rules).
+
+    With fallback=False, a failed generation (or an open circuit breaker)
+    raises instead of returning an error / templated description.
+    """
+    if signature:
+        cached = description_cache.get(model_name, signature)
+        if cached is not None:
+            note_detail("description_cached", True)
+            return cached
+
+    bug_title = _heuristic_bug_title(failure_text, features)
+    with stage_timer("prompt"):
+        desc_prompt = _build_description_prompt(failure_text)
+
+    generated = True
+    try:
+        with stage_timer("ollama"):
+            bug_description = await ollama_flight.do_async(
+                hash_key(model_name, desc_prompt, 1200),
+                lambda: _call_ollama_async(model_name, desc_prompt, num_predict=1200),
+            )
+    except CircuitOpenError:
+        if not fallback:
+            raise
+        return {"title": bug_title, "description": _templated_description(failure_text, bug_title, features)}
+    except Exception as e:
+        if not fallback:
+            raise
+        bug_description = f"Bug description generation failed: {str(e)}"
+        generated = False
+
+    with stage_timer("sanitize"):
+        bug_description = _sanitize_description(bug_description, failure_text)
+
+    report = {
         "title": bug_title,
         "description": bug_description.strip(),
     }
+    if signature and generated:
+        description_cache.put(model_name, signature, report)
+    return report
+
+
+async def stream_bug_description_async(
+    model_name: str,
+    failure_text: str,
+    signature: Optional[str] = None,
+    features: Optional[FeatureSet] = None
+) -> AsyncIterator[str]:
+    """
+    Stream the sanitized LLM description as it is generated.
+
+    Yields chunks whose concatenation is the same description that
+    generate_bug_report would return. Cached signatures are served in one chunk,
+    and a completed generation is added to the cache. While Ollama's circuit
+    breaker is open, the templated description is yielded in one chunk.
+    """
+    if signature:
+        cached = description_cache.get(model_name, signature)
+        if cached is not None:
+            if cached["description"]:
+                yield cached["description"]
+            return
+
+    sanitizer = _StreamingSanitizer(failure_text)
+    desc_prompt = _build_description_prompt(failure_text)
+    parts = []
+
+    try:
+        async for token in _stream_ollama_async(model_name, desc_prompt, num_predict=1200):
+            chunk = sanitizer.feed(token)
+            if chunk:
+                parts.append(chunk)
+                yield chunk
+    except CircuitOpenError:
+        # Raised before the first token: the templated description is the whole answer
+        yield _templated_description(failure_text, _heuristic_bug_title(failure_text, features), features)
+        return
+    except Exception as e:
+        sanitizer.flush()
+        failure = _sanitize_description(f"Bug description generation failed: {str(e)}", failure_text)
+        if failure:
+            yield ("\n\n" if parts else "") + failure
+        return
+
+    chunk = sanitizer.flush()
+    if chunk:
+        parts.append(chunk)
+        yield chunk
+
+    if signature:
+        description_cache.put(model_name, signature, {
+            "title": _heuristic_bug_title(failure_text, features),
+            "description": "".join(parts),
+        })
@@ -3,12 +3,36 @@ Intelligent Playwright error label detection service.
 Uses BERT model for classification with pattern-based fallback.
 """
 
-import re
-import requests
-from typing import Optional
+from typing import Optional, Tuple
 
+import httpx
 
-def _call_bert_classifier(text: str, bert_url: str, candidate_labels: list) -> str:
+from app.services.circuit_breaker import CircuitOpenError, bert_breaker
+from app.services.http_clients import get_session, get_async_client
+from app.services.local_classifier import classification_text, local_classifier
+from app.services.metrics import LABEL_SOURCE
+from app.services.rule_engine import FeatureSet, extract_features
+from app.services.scheduler import bert_bulkhead
+from app.services.single_flight import bert_flight, hash_key
+
+BERT_TIMEOUT = 30
+# An unreachable BERT host fails fast instead of waiting out BERT_TIMEOUT
+BERT_CONNECT_TIMEOUT = 5
+
+# Where a label decision came from (stored as the result's label_source)
+LABEL_SOURCE_LOCAL = "local"
+LABEL_SOURCE_BERT = "bert"
+LABEL_SOURCE_BERT_CIRCUIT_OPEN = "bert_circuit_open"
+LABEL_SOURCE_BERT_ERROR = "bert_error"
+LABEL_SOURCE_RULES = "rules"
+
+
+def _bert_predict_endpoint(bert_url: str) -> str:
+    # Use the /predict endpoint
+    return bert_url.replace("/triage", "/predict")
+
+
+def _call_bert_classifier(text: str, bert_url: str, candidate_labels: list) -> Tuple[str, str]:
     """
     Call BERT server to classify error text into one of the candidate labels.
     
@@ -18,150 +42,149 @@ def _call_bert_classifier(text: str, bert_url: str, candidate_labels: list) -> s
         candidate_labels: List of possible labels
         
     Returns:
-        Best matching label from BERT classification
+        (label, label source): the best matching label from BERT classification,
+        or the first candidate if BERT is unavailable
     """
     try:
-        # Use the /predict endpoint
-        endpoint = bert_url.replace("/triage", "/predict")
+        endpoint = _bert_predict_endpoint(bert_url)
         
         payload = {
             "text": text,
             "labels": candidate_labels
         }
         
-        response = requests.post(endpoint, json=payload, timeout=30)
-        response.raise_for_status()
+        def _post() -> dict:
+            bert_breaker.check()
+            with bert_bulkhead.slot(), bert_breaker.guard():
+                response = get_session().post(
+                    endpoint, json=payload, timeout=(BERT_CONNECT_TIMEOUT, BERT_TIMEOUT)
+                )
+                response.raise_for_status()
+            return response.json()
         
-        result = response.json()
-        return result.get("label", candidate_labels[0])
+        # Identical classifications already in flight are shared, not re-sent
+        result = bert_flight.do(hash_key(endpoint, text, *candidate_labels), _post)
+        return result.get("label", candidate_labels[0]), LABEL_SOURCE_BERT
         
+    except CircuitOpenError:
+        # BERT is known to be down: first (most specific) candidate, no waiting
+        return (candidate_labels[0] if candidate_labels else "Test Failure"), LABEL_SOURCE_BERT_CIRCUIT_OPEN
     except Exception as e:
         # Fallback to first label if BERT fails
         print(f"BERT classification failed: {e}")
-        return candidate_labels[0] if candidate_labels else "Test Failure"
+        return (candidate_labels[0] if candidate_labels else "Test Failure"), LABEL_SOURCE_BERT_ERROR
 
 
-def _detect_playwright_assertion_type(error_message: str) -> Optional[str]:
+async def _call_bert_classifier_async(text: str, bert_url: str, candidate_labels: list) -> Tuple[str, str]:
+    """
+    Async variant of _call_bert_classifier using the shared keep-alive client.
+    """
+    try:
+        endpoint = _bert_predict_endpoint(bert_url)
+        
+        payload = {
+            "text": text,
+            "labels": candidate_labels
+        }
+        
+        async def _post() -> dict:
+            bert_breaker.check()
+            async with bert_bulkhead.async_slot(), bert_breaker.async_guard():
+                response = await get_async_client().post(
+                    endpoint, json=payload, timeout=httpx.Timeout(BERT_TIMEOUT, connect=BERT_CONNECT_TIMEOUT)
+                )
+                response.raise_for_status()
+            return response.json()
+        
+        result = await bert_flight.do_async(hash_key(endpoint, text, *candidate_labels), _post)
+        return result.get("label", candidate_labels[0]), LABEL_SOURCE_BERT
+        
+    except CircuitOpenError:
+        # BERT is known to be down: first (most specific) candidate, no waiting
+        return (candidate_labels[0] if candidate_labels else "Test Failure"), LABEL_SOURCE_BERT_CIRCUIT_OPEN
+    except Exception as e:
+        # Fallback to first label if BERT fails
+        print(f"BERT classification failed: {e}")
+        return (candidate_labels[0] if candidate_labels else "Test Failure"), LABEL_SOURCE_BERT_ERROR
+
+
+def _detect_playwright_assertion_type(
+    error_message: str,
+    features: Optional[FeatureSet] = None
+) -> Optional[str]:
     """
     Detect specific Playwright assertion type from error message.
     Returns specific label if assertion is detected, None otherwise.
+
+    The assertion patterns are the "assertion_labels" rules of the rule engine.
     """
-    em_low = error_message.lower()
-    
-    # Playwright assertion patterns
-    if "tohavetitle" in em_low or "to have title" in em_low:
-        return "Assertion: Title Mismatch"
-    
-    if "tobevisible" in em_low or "to be visible" in em_low:
-        return "Assertion: Element Not Visible"
-    
-    if "tohaveurl" in em_low or "to have url" in em_low:
-        return "Assertion: URL Mismatch"
-    
-    if "tohavetext" in em_low or "to have text" in em_low:
-        return "Assertion: Text Mismatch"
-    
-    if "tohavecount" in em_low or "to have count" in em_low:
-        return "Assertion: Count Mismatch"
-    
-    if "tocontaintext" in em_low or "to contain text" in em_low:
-        return "Assertion: Missing Text"
-    
-    if "tobeenabled" in em_low or "to be enabled" in em_low:
-        return "Assertion: Element Not Enabled"
-    
-    if "tobedisabled" in em_low or "to be disabled" in em_low:
-        return "Assertion: Element Not Disabled"
-    
-    if "tobechecked" in em_low or "to be checked" in em_low:
-        return "Assertion: Checkbox Not Checked"
-    
-    if "tohavevalue" in em_low or "to have value" in em_low:
-        return "Assertion: Value Mismatch"
-    
-    if "tohaveattribute" in em_low or "to have attribute" in em_low:
-        return "Assertion: Attribute Mismatch"
-    
-    if "tobeattached" in em_low or "to be attached" in em_low:
-        return "Assertion: Element Not Attached"
-    
-    return None
+    if features is None:
+        features = extract_features(error_message=error_message, stack_trace="")
+    return features.rules.match_assertion_label(features)
 
 
-def _get_candidate_labels_from_patterns(error_message: str, stack_trace: str) -> list:
+def _get_candidate_labels_from_patterns(
+    error_message: str,
+    stack_trace: str,
+    features: Optional[FeatureSet] = None
+) -> list:
     """
-    Generate candidate labels based on error patterns.
+    Generate candidate labels based on error patterns ("candidate_labels"
+    rules, generic labels if none match).
     These will be used for BERT classification.
     """
-    combined_text = f"{error_message} {stack_trace}".lower()
+    if features is None:
+        features = extract_features(error_message=error_message, stack_trace=stack_trace)
+    return features.rules.match_candidate_labels(features)
+
+
+def _build_candidate_labels(
+    error_message: str,
+    stack_trace: str,
+    features: Optional[FeatureSet] = None
+) -> list:
+    """
+    Build the ordered, de-duplicated candidate label list (assertions + patterns).
+    """
+    if features is None:
+        features = extract_features(error_message=error_message, stack_trace=stack_trace)
     candidates = []
     
-    # Timeout patterns
-    if "timeout" in combined_text or "timed out" in combined_text:
-        candidates.append("Timeout Error")
-    
-    # Element locator issues
-    if "locator" in combined_text or "selector" in combined_text:
-        candidates.append("Element Locator Issue")
-    
-    # Element not found
-    if "not found" in combined_text or "unable to locate" in combined_text:
-        candidates.append("Element Not Found")
-    
-    # Navigation issues
-    if "navigation" in combined_text or "goto" in combined_text:
-        candidates.append("Navigation Error")
-    
-    # Network/API issues
-    if "network" in combined_text or "request failed" in combined_text or "api" in combined_text:
-        candidates.append("Network Error")
-    
-    # Screenshot/video issues
-    if "screenshot" in combined_text or "video" in combined_text:
-        candidates.append("Media Capture Error")
-    
-    # Action failures (click, type, etc.)
-    if "click" in combined_text:
-        candidates.append("Click Action Failed")
-    if "type" in combined_text or "fill" in combined_text:
-        candidates.append("Input Action Failed")
-    if "hover" in combined_text:
-        candidates.append("Hover Action Failed")
-    
-    # Assertion failures (generic)
-    if "expect" in combined_text or "assertion" in combined_text:
-        candidates.append("Assertion Failure")
+    # Add assertion-specific labels if detected
+    assertion_label = _detect_playwright_assertion_type(error_message, features)
+    if assertion_label:
+        candidates.append(assertion_label)
     
-    # Page/frame issues
-    if "frame" in combined_text:
-        candidates.append("Frame Error")
-    if "page closed" in combined_text or "page crashed" in combined_text:
-        candidates.append("Page Crash")
+    # Add pattern-based candidates
+    pattern_candidates = _get_candidate_labels_from_patterns(error_message, stack_trace, features)
+    candidates.extend(pattern_candidates)
     
-    # If no specific patterns found, add generic labels
-    if not candidates:
-        candidates = [
-            "Test Failure",
-            "UI Test Error",
-            "Playwright Error"
-        ]
+    # Remove duplicates while preserving order
+    seen = set()
+    unique_candidates = []
+    for c in candidates:
+        if c not in seen:
+            seen.add(c)
+            unique_candidates.append(c)
     
-    return candidates
+    return unique_candidates if unique_candidates else ["Test Failure"]
 
 
 def detect_playwright_label(
     error_message: str,
     stack_trace: str,
     failure_text: str,
-    bert_url: Optional[str] = None
-) -> str:
+    bert_url: Optional[str] = None,
+    features: Optional[FeatureSet] = None
+) -> Tuple[str, str]:
     """
     Intelligently detect triage label for Playwright errors using BERT prominently.
     
     NEW APPROACH - BERT-First Classification:
     1. Generate ALL possible candidate labels (assertions + patterns)
-    2. Use BERT to classify among ALL candidates (uses 30K trained model)
-    3. Falls back to pattern-based detection only if BERT unavailable
+    2. Answer in-process if the local model (trained on stored results) is confident
+    3. Otherwise use BERT to classify among ALL candidates (uses 30K trained model)
+    4. Falls back to pattern-based detection only if BERT unavailable
     
     This ensures BERT is used for ALL errors, not just non-assertion ones.
     
@@ -170,38 +193,52 @@ def detect_playwright_label(
         stack_trace: The stack trace from test failure
         failure_text: Complete failure text
         bert_url: Optional BERT server URL for classification
+        features: Optional FeatureSet of the request (shared with the title heuristics)
         
     Returns:
-        Intelligent triage label string
+        (triage label, label source) - the source is one of the LABEL_SOURCE_*
+        values (only BERT labels are learned by the local model)
     """
     # Step 1: Build comprehensive candidate list
-    candidates = []
-    
-    # Add assertion-specific labels if detected
-    assertion_label = _detect_playwright_assertion_type(error_message)
-    if assertion_label:
-        candidates.append(assertion_label)
-    
-    # Add pattern-based candidates
-    pattern_candidates = _get_candidate_labels_from_patterns(error_message, stack_trace)
-    candidates.extend(pattern_candidates)
-    
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_candidates = []
-    for c in candidates:
-        if c not in seen:
-            seen.add(c)
-            unique_candidates.append(c)
-    
-    candidates = unique_candidates if unique_candidates else ["Test Failure"]
-    
-    # Step 2: Use BERT for classification (PRIMARY METHOD)
-    if bert_url:
-        # Combine error info for BERT analysis
-        text_for_classification = f"{error_message}\n{stack_trace[:500]}"
-        bert_label = _call_bert_classifier(text_for_classification, bert_url, candidates)
-        return bert_label
-    
-    # Step 3: Fallback - return the first (most specific) candidate only if BERT unavailable
-    return candidates[0]
+    candidates = _build_candidate_labels(error_message, stack_trace, features)
+    # Combine error info for classification
+    text_for_classification = classification_text(error_message, stack_trace)
+    
+    # Step 2: Confident local prediction, no network hop
+    local_label = local_classifier.predict(text_for_classification, candidates)
+    if local_label is not None:
+        decision = local_label, LABEL_SOURCE_LOCAL
+    # Step 3: Use BERT for classification (PRIMARY METHOD)
+    elif bert_url:
+        decision = _call_bert_classifier(text_for_classification, bert_url, candidates)
+    # Step 4: Fallback - return the first (most specific) candidate only if BERT unavailable
+    else:
+        decision = candidates[0], LABEL_SOURCE_RULES
+    
+    LABEL_SOURCE.inc(source=decision[1])
+    return decision
+
+
+async def detect_playwright_label_async(
+    error_message: str,
+    stack_trace: str,
+    failure_text: str,
+    bert_url: Optional[str] = None,
+    features: Optional[FeatureSet] = None
+) -> Tuple[str, str]:
+    """
+    Async variant of detect_playwright_label (same candidates, local model and fallback).
+    """
+    candidates = _build_candidate_labels(error_message, stack_trace, features)
+    text_for_classification = classification_text(error_message, stack_trace)
+    
+    local_label = local_classifier.predict(text_for_classification, candidates)
+    if local_label is not None:
+        decision = local_label, LABEL_SOURCE_LOCAL
+    elif bert_url:
+        decision = await _call_bert_classifier_async(text_for_classification, bert_url, candidates)
+    else:
+        decision = candidates[0], LABEL_SOURCE_RULES
+    
+    LABEL_SOURCE.inc(source=decision[1])
+    return decision
@@ -0,0 +1,294 @@
+"""
+Token-budgeted compaction of the failure details sent to Ollama.
+
+Prompt evaluation time on CPU grows linearly with the prompt size, and a large
+enough log silently overflows the model context. Before the failure text is
+embedded in the description prompt it is compacted:
+
+- stack traces lose node_modules / Node internal / Playwright library frames,
+  and runs of identical frames (recursion) collapse to one line
+- repeated log and call log lines (differing only in timestamps, durations
+  or hex ids) are kept once, with their repeat count
+- if the text is still over the budget, each section is head/tail-truncated
+  to its share (error message first, then stack trace, then logs); the
+  Playwright "Expected / Received / Call log" part of the error message is
+  kept ahead of the rest of it
+
+Tokens are estimated from the character count (no tokenizer needed).
+"""
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+from app.services.metrics import PROMPT_TOKENS_SAVED
+
+
+# Estimated tokens the failure details may take in the description prompt
+PROMPT_TOKEN_BUDGET = int(os.environ.get("TRIAGE_PROMPT_TOKEN_BUDGET", "1024"))
+# Rough average for English text and code with LLM tokenizers
+CHARS_PER_TOKEN = 4
+# Test name / file path are single fields, not worth a budget share
+FIELD_MAX_CHARS = 300
+# Budget shares of error message, stack trace and logs (unused share goes to the others)
+SECTION_WEIGHTS = (0.5, 0.3, 0.2)
+
+_FAILURE_TEXT_RE = re.compile(
+    r'\ATest Name: (?P<test_name>.*?)\nFile Path: (?P<file_path>.*?)\n'
+    r'Error Message: (?P<error_message>.*?)\nStack Trace: (?P<stack_trace>.*?)\n'
+    r'Logs: (?P<logs>.*)\Z',
+    re.DOTALL
+)
+_INTERNAL_FRAME_RE = re.compile(r'node_modules|node:internal|\(internal/|playwright-core|@playwright[\\/]')
+_CALL_LOG_RE = re.compile(r'^\s*Call log:', re.MULTILINE)
+# Run-specific parts of a log line, ignored when looking for repeats
+_LINE_NOISE_RES = (
+    re.compile(r'\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}(?::\d{2}(?:[.,]\d+)?)?(?:Z|[+-]\d{2}:?\d{2})?'),
+    re.compile(r'\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b'),
+    re.compile(r'\b\d+(?:\.\d+)?\s*(?:ms|milliseconds?|s|secs?|seconds?|m|mins?|minutes?)\b', re.IGNORECASE),
+    # 0x..., UUIDs, and 8+ character hex strings mixing digits and letters
+    re.compile(
+        r'\b(?:0x[0-9a-f]+|[0-9a-f]{8}(?:-[0-9a-f]{4}){3}-[0-9a-f]{12}|(?=[0-9a-f]*\d)(?=[0-9a-f]*[a-f])[0-9a-f]{8,})\b',
+        re.IGNORECASE
+    ),
+)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def _line_key(line: str) -> str:
+    """
+    A log line with its timestamps, durations and hex ids masked (paths,
+    URLs and other numbers are kept: they tell lines apart).
+    """
+    for pattern in _LINE_NOISE_RES:
+        line = pattern.sub("<*>", line)
+    return line.strip()
+
+
+def _dedupe_lines(text: str) -> str:
+    """
+    Keep the first occurrence of every line (compared without timestamps,
+    durations and hex ids), annotated with how often it appeared.
+    """
+    order: List[str] = []
+    counts: Dict[str, int] = {}
+    first: Dict[str, str] = {}
+    for line in text.splitlines():
+        key = _line_key(line)
+        if not key:
+            # Blank lines separate blocks: keep them where they are
+            order.append(line)
+            continue
+        if key in counts:
+            counts[key] += 1
+            continue
+        counts[key] = 1
+        first[key] = line
+        order.append(key)
+
+    lines = []
+    for key in order:
+        if key not in first:
+            lines.append(key)
+        elif counts[key] > 1:
+            lines.append(f"{first[key]}  [repeated {counts[key]}x]")
+        else:
+            lines.append(first[key])
+    return "\n".join(lines)
+
+
+def _compact_stack_trace(stack_trace: str) -> str:
+    """
+    Drop library / runtime frames and collapse runs of identical frames.
+    """
+    lines: List[str] = []
+    dropped = 0
+    first_dropped: Optional[str] = None
+    previous: Optional[str] = None
+    repeats = 0
+
+    def flush_repeats() -> None:
+        if repeats:
+            lines.append(f"    [previous frame repeated {repeats} more times]")
+
+    for line in stack_trace.splitlines():
+        stripped = line.strip()
+        is_frame = stripped.startswith("at ")
+        if is_frame and _INTERNAL_FRAME_RE.search(stripped):
+            dropped += 1
+            first_dropped = first_dropped or line
+            continue
+        if is_frame and stripped == previous:
+            repeats += 1
+            continue
+        flush_repeats()
+        repeats = 0
+        lines.append(line)
+        previous = stripped if is_frame else None
+    flush_repeats()
+
+    if dropped:
+        if not any(line.strip().startswith("at ") for line in lines):
+            # Only library frames: the top one still says where it failed
+            lines.append(first_dropped)
+            dropped -= 1
+        if dropped:
+            lines.append(f"    [{dropped} node_modules / internal frames omitted]")
+    return "\n".join(lines)
+
+
+def _head_tail(text: str, limit: int) -> str:
+    """
+    Keep the start and the end of a text within limit characters, cut at line
+    boundaries where possible.
+    """
+    if len(text) <= limit:
+        return text
+    marker = "\n[... {} characters omitted ...]\n"
+    keep = max(0, limit - len(marker) - 8)
+    head_len = keep * 2 // 3
+    tail_len = keep - head_len
+
+    head = text[:head_len]
+    cut = head.rfind("\n")
+    if cut > head_len // 2:
+        head = head[:cut]
+    tail = text[len(text) - tail_len:] if tail_len else ""
+    cut = tail.find("\n")
+    if 0 <= cut < tail_len // 2:
+        tail = tail[cut + 1:]
+    return head + marker.format(len(text) - len(head) - len(tail)) + tail
+
+
+def _truncate_error_message(message: str, limit: int) -> str:
+    if len(message) <= limit:
+        return message
+    # Playwright puts Expected/Received right before the call log: keep the
+    # part up to the call log first and trim the (long, retrying) call log
+    match = _CALL_LOG_RE.search(message)
+    if match is None:
+        # head/tail keeps the Expected/Received lines closing the message
+        return _head_tail(message, limit)
+    head, call_log = message[:match.start()], message[match.start():]
+    head_limit = min(len(head), max(limit // 2, limit - len(call_log)))
+    return _head_tail(head, head_limit) + _head_tail(call_log, limit - head_limit)
+
+
+def _allocate(needs: List[int], available: int) -> List[int]:
+    """
+    Split available characters between sections by SECTION_WEIGHTS, handing
+    what small sections do not need to the others.
+    """
+    limits = [0] * len(needs)
+    pending = set(range(len(needs)))
+    while pending and available > 0:
+        total_weight = sum(SECTION_WEIGHTS[i] for i in pending)
+        shares = {i: int(available * SECTION_WEIGHTS[i] / total_weight) for i in pending}
+        satisfied = [i for i in pending if needs[i] <= shares[i]]
+        if not satisfied:
+            for i in pending:
+                limits[i] = shares[i]
+            break
+        for i in satisfied:
+            limits[i] = needs[i]
+            available -= needs[i]
+            pending.discard(i)
+    return limits
+
+
+class PromptCompactionStats:
+    """
+    Thread-safe totals of the estimated prompt tokens saved by compaction.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.prompts = 0
+        self.compacted = 0
+        self.truncated = 0
+        self.tokens_in = 0
+        self.tokens_out = 0
+        self.max_tokens_saved = 0
+
+    def record(self, tokens_in: int, tokens_out: int, truncated: bool) -> None:
+        with self._lock:
+            self.prompts += 1
+            self.compacted += tokens_out < tokens_in
+            self.truncated += truncated
+            self.tokens_in += tokens_in
+            self.tokens_out += tokens_out
+            self.max_tokens_saved = max(self.max_tokens_saved, tokens_in - tokens_out)
+
+    def stats(self) -> dict:
+        with self._lock:
+            saved = self.tokens_in - self.tokens_out
+            return {
+                "token_budget": PROMPT_TOKEN_BUDGET,
+                "prompts": self.prompts,
+                "compacted": self.compacted,
+                "truncated": self.truncated,
+                "tokens_in": self.tokens_in,
+                "tokens_out": self.tokens_out,
+                "tokens_saved": saved,
+                "avg_tokens_saved": round(saved / self.prompts, 1) if self.prompts else 0.0,
+                "max_tokens_saved": self.max_tokens_saved,
+            }
+
+
+compaction_stats = PromptCompactionStats()
+
+
+def compact_failure_text(failure_text: str, token_budget: Optional[int] = None) -> str:
+    """
+    Compact a failure text (as built by the triage service) to fit the
+    prompt token budget.
+
+    Args:
+        failure_text: "Test Name: ... Logs: ..." failure details
+        token_budget: Estimated token cap (defaults to PROMPT_TOKEN_BUDGET, 0 disables it)
+
+    Returns:
+        The compacted failure text, in the same format
+    """
+    budget = PROMPT_TOKEN_BUDGET if token_budget is None else token_budget
+    tokens_in = estimate_tokens(failure_text)
+
+    match = _FAILURE_TEXT_RE.match(failure_text)
+    if match is None:
+        # Not our format: nothing to restructure, only enforce the budget
+        compacted = _head_tail(failure_text, budget * CHARS_PER_TOKEN) if budget > 0 else failure_text
+        truncated = compacted != failure_text
+    else:
+        sections = match.groupdict()
+        test_name = _head_tail(sections["test_name"], FIELD_MAX_CHARS)
+        file_path = _head_tail(sections["file_path"], FIELD_MAX_CHARS)
+        error_message = _dedupe_lines(sections["error_message"])
+        stack_trace = _compact_stack_trace(sections["stack_trace"])
+        logs = _dedupe_lines(sections["logs"])
+
+        def assemble() -> str:
+            return (
+                f"Test Name: {test_name}\nFile Path: {file_path}\nError Message: {error_message}\n"
+                f"Stack Trace: {stack_trace}\nLogs: {logs}"
+            )
+
+        compacted = assemble()
+        truncated = budget > 0 and estimate_tokens(compacted) > budget
+        if truncated:
+            fixed = len(compacted) - len(error_message) - len(stack_trace) - len(logs)
+            message_limit, stack_limit, logs_limit = _allocate(
+                [len(error_message), len(stack_trace), len(logs)],
+                max(0, budget * CHARS_PER_TOKEN - fixed),
+            )
+            error_message = _truncate_error_message(error_message, message_limit)
+            stack_trace = _head_tail(stack_trace, stack_limit)
+            logs = _head_tail(logs, logs_limit)
+            compacted = assemble()
+
+    tokens_out = estimate_tokens(compacted)
+    compaction_stats.record(tokens_in, tokens_out, truncated)
+    PROMPT_TOKENS_SAVED.inc(tokens_in - tokens_out)
+    return compacted
@@ -0,0 +1,316 @@
+"""
+Table-driven keyword rules for the title, category and label heuristics.
+
+The rules live in a JSON file (heuristic_rules.json next to this module, or the
+file named by TRIAGE_RULES_FILE), so new Playwright matchers can be added
+without code changes. The keywords of all rules are compiled once per scope and
+each scope's text is scanned once per failure: with plain substring searches
+for the current rule sizes, with an Aho-Corasick automaton (a single pass,
+whatever the number of keywords) once a scope has AUTOMATON_MIN_KEYWORDS.
+
+A FeatureSet holds the keywords found in one failure, per scope, and is shared
+by the three consumers (bug title, category, triage label candidates).
+
+Scopes (the text a keyword is looked for in, lower-cased):
+- message_line: the "Error Message:" line of the failure text
+- message_head: message_line cut before a "Traceback"
+- failure: the whole failure text
+- error: the error message of the request
+- combined: error message + stack trace of the request
+
+Rule conditions are {"<scope>": [keywords]} (any keyword present),
+{"all": [conditions]} or {"any": [conditions]}.
+"""
+import json
+import os
+from collections import deque
+from typing import Any, Dict, FrozenSet, List, Optional, Set
+
+
+RULES_FILE = os.environ.get(
+    "TRIAGE_RULES_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "heuristic_rules.json"),
+)
+
+SCOPES = ("message_line", "message_head", "failure", "error", "combined")
+
+# Below this many keywords in a scope, one C-level substring search per keyword
+# beats the per-character Python automaton scan
+AUTOMATON_MIN_KEYWORDS = 128
+
+
+class AhoCorasick:
+    """
+    Multi-keyword matcher: one pass over the text finds every keyword occurrence
+    (overlapping ones included). Transitions are precomputed into a DFA, so the
+    scan is one dict lookup per character.
+    """
+
+    def __init__(self, keywords: List[str]):
+        self.keywords = keywords
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Set[int]] = [set()]
+        for index, keyword in enumerate(keywords):
+            state = 0
+            for char in keyword:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append(set())
+                state = next_state
+            outputs[state].add(index)
+
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [{} for _ in goto]
+        delta[0] = dict(goto[0])
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            outputs[state] |= outputs[fail[state]]
+            # Missing transitions fall back to those of the failure state
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0)
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs: List[Optional[FrozenSet[int]]] = [frozenset(o) if o else None for o in outputs]
+
+    def find(self, text: str) -> Set[int]:
+        """
+        Indexes of all keywords occurring in text.
+        """
+        delta = self._delta
+        outputs = self._outputs
+        found: Set[int] = set()
+        state = 0
+        for char in text:
+            state = delta[state].get(char, 0)
+            matched = outputs[state]
+            if matched is not None:
+                found |= matched
+        return found
+
+
+class RuleSet:
+    """
+    Compiled rules: title rules, category rules, assertion label rules and
+    candidate label rules, all matched against a FeatureSet.
+    """
+
+    def __init__(self, data: Dict[str, Any]):
+        self._keyword_ids: Dict[str, int] = {}
+        self._scope_ids: Dict[str, Set[int]] = {scope: set() for scope in SCOPES}
+        self.titles = [self._compile_title(rule) for rule in data.get("titles", [])]
+        self.categories = [
+            (self._compile_condition(rule["when"]), rule["category"]) for rule in data.get("categories", [])
+        ]
+        self.assertion_labels = [
+            (self._compile_condition(rule["when"]), rule["label"]) for rule in data.get("assertion_labels", [])
+        ]
+        self.candidate_labels = [
+            (self._compile_condition(rule["when"]), rule["label"]) for rule in data.get("candidate_labels", [])
+        ]
+        self.default_candidate_labels: List[str] = list(data.get("default_candidate_labels", []))
+
+        # Scopes with many keywords get an automaton over just their keywords
+        self.keywords: List[str] = list(self._keyword_ids)
+        self._automata: Dict[str, tuple] = {}
+        for scope, ids in self._scope_ids.items():
+            if len(ids) >= AUTOMATON_MIN_KEYWORDS:
+                ordered = sorted(ids)
+                automaton = AhoCorasick([self.keywords[i] for i in ordered])
+                self._automata[scope] = (automaton, ordered)
+
+    def _compile_condition(self, spec: Dict[str, Any]) -> tuple:
+        if not isinstance(spec, dict) or len(spec) != 1:
+            raise ValueError(f"Invalid rule condition: {spec!r}")
+        (key, value), = spec.items()
+        if key in ("all", "any"):
+            return (key, [self._compile_condition(item) for item in value])
+        if key not in SCOPES:
+            raise ValueError(f"Unknown rule scope '{key}' (expected one of {', '.join(SCOPES)})")
+        ids = tuple(dict.fromkeys(
+            self._keyword_ids.setdefault(keyword.lower(), len(self._keyword_ids)) for keyword in value
+        ))
+        self._scope_ids[key].update(ids)
+        return ("keywords", key, ids)
+
+    def _compile_title(self, rule: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "when": self._compile_condition(rule["when"]),
+            "title": rule["title"],
+            "fallback_title": rule.get("fallback_title"),
+            "handler": rule.get("handler"),
+            "cases": [self._compile_title(case) for case in rule.get("cases", [])],
+        }
+
+    def scan(self, scope: str, text: str) -> Optional[Set[int]]:
+        """
+        Ids of the scope's keywords occurring in text (already lower-cased), in
+        one automaton pass; None if the scope is matched keyword by keyword.
+        """
+        compiled = self._automata.get(scope)
+        if compiled is None:
+            return None
+        automaton, ids = compiled
+        return {ids[index] for index in automaton.find(text)}
+
+    @staticmethod
+    def _first_title(rules: List[Dict[str, Any]], features: "FeatureSet") -> Optional[Dict[str, Any]]:
+        for rule in rules:
+            if features.matches(rule["when"]):
+                # The most specific matching case wins over the rule itself
+                return RuleSet._first_title(rule["cases"], features) or rule
+        return None
+
+    def match_title(self, features: "FeatureSet") -> Optional[Dict[str, Any]]:
+        """
+        First matching title rule (or its matching case): a dict with title,
+        fallback_title and handler; None if no rule applies.
+        """
+        return self._first_title(self.titles, features)
+
+    def match_category(self, features: "FeatureSet") -> Optional[str]:
+        for condition, category in self.categories:
+            if features.matches(condition):
+                return category
+        return None
+
+    def match_assertion_label(self, features: "FeatureSet") -> Optional[str]:
+        for condition, label in self.assertion_labels:
+            if features.matches(condition):
+                return label
+        return None
+
+    def match_candidate_labels(self, features: "FeatureSet") -> List[str]:
+        """
+        All matching candidate labels in rule order (the defaults if none match).
+        """
+        labels = [label for condition, label in self.candidate_labels if features.matches(condition)]
+        return labels or list(self.default_candidate_labels)
+
+
+def _error_message_line(failure_text: str) -> str:
+    for line in failure_text.splitlines():
+        if line.startswith("Error Message:"):
+            return line.split("Error Message:", 1)[1].strip()
+    return ""
+
+
+class FeatureSet:
+    """
+    Keywords found in one failure, per scope. Scopes are lower-cased and
+    scanned lazily, and every keyword is looked up at most once, so the
+    consumers sharing a FeatureSet never repeat each other's work.
+    """
+
+    def __init__(
+        self,
+        rules: RuleSet,
+        failure_text: Optional[str] = None,
+        error_message: Optional[str] = None,
+        stack_trace: Optional[str] = None
+    ):
+        self.rules = rules
+        self._texts: Dict[str, str] = {}
+        if failure_text is not None:
+            message = _error_message_line(failure_text)
+            head = message
+            if "traceback" in message.lower():
+                head = message.split("Traceback", 1)[0].strip()
+            self._texts.update(message_line=message, message_head=head, failure=failure_text)
+        if error_message is not None:
+            self._texts["error"] = error_message
+            self._texts["combined"] = f"{error_message} {stack_trace}"
+        self._lowered: Dict[str, str] = {}
+        self._found: Dict[str, Optional[Set[int]]] = {}
+        self._checked: Dict[str, Dict[int, bool]] = {}
+
+    def text(self, scope: str) -> str:
+        """
+        Original (not lower-cased) text of a scope.
+        """
+        if scope not in self._texts:
+            raise ValueError(f"Scope '{scope}' is not available in this feature set")
+        return self._texts[scope]
+
+    def _lower(self, scope: str) -> str:
+        lowered = self._lowered.get(scope)
+        if lowered is None:
+            lowered = self._lowered[scope] = self.text(scope).lower()
+        return lowered
+
+    def has_any(self, scope: str, ids: tuple) -> bool:
+        """
+        True if any of the keyword ids occurs in the scope.
+        """
+        if scope not in self._found:
+            self._found[scope] = self.rules.scan(scope, self._lower(scope))
+        found = self._found[scope]
+        if found is not None:
+            return not found.isdisjoint(ids)
+
+        checked = self._checked.setdefault(scope, {})
+        keywords = self.rules.keywords
+        for keyword_id in ids:
+            present = checked.get(keyword_id)
+            if present is None:
+                present = checked[keyword_id] = keywords[keyword_id] in self._lower(scope)
+            if present:
+                return True
+        return False
+
+    def matches(self, condition: tuple) -> bool:
+        kind = condition[0]
+        if kind == "keywords":
+            return self.has_any(condition[1], condition[2])
+        if kind == "all":
+            return all(self.matches(item) for item in condition[1])
+        return any(self.matches(item) for item in condition[1])
+
+
+def load_rules(path: str = RULES_FILE) -> RuleSet:
+    """
+    Load and compile a rules file.
+
+    Raises:
+        OSError: If the file cannot be read
+        ValueError: If it is not valid JSON or contains an invalid rule
+    """
+    with open(path, encoding="utf-8") as f:
+        return RuleSet(json.load(f))
+
+
+_rules = load_rules()
+
+
+def get_rules() -> RuleSet:
+    return _rules
+
+
+def reload_rules(path: str = RULES_FILE) -> RuleSet:
+    """
+    Re-read the rules file (e.g. after adding matchers) and make it active.
+    """
+    global _rules
+    _rules = load_rules(path)
+    return _rules
+
+
+def extract_features(
+    failure_text: Optional[str] = None,
+    error_message: Optional[str] = None,
+    stack_trace: Optional[str] = None
+) -> FeatureSet:
+    """
+    Build the feature set of one failure with the active rules.
+
+    Args:
+        failure_text: Combined failure text (message_line, message_head, failure scopes)
+        error_message: Request error message (error and combined scopes)
+        stack_trace: Request stack trace (combined scope)
+    """
+    return FeatureSet(_rules, failure_text, error_message, stack_trace)
@@ -0,0 +1,220 @@
+"""
+Priority scheduling and bulkheads for the slow dependencies (Ollama, BERT).
+
+Each dependency gets its own bulkhead: a bounded number of concurrent calls,
+with waiting callers admitted strictly by priority class (then arrival order).
+Interactive single triage therefore overtakes queued bulk CI batches, and a
+flood of LLM work can never occupy more than its own slots.
+
+The priority of the current request is carried in a context variable, so it
+flows from the route into asyncio tasks and the service functions below it.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+PRIORITY_BACKGROUND = 20
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_BATCH: "batch",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# Concurrent calls allowed per dependency (CPU Ollama rarely benefits from more than a couple)
+OLLAMA_MAX_CONCURRENCY = max(1, int(os.environ.get("TRIAGE_OLLAMA_MAX_CONCURRENCY", "2")))
+BERT_MAX_CONCURRENCY = max(1, int(os.environ.get("TRIAGE_BERT_MAX_CONCURRENCY", "8")))
+
+_current_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    "triage_priority", default=PRIORITY_INTERACTIVE
+)
+
+
+def current_priority() -> int:
+    return _current_priority.get()
+
+
+@contextmanager
+def priority_scope(priority: int):
+    """
+    Run the enclosed code (and tasks created inside it) with the given priority class.
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def set_thread_priority(priority: int) -> None:
+    """
+    Set the priority for the rest of the current thread (used by background workers).
+    """
+    _current_priority.set(priority)
+
+
+class _SyncWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.cancelled = False
+
+    def grant(self, bulkhead: "Bulkhead") -> None:
+        self.event.set()
+
+
+class _AsyncWaiter:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.future = loop.create_future()
+        self.cancelled = False
+
+    def grant(self, bulkhead: "Bulkhead") -> None:
+        self.loop.call_soon_threadsafe(self._deliver, bulkhead)
+
+    def _deliver(self, bulkhead: "Bulkhead") -> None:
+        if self.future.done():
+            # Waiter was cancelled after the slot was handed over: pass it on
+            bulkhead._release()
+        else:
+            self.future.set_result(None)
+
+
+class _PriorityStats:
+    def __init__(self):
+        self.admitted = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float) -> None:
+        self.admitted += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+
+class Bulkhead:
+    """
+    Bounded, priority-ordered admission to one dependency.
+    Usable from threads (slot) and from asyncio code (async_slot).
+    """
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.name = name
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._active = 0
+        self._waiters: List[tuple] = []
+        self._seq = itertools.count()
+        self._stats: Dict[int, _PriorityStats] = {}
+
+    def _record(self, priority: int, wait: float) -> None:
+        self._stats.setdefault(priority, _PriorityStats()).record(wait)
+
+    def _try_acquire(self, priority: int, waiter) -> bool:
+        with self._lock:
+            if self._active < self.max_concurrency and not self._waiters:
+                self._active += 1
+                self._record(priority, 0.0)
+                return True
+            heapq.heappush(self._waiters, (priority, next(self._seq), time.monotonic(), waiter))
+            return False
+
+    def _release(self) -> None:
+        with self._lock:
+            while self._waiters and self._active <= self.max_concurrency:
+                priority, _, enqueued_at, waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                # Hand the slot straight to the next waiter (active count unchanged)
+                self._record(priority, time.monotonic() - enqueued_at)
+                waiter.grant(self)
+                return
+            self._active -= 1
+
+    def _cancel(self, waiter) -> None:
+        with self._lock:
+            waiter.cancelled = True
+
+    @contextmanager
+    def slot(self, priority: Optional[int] = None):
+        """
+        Hold one slot of this bulkhead for the enclosed (blocking) call.
+        """
+        priority = current_priority() if priority is None else priority
+        waiter = _SyncWaiter()
+        if not self._try_acquire(priority, waiter):
+            waiter.event.wait()
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def async_slot(self, priority: Optional[int] = None):
+        """
+        Async variant of slot(); waiting does not block the event loop.
+        """
+        priority = current_priority() if priority is None else priority
+        waiter = _AsyncWaiter(asyncio.get_running_loop())
+        if not self._try_acquire(priority, waiter):
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                self._cancel(waiter)
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # Slot was granted just before the cancellation landed
+                    self._release()
+                raise
+        try:
+            yield
+        finally:
+            self._release()
+
+    def configure(self, max_concurrency: int) -> None:
+        """
+        Change the concurrency limit at runtime (extra waiters are admitted at once).
+        """
+        with self._lock:
+            grow = max(0, max_concurrency - self.max_concurrency)
+            self.max_concurrency = max_concurrency
+            self._active += grow
+        for _ in range(grow):
+            self._release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued: Dict[str, int] = {}
+            for priority, _, _, waiter in self._waiters:
+                if not waiter.cancelled:
+                    name = PRIORITY_NAMES.get(priority, str(priority))
+                    queued[name] = queued.get(name, 0) + 1
+            now = time.monotonic()
+            oldest_wait = max((now - enqueued for _, _, enqueued, w in self._waiters if not w.cancelled), default=0.0)
+            by_priority = {
+                PRIORITY_NAMES.get(priority, str(priority)): {
+                    "admitted": s.admitted,
+                    "avg_wait_seconds": (s.total_wait / s.admitted) if s.admitted else 0.0,
+                    "max_wait_seconds": s.max_wait,
+                }
+                for priority, s in sorted(self._stats.items())
+            }
+            return {
+                "max_concurrency": self.max_concurrency,
+                "active": self._active,
+                "queue_depth": sum(queued.values()),
+                "queued_by_priority": queued,
+                "oldest_wait_seconds": oldest_wait,
+                "by_priority": by_priority,
+            }
+
+
+ollama_bulkhead = Bulkhead("ollama", OLLAMA_MAX_CONCURRENCY)
+bert_bulkhead = Bulkhead("bert", BERT_MAX_CONCURRENCY)
@@ -0,0 +1,289 @@
+"""
+Near-duplicate search over stored triage results (MinHash + LSH).
+
+Each result is reduced to a MinHash signature of the word 3-gram shingles of
+its normalized error message and stack trace (normalized like failure
+signatures, so timestamps, line numbers and paths do not matter). Signatures
+are split into bands; results sharing any band land in the same LSH bucket,
+so a lookup only compares against the bucket members, never all stored
+results. With 16 bands of 4 rows, pairs above ~0.5 Jaccard similarity are
+found with high probability.
+
+Results with identical signatures (the same failure seen again) share one
+entry, so a failure repeated thousands of times costs a lookup one
+comparison. The index follows the result store through its listeners.
+
+A new result's signature is computed once, by best_match() before it is
+stored, and carried on the result (SIGNATURE_FIELD, hex) so the store
+listener, the history bootstrap and other worker processes reuse it.
+"""
+import random
+import re
+import threading
+import zlib
+from array import array
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.services import storage_service
+from app.services.failure_signature import extract_error_message, normalize_failure_text
+
+
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 16
+LSH_ROWS = NUM_PERMUTATIONS // LSH_BANDS
+SHINGLE_SIZE = 3
+# Stack trace characters used (results store at most 3000)
+STACK_TRACE_CHARS = 3000
+# Default minimum estimated Jaccard similarity of a reported match
+MIN_SIMILARITY = 0.5
+BOOTSTRAP_PAGE_SIZE = 1000
+# Result field carrying the hex signature (None: no words to sign)
+SIGNATURE_FIELD = "minhash_signature"
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_rng = random.Random(20240611)  # fixed: signatures must be stable across restarts
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME)) for _ in range(NUM_PERMUTATIONS)
+]
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def _shingles(error_message: Optional[str], stack_trace: Optional[str]) -> Set[int]:
+    text = f"{normalize_failure_text(error_message)}\n{normalize_failure_text((stack_trace or '')[:STACK_TRACE_CHARS])}"
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)]
+    return {zlib.crc32(gram.encode("utf-8")) for gram in grams}
+
+
+def minhash(error_message: Optional[str], stack_trace: Optional[str]) -> Optional[bytes]:
+    """
+    MinHash signature (NUM_PERMUTATIONS 32-bit values, packed) of a failure;
+    None if it has no words at all.
+    """
+    hashes = _shingles(error_message, stack_trace)
+    if not hashes:
+        return None
+    signature = array("I", (
+        min((a * h + b) % _MERSENNE_PRIME for h in hashes) & _MAX_HASH
+        for a, b in _PERMUTATIONS
+    ))
+    return signature.tobytes()
+
+
+def record_minhash(record: dict) -> Optional[bytes]:
+    """
+    Signature of a stored (or about to be stored) triage result: the one it
+    carries, or computed from its error message and stack trace.
+    """
+    if SIGNATURE_FIELD in record:
+        carried = record[SIGNATURE_FIELD]
+        if carried is None:
+            return None
+        try:
+            signature = bytes.fromhex(carried)
+        except (TypeError, ValueError):
+            signature = b""
+        if len(signature) == NUM_PERMUTATIONS * 4:
+            return signature
+    return minhash(extract_error_message(record.get("raw_failure_text")), record.get("stack_trace"))
+
+
+def similarity(a: bytes, b: bytes) -> float:
+    """
+    Estimated Jaccard similarity of two signatures.
+    """
+    values_a = array("I")
+    values_a.frombytes(a)
+    values_b = array("I")
+    values_b.frombytes(b)
+    return sum(x == y for x, y in zip(values_a, values_b)) / NUM_PERMUTATIONS
+
+
+def _bands(signature: bytes) -> List[bytes]:
+    width = LSH_ROWS * 4
+    return [signature[i * width:(i + 1) * width] for i in range(LSH_BANDS)]
+
+
+class SimilarityIndex:
+    """
+    Thread-safe LSH index of result signatures.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._signature_of: Dict[str, bytes] = {}
+        # Result ids per distinct signature, oldest first
+        self._ids_of: Dict[bytes, Dict[str, None]] = {}
+        self._buckets: List[Dict[bytes, Set[bytes]]] = [{} for _ in range(LSH_BANDS)]
+
+    def add(self, result_id: str, signature: Optional[bytes]) -> None:
+        if signature is None:
+            return
+        with self._lock:
+            self._remove_locked(result_id)
+            self._signature_of[result_id] = signature
+            ids = self._ids_of.get(signature)
+            if ids is None:
+                ids = self._ids_of[signature] = {}
+                for buckets, band in zip(self._buckets, _bands(signature)):
+                    buckets.setdefault(band, set()).add(signature)
+            ids[result_id] = None
+
+    def _remove_locked(self, result_id: str) -> None:
+        signature = self._signature_of.pop(result_id, None)
+        if signature is None:
+            return
+        ids = self._ids_of[signature]
+        del ids[result_id]
+        if ids:
+            return
+        del self._ids_of[signature]
+        for buckets, band in zip(self._buckets, _bands(signature)):
+            members = buckets[band]
+            members.discard(signature)
+            if not members:
+                del buckets[band]
+
+    def remove(self, result_id: str) -> None:
+        with self._lock:
+            self._remove_locked(result_id)
+
+    def signature_of(self, result_id: str) -> Optional[bytes]:
+        with self._lock:
+            return self._signature_of.get(result_id)
+
+    def query(
+        self,
+        signature: Optional[bytes],
+        limit: int = 10,
+        min_similarity: float = MIN_SIMILARITY,
+        exclude_id: Optional[str] = None
+    ) -> List[Tuple[str, float]]:
+        """
+        Most similar indexed results, best first (newest first among equals).
+
+        Returns:
+            List of (result_id, estimated similarity)
+        """
+        if signature is None or limit <= 0:
+            return []
+        with self._lock:
+            candidates: Set[bytes] = set()
+            for buckets, band in zip(self._buckets, _bands(signature)):
+                members = buckets.get(band)
+                if members:
+                    candidates |= members
+            scored = sorted(
+                ((similarity(signature, candidate), candidate) for candidate in candidates),
+                key=lambda item: item[0],
+                reverse=True,
+            )
+            matches: List[Tuple[str, float]] = []
+            for score, candidate in scored:
+                if score < min_similarity:
+                    break
+                for result_id in reversed(self._ids_of[candidate]):
+                    if result_id == exclude_id:
+                        continue
+                    matches.append((result_id, score))
+                    if len(matches) >= limit:
+                        return matches
+            return matches
+
+    def on_storage_event(self, event: str, result_id: str, record: Optional[dict]) -> None:
+        if event == "stored" and record is not None:
+            self.add(result_id, record_minhash(record))
+        elif event in ("deleted", "evicted"):
+            # Updates (e.g. an enriched description) do not change the signature
+            self.remove(result_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "results": len(self._signature_of),
+                "distinct_signatures": len(self._ids_of),
+                "buckets": sum(len(buckets) for buckets in self._buckets),
+            }
+
+
+similarity_index = SimilarityIndex()
+
+_bootstrap: Optional[threading.Thread] = None
+
+
+def find_similar_results(
+    result_id: str,
+    limit: int = 10,
+    min_similarity: float = MIN_SIMILARITY
+) -> Optional[List[Tuple[dict, float]]]:
+    """
+    Stored results most similar to a stored result.
+
+    Returns:
+        List of (result, similarity), best first; None if result_id is unknown
+    """
+    signature = similarity_index.signature_of(result_id)
+    if signature is None:
+        record = storage_service.get_result(result_id)
+        if record is None:
+            return None
+        # e.g. stored by another worker process sharing the SQLite store
+        signature = record_minhash(record)
+
+    similar = []
+    for match_id, score in similarity_index.query(signature, limit, min_similarity, exclude_id=result_id):
+        match = storage_service.get_result(match_id)
+        if match is not None:
+            similar.append((match, score))
+    return similar
+
+
+def best_match(result: dict) -> Optional[Tuple[str, float]]:
+    """
+    (id, similarity) of the stored result closest to a new result, if any
+    reaches MIN_SIMILARITY.
+
+    The result's signature is set on it (SIGNATURE_FIELD), so indexing it once
+    stored costs no second MinHash. CPU-bound (milliseconds): async callers
+    should run it in a worker thread.
+    """
+    signature = record_minhash(result)
+    result[SIGNATURE_FIELD] = signature.hex() if signature is not None else None
+    matches = similarity_index.query(signature, limit=1)
+    return matches[0] if matches else None
+
+
+def _bootstrap_from_history() -> None:
+    indexed = 0
+    cursor = None
+    try:
+        while True:
+            results, cursor, _ = storage_service.query_results(limit=BOOTSTRAP_PAGE_SIZE, cursor=cursor)
+            for result in results:
+                similarity_index.add(result["id"], record_minhash(result))
+            indexed += len(results)
+            if cursor is None:
+                break
+    except Exception as e:
+        print(f"Similarity index bootstrap stopped: {e}")
+    print(f"Similarity index built from {indexed} stored triage result(s)")
+
+
+def start_similarity_index() -> None:
+    """
+    Follow result changes and index the existing history in the background.
+    """
+    global _bootstrap
+    storage_service.add_listener(similarity_index.on_storage_event)
+    if _bootstrap is None or not _bootstrap.is_alive():
+        _bootstrap = threading.Thread(target=_bootstrap_from_history, name="triage-similarity-bootstrap", daemon=True)
+        _bootstrap.start()
+
+
+def stop_similarity_index() -> None:
+    storage_service.remove_listener(similarity_index.on_storage_event)
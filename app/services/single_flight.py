@@ -0,0 +1,150 @@
+"""
+Single-flight coalescing of identical in-flight calls.
+
+When several callers ask for the same key at the same time, only the first one
+(the leader) runs the call; the others wait for it and share its result or
+exception. Works for both threads and asyncio tasks, which can wait on the same
+in-flight call.
+"""
+import asyncio
+import hashlib
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+
+def hash_key(*parts: Any) -> str:
+    """
+    Build a compact coalescing key from arbitrary (str-able) parts.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._lock = threading.Lock()
+
+    def add_async_waiter(self) -> "asyncio.Future":
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.done.is_set():
+                self._resolve(future)
+            else:
+                self._async_waiters.append((loop, future))
+        return future
+
+    def _resolve(self, future: "asyncio.Future") -> None:
+        if future.done():
+            return
+        if self.error is not None:
+            future.set_exception(self.error)
+        else:
+            future.set_result(self.result)
+
+    def finish(self, result: Any = None, error: Optional[BaseException] = None) -> None:
+        with self._lock:
+            self.result = result
+            self.error = error
+            self.done.set()
+            waiters, self._async_waiters = self._async_waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(self._resolve, future)
+
+    def outcome(self) -> Any:
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into one execution.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.coalesced = 0
+
+    def _join(self, key: str) -> Tuple[_Call, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                return call, False
+            call = _Call()
+            self._calls[key] = call
+            self.executions += 1
+            return call, True
+
+    def _forget(self, key: str, call: _Call) -> None:
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        """
+        Run fn() unless an identical call is already in flight; then wait for it.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            call.done.wait()
+            return call.outcome()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            self._forget(key, call)
+            call.finish(error=e)
+            raise
+        self._forget(key, call)
+        call.finish(result=result)
+        return result
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Async variant of do(). The leader's call runs in its own task, so a
+        cancelled leader does not cancel the work other callers are waiting on.
+        """
+        call, leader = self._join(key)
+        if not leader:
+            return await call.add_async_waiter()
+
+        task = asyncio.ensure_future(fn())
+
+        def _on_done(t: "asyncio.Task") -> None:
+            self._forget(key, call)
+            if t.cancelled():
+                call.finish(error=asyncio.CancelledError())
+            elif t.exception() is not None:
+                call.finish(error=t.exception())
+            else:
+                call.finish(result=t.result())
+
+        task.add_done_callback(_on_done)
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {
+            "in_flight": in_flight,
+            "executions": self.executions,
+            "coalesced": self.coalesced,
+        }
+
+
+ollama_flight = SingleFlight("ollama")
+bert_flight = SingleFlight("bert")
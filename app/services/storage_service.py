@@ -1,98 +1,953 @@
 """
-In-memory storage service for triage results.
+Storage service for triage results.
 Results are stored with unique IDs and can be retrieved via GET endpoints.
+
+The storage backend is pluggable:
+- "memory" (default): process-local dict, lost on restart
+- "sqlite": durable SQLite file in WAL mode, safe to share between several
+  uvicorn worker processes
+
+Select it with the TRIAGE_STORAGE_BACKEND environment variable
+(and TRIAGE_STORAGE_DB for the SQLite file path).
+
+Retention keeps the store at a predictable size: a maximum entry count and a
+maximum total size, plus an opt-in TTL (each disabled with 0; the TTL is off
+unless TRIAGE_STORAGE_TTL_SECONDS is set). Size limits are enforced
+on every store by the memory backend; a background sweeper thread expires old
+results and enforces the limits of both backends.
+
+The memory backend keeps the large text fields of each result zlib-compressed
+and only decompresses them when a result is read back.
+
+Other services can follow the stored results with add_listener(): they are
+told about every result stored, deleted or evicted by this process.
 """
+import base64
+import bisect
+import json
+import os
+import sqlite3
+import sys
+import threading
 import uuid
-from typing import Dict, List, Optional
-from datetime import datetime
+import zlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime, timedelta
+
+from app.services.metrics import stage_timer
+from app.utils.sqlite_utils import get_thread_connection
+
+
+STORAGE_BACKEND = os.environ.get("TRIAGE_STORAGE_BACKEND", "memory")
+STORAGE_DB_PATH = os.environ.get(
+    "TRIAGE_STORAGE_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "triage_results.db"),
+)
+
+# Retention limits (0 disables a limit)
+STORAGE_MAX_ENTRIES = int(os.environ.get("TRIAGE_STORAGE_MAX_ENTRIES", "50000"))
+STORAGE_MAX_BYTES = int(os.environ.get("TRIAGE_STORAGE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Opt-in: results are never deleted for their age alone unless this is set
+STORAGE_TTL_SECONDS = int(os.environ.get("TRIAGE_STORAGE_TTL_SECONDS", "0"))
+# Seconds between two runs of the retention sweeper
+STORAGE_SWEEP_INTERVAL = 60.0
+
+EVICTION_REASONS = ("ttl", "max_entries", "max_bytes")
+
+# Text fields kept compressed by the memory backend once they reach the threshold
+COMPRESSED_FIELDS = ("raw_failure_text", "stack_trace", "description")
+COMPRESS_MIN_CHARS = 512
+COMPRESS_LEVEL = 6
+
+_sweeper_stop = threading.Event()
+_sweeper: Optional[threading.Thread] = None
+
+# Result change events passed to listeners (with the new record for "stored" / "updated")
+LISTENER_EVENTS = ("stored", "updated", "deleted", "evicted")
+# Fields update_result() never changes
+IMMUTABLE_FIELDS = ("id", "created_at")
+_listeners: List[Callable[[str, str, Optional[dict]], None]] = []
+
+
+# Filters understood by query_results() / GET /triage
+RESULT_FILTERS = ("triage_label", "test_name", "error_file", "status", "created_after", "created_before")
+
+
+def _file_key(file_path: Optional[str]) -> Optional[str]:
+    """
+    Normalize an error file path to the file name used by the error_file filter
+    ("(/ci/tests/checkout.spec.js" -> "checkout.spec.js").
+    """
+    if not file_path:
+        return None
+    name = file_path.replace("\\", "/").rstrip("/").rsplit("/", 1)[-1]
+    return name.strip("()[]'\"") or None
+
+
+def _estimate_size(record: dict) -> int:
+    """
+    Approximate resident size of a stored result in bytes (the dict plus its values).
+    """
+    size = sys.getsizeof(record)
+    for value in record.values():
+        size += sys.getsizeof(value)
+    return size
+
+
+def _compress_record(record: dict) -> Tuple[dict, int, int]:
+    """
+    Replace large text fields with their zlib-compressed UTF-8 bytes.
+
+    Returns:
+        (packed record, original bytes of the compressed fields, their compressed bytes)
+    """
+    packed = dict(record)
+    raw_bytes = compressed_bytes = 0
+    for field in COMPRESSED_FIELDS:
+        value = record.get(field)
+        if not isinstance(value, str) or len(value) < COMPRESS_MIN_CHARS:
+            continue
+        encoded = value.encode("utf-8")
+        compressed = zlib.compress(encoded, COMPRESS_LEVEL)
+        if len(compressed) < len(encoded):
+            packed[field] = compressed
+            raw_bytes += len(encoded)
+            compressed_bytes += len(compressed)
+    return packed, raw_bytes, compressed_bytes
+
+
+def _expand_record(record: dict) -> dict:
+    """
+    Return a copy of a stored record with its compressed fields restored.
+    """
+    expanded = dict(record)
+    for field in COMPRESSED_FIELDS:
+        value = record.get(field)
+        if isinstance(value, bytes):
+            expanded[field] = zlib.decompress(value).decode("utf-8")
+    return expanded
+
+
+def _expiry_cutoff(ttl_seconds: int) -> Optional[str]:
+    """
+    created_at value below which results are expired (None when the TTL is disabled).
+    """
+    if ttl_seconds <= 0:
+        return None
+    return (datetime.now() - timedelta(seconds=ttl_seconds)).isoformat()
+
+
+def _matches(record: dict, filters: Dict[str, str]) -> bool:
+    if "triage_label" in filters and record.get("triage_label") != filters["triage_label"]:
+        return False
+    if "status" in filters and record.get("status") != filters["status"]:
+        return False
+    if "error_file" in filters and _file_key(record.get("error_file")) != _file_key(filters["error_file"]):
+        return False
+    if "test_name" in filters and not (record.get("test_name") or "").startswith(filters["test_name"]):
+        return False
+    created_at = record.get("created_at", "")
+    if "created_after" in filters and created_at < filters["created_after"]:
+        return False
+    if "created_before" in filters and created_at >= filters["created_before"]:
+        return False
+    return True
+
+
+class MemoryStorageBackend:
+    """
+    In-memory storage: {result_id: result_data}
+
+    Indexes kept next to the dict (updated on every store/delete):
+    - a sorted (created_at, id) key list: "latest" is O(1), time ranges and
+      keyset pages are a bisect away
+    - triage_label / error file / status -> set of ids
+    - a sorted (test_name, id) list for test name prefix lookups
+
+    A filtered query walks only the smallest matching index, so its cost follows
+    the number of candidates rather than the size of the store.
+
+    Retention bookkeeping: an estimated size per result and an LRU order
+    (lookups by ID count as use). Entry/size limits evict least recently used
+    results right away on store; TTL expiry walks the created_at order from the
+    oldest end, so both cost only the number of evicted results.
+
+    Stored records hold COMPRESSED_FIELDS as zlib bytes (see _compress_record);
+    every method returning results hands out expanded copies.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = STORAGE_MAX_ENTRIES,
+        max_bytes: int = STORAGE_MAX_BYTES,
+        ttl_seconds: int = STORAGE_TTL_SECONDS
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._storage: Dict[str, dict] = {}
+        self._sizes: Dict[str, int] = {}
+        self._lru: "OrderedDict[str, None]" = OrderedDict()
+        self._total_bytes = 0
+        self.evictions: Dict[str, int] = {reason: 0 for reason in EVICTION_REASONS}
+        # result_id -> (original, compressed) bytes of its compressed fields
+        self._compression: Dict[str, Tuple[int, int]] = {}
+        self._raw_text_bytes = 0
+        self._compressed_text_bytes = 0
+        self._order: List[Tuple[str, str]] = []
+        self._by_label: Dict[str, Set[str]] = {}
+        self._by_file: Dict[str, Set[str]] = {}
+        self._by_status: Dict[str, Set[str]] = {}
+        self._by_test_name: List[Tuple[str, str]] = []
+        # Job workers and the event loop write concurrently
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _key(record: dict) -> Tuple[str, str]:
+        return (record.get("created_at", ""), record["id"])
+
+    @staticmethod
+    def _sorted_insert(items: list, key: tuple) -> None:
+        # Results almost always arrive in created_at order: append is the common case
+        if not items or items[-1] <= key:
+            items.append(key)
+        else:
+            bisect.insort(items, key)
+
+    @staticmethod
+    def _sorted_remove(items: list, key: tuple) -> None:
+        index = bisect.bisect_left(items, key)
+        if index < len(items) and items[index] == key:
+            del items[index]
+
+    def _index(self, record: dict) -> None:
+        result_id = record["id"]
+        self._sorted_insert(self._order, self._key(record))
+        for index, value in (
+            (self._by_label, record.get("triage_label")),
+            (self._by_file, _file_key(record.get("error_file"))),
+            (self._by_status, record.get("status")),
+        ):
+            if value is not None:
+                index.setdefault(value, set()).add(result_id)
+        bisect.insort(self._by_test_name, (record.get("test_name") or "", result_id))
+
+    def _unindex(self, record: dict) -> None:
+        result_id = record["id"]
+        self._sorted_remove(self._order, self._key(record))
+        for index, value in (
+            (self._by_label, record.get("triage_label")),
+            (self._by_file, _file_key(record.get("error_file"))),
+            (self._by_status, record.get("status")),
+        ):
+            ids = index.get(value)
+            if ids is not None:
+                ids.discard(result_id)
+                if not ids:
+                    del index[value]
+        self._sorted_remove(self._by_test_name, (record.get("test_name") or "", result_id))
+
+    def _remove(self, result_id: str) -> Optional[dict]:
+        record = self._storage.pop(result_id, None)
+        if record is not None:
+            self._unindex(record)
+            self._total_bytes -= self._sizes.pop(result_id, 0)
+            self._lru.pop(result_id, None)
+            raw_bytes, compressed_bytes = self._compression.pop(result_id, (0, 0))
+            self._raw_text_bytes -= raw_bytes
+            self._compressed_text_bytes -= compressed_bytes
+        return record
+
+    def _over_limits(self) -> Optional[str]:
+        if self.max_entries > 0 and len(self._storage) > self.max_entries:
+            return "max_entries"
+        if self.max_bytes > 0 and self._total_bytes > self.max_bytes:
+            return "max_bytes"
+        return None
+
+    def _enforce_limits(self, keep: Optional[str] = None) -> List[str]:
+        evicted = []
+        reason = self._over_limits()
+        while reason is not None and self._lru:
+            result_id = next(iter(self._lru))
+            if result_id == keep:
+                # Never evict the result being stored (e.g. one larger than max_bytes)
+                if len(self._lru) == 1:
+                    break
+                self._lru.move_to_end(result_id)
+                continue
+            self._remove(result_id)
+            self.evictions[reason] += 1
+            evicted.append(result_id)
+            reason = self._over_limits()
+        return evicted
+
+    def store(self, result_id: str, record: dict) -> List[str]:
+        """
+        Store a result; returns the IDs evicted to stay within the limits.
+        """
+        # Compress outside the lock: it is the only CPU-heavy part of a store
+        packed = _compress_record(record)
+        with self._lock:
+            self._remove(result_id)
+            self._insert(result_id, *packed)
+            return self._enforce_limits(keep=result_id)
+
+    def _insert(self, result_id: str, record: dict, raw_bytes: int, compressed_bytes: int) -> None:
+        self._storage[result_id] = record
+        if raw_bytes:
+            self._compression[result_id] = (raw_bytes, compressed_bytes)
+            self._raw_text_bytes += raw_bytes
+            self._compressed_text_bytes += compressed_bytes
+        self._index(record)
+        size = _estimate_size(record)
+        self._sizes[result_id] = size
+        self._total_bytes += size
+        self._lru[result_id] = None
+
+    def update(self, result_id: str, changes: dict) -> Tuple[Optional[dict], List[str]]:
+        """
+        Merge changes into a stored result.
+
+        Returns:
+            (updated result or None if not found, IDs evicted to stay within the limits)
+        """
+        with self._lock:
+            # Read-modify-write under the lock (updates are rare, unlike stores)
+            record = self._storage.get(result_id)
+            if record is None:
+                return None, []
+            updated = {**_expand_record(record), **changes}
+            self._remove(result_id)
+            self._insert(result_id, *_compress_record(updated))
+            return updated, self._enforce_limits(keep=result_id)
+
+    def get(self, result_id: str) -> Optional[dict]:
+        with self._lock:
+            record = self._storage.get(result_id)
+            if record is None:
+                return None
+            self._lru.move_to_end(result_id)
+        return _expand_record(record)
+
+    def get_all(self) -> List[dict]:
+        # Newest first
+        with self._lock:
+            records = [self._storage[result_id] for _, result_id in reversed(self._order)]
+        return [_expand_record(record) for record in records]
+
+    def get_latest(self) -> Optional[dict]:
+        with self._lock:
+            if not self._order:
+                return None
+            record = self._storage[self._order[-1][1]]
+        return _expand_record(record)
+
+    def _test_name_ids(self, prefix: str) -> List[str]:
+        ids = []
+        index = bisect.bisect_left(self._by_test_name, (prefix, ""))
+        while index < len(self._by_test_name) and self._by_test_name[index][0].startswith(prefix):
+            ids.append(self._by_test_name[index][1])
+            index += 1
+        return ids
+
+    def query(
+        self,
+        filters: Dict[str, str],
+        limit: Optional[int],
+        before: Optional[Tuple[str, str]] = None
+    ) -> Tuple[List[dict], int]:
+        with self._lock:
+            candidates = []
+            if "triage_label" in filters:
+                candidates.append(self._by_label.get(filters["triage_label"], ()))
+            if "error_file" in filters:
+                candidates.append(self._by_file.get(_file_key(filters["error_file"]), ()))
+            if "status" in filters:
+                candidates.append(self._by_status.get(filters["status"], ()))
+            if "test_name" in filters:
+                candidates.append(self._test_name_ids(filters["test_name"]))
+
+            if candidates:
+                # Walk the most selective index and check the rest per candidate
+                smallest = min(candidates, key=len)
+                keys = sorted(
+                    self._key(self._storage[result_id])
+                    for result_id in smallest
+                    if _matches(self._storage[result_id], filters)
+                )
+                low, high = 0, len(keys)
+            else:
+                # Only a time range (or nothing): slice the created_at order directly
+                keys = self._order
+                low = bisect.bisect_left(keys, (filters["created_after"], "")) if "created_after" in filters else 0
+                high = bisect.bisect_left(keys, (filters["created_before"], "")) if "created_before" in filters else len(keys)
+                high = max(low, high)
+
+            total = high - low
+            end = high if before is None else max(low, min(high, bisect.bisect_left(keys, before)))
+            start = low if limit is None else max(low, end - limit)
+            records = [self._storage[result_id] for _, result_id in reversed(keys[start:end])]
+        return [_expand_record(record) for record in records], total
+
+    def delete(self, result_id: str) -> bool:
+        with self._lock:
+            return self._remove(result_id) is not None
+
+    def count(self) -> int:
+        return len(self._storage)
+
+    def sweep(self) -> List[str]:
+        """
+        Expire results older than the TTL and enforce the limits.
+
+        Returns:
+            IDs of the evicted results
+        """
+        evicted = []
+        cutoff = _expiry_cutoff(self.ttl_seconds)
+        with self._lock:
+            while cutoff is not None and self._order and self._order[0][0] < cutoff:
+                result_id = self._order[0][1]
+                self._remove(result_id)
+                self.evictions["ttl"] += 1
+                evicted.append(result_id)
+            evicted.extend(self._enforce_limits())
+        return evicted
+
+    def stats(self) -> dict:
+        with self._lock:
+            oldest = self._order[0][0] if self._order else None
+            return {
+                "backend": "memory",
+                "entries": len(self._storage),
+                "bytes": self._total_bytes,
+                "oldest_created_at": oldest,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evictions": dict(self.evictions),
+                "compression": {
+                    "compressed_results": len(self._compression),
+                    "original_bytes": self._raw_text_bytes,
+                    "compressed_bytes": self._compressed_text_bytes,
+                    "ratio": (
+                        self._raw_text_bytes / self._compressed_text_bytes
+                        if self._compressed_text_bytes else 1.0
+                    ),
+                },
+            }
+
+
+class SQLiteStorageBackend:
+    """
+    Durable storage in a SQLite file (WAL mode).
+
+    The full result is kept as JSON; the fields used for lookups are also kept
+    in their own indexed columns. Retention evicts the oldest results first
+    (tracking reads would turn every lookup into a write) and only runs in the
+    sweeper, so stores stay a single INSERT.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_entries: int = STORAGE_MAX_ENTRIES,
+        max_bytes: int = STORAGE_MAX_BYTES,
+        ttl_seconds: int = STORAGE_TTL_SECONDS
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evictions: Dict[str, int] = {reason: 0 for reason in EVICTION_REASONS}
+        conn = self._connect()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS triage_results (
+                id TEXT PRIMARY KEY,
+                created_at TEXT NOT NULL,
+                triage_label TEXT,
+                test_name TEXT,
+                error_file TEXT,
+                status TEXT,
+                data TEXT NOT NULL,
+                error_file_name TEXT
+            )
+            """
+        )
+        self._migrate(conn)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_created ON triage_results (created_at, id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_label ON triage_results (triage_label, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_test_name ON triage_results (test_name)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_error_file ON triage_results (error_file_name, created_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_results_status ON triage_results (status, created_at)")
+
+    @staticmethod
+    def _migrate(conn: sqlite3.Connection) -> None:
+        columns = {row["name"] for row in conn.execute("PRAGMA table_info(triage_results)")}
+        if "error_file_name" not in columns:
+            # Databases created before the error_file filter existed
+            conn.execute("DROP INDEX IF EXISTS idx_results_error_file")
+            conn.execute("ALTER TABLE triage_results ADD COLUMN error_file_name TEXT")
+            rows = conn.execute("SELECT id, error_file FROM triage_results").fetchall()
+            conn.executemany(
+                "UPDATE triage_results SET error_file_name = ? WHERE id = ?",
+                [(_file_key(row["error_file"]), row["id"]) for row in rows]
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return get_thread_connection(self.db_path)
+
+    def store(self, result_id: str, record: dict) -> List[str]:
+        self._connect().execute(
+            """
+            INSERT OR REPLACE INTO triage_results
+                (id, created_at, triage_label, test_name, error_file, status, data, error_file_name)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                result_id,
+                record.get("created_at", ""),
+                record.get("triage_label"),
+                record.get("test_name"),
+                record.get("error_file"),
+                record.get("status"),
+                json.dumps(record),
+                _file_key(record.get("error_file")),
+            )
+        )
+        return []
+
+    def update(self, result_id: str, changes: dict) -> Tuple[Optional[dict], List[str]]:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT data FROM triage_results WHERE id = ?", (result_id,)).fetchone()
+            if row is None:
+                conn.execute("ROLLBACK")
+                return None, []
+            record = {**json.loads(row["data"]), **changes}
+            conn.execute(
+                """
+                UPDATE triage_results
+                SET triage_label = ?, test_name = ?, error_file = ?, status = ?, data = ?, error_file_name = ?
+                WHERE id = ?
+                """,
+                (
+                    record.get("triage_label"),
+                    record.get("test_name"),
+                    record.get("error_file"),
+                    record.get("status"),
+                    json.dumps(record),
+                    _file_key(record.get("error_file")),
+                    result_id,
+                )
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # Size limits are enforced by the sweeper, as for stores
+        return record, []
+
+    def get(self, result_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT data FROM triage_results WHERE id = ?", (result_id,)
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
 
+    def get_all(self) -> List[dict]:
+        rows = self._connect().execute(
+            "SELECT data FROM triage_results ORDER BY created_at DESC, id DESC"
+        ).fetchall()
+        return [json.loads(row["data"]) for row in rows]
 
-# In-memory storage: {result_id: result_data}
-_storage: Dict[str, dict] = {}
+    def get_latest(self) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT data FROM triage_results ORDER BY created_at DESC, id DESC LIMIT 1"
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def query(
+        self,
+        filters: Dict[str, str],
+        limit: Optional[int],
+        before: Optional[Tuple[str, str]] = None
+    ) -> Tuple[List[dict], int]:
+        where, params = [], []
+        if "triage_label" in filters:
+            where.append("triage_label = ?")
+            params.append(filters["triage_label"])
+        if "status" in filters:
+            where.append("status = ?")
+            params.append(filters["status"])
+        if "error_file" in filters:
+            where.append("error_file_name = ?")
+            params.append(_file_key(filters["error_file"]))
+        if "test_name" in filters:
+            # Prefix match as an index-friendly range
+            where.append("test_name >= ? AND test_name < ?")
+            params.extend([filters["test_name"], filters["test_name"] + "\U0010ffff"])
+        if "created_after" in filters:
+            where.append("created_at >= ?")
+            params.append(filters["created_after"])
+        if "created_before" in filters:
+            where.append("created_at < ?")
+            params.append(filters["created_before"])
+
+        conn = self._connect()
+        where_sql = f"WHERE {' AND '.join(where)}" if where else ""
+        total = conn.execute(f"SELECT COUNT(*) FROM triage_results {where_sql}", params).fetchone()[0]
+
+        if before is not None:
+            where.append("(created_at < ? OR (created_at = ? AND id < ?))")
+            params.extend([before[0], before[0], before[1]])
+            where_sql = f"WHERE {' AND '.join(where)}"
+        sql = f"SELECT data FROM triage_results {where_sql} ORDER BY created_at DESC, id DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(limit)
+        rows = conn.execute(sql, params).fetchall()
+        return [json.loads(row["data"]) for row in rows], total
+
+    def delete(self, result_id: str) -> bool:
+        cursor = self._connect().execute("DELETE FROM triage_results WHERE id = ?", (result_id,))
+        return cursor.rowcount > 0
+
+    def count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM triage_results").fetchone()[0]
+
+    def _evict(self, conn: sqlite3.Connection, ids: List[str], reason: str) -> None:
+        conn.executemany("DELETE FROM triage_results WHERE id = ?", [(result_id,) for result_id in ids])
+        self.evictions[reason] += len(ids)
+
+    def sweep(self) -> List[str]:
+        """
+        Expire results older than the TTL and evict the oldest results beyond
+        the entry/size limits.
+
+        Returns:
+            IDs of the evicted results
+        """
+        evicted: List[str] = []
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            cutoff = _expiry_cutoff(self.ttl_seconds)
+            if cutoff is not None:
+                ids = [row["id"] for row in conn.execute(
+                    "SELECT id FROM triage_results WHERE created_at < ?", (cutoff,)
+                )]
+                self._evict(conn, ids, "ttl")
+                evicted.extend(ids)
+
+            if self.max_entries > 0:
+                excess = conn.execute("SELECT COUNT(*) FROM triage_results").fetchone()[0] - self.max_entries
+                if excess > 0:
+                    ids = [row["id"] for row in conn.execute(
+                        "SELECT id FROM triage_results ORDER BY created_at, id LIMIT ?", (excess,)
+                    )]
+                    self._evict(conn, ids, "max_entries")
+                    evicted.extend(ids)
+
+            if self.max_bytes > 0:
+                excess = conn.execute(
+                    "SELECT COALESCE(SUM(LENGTH(data)), 0) FROM triage_results"
+                ).fetchone()[0] - self.max_bytes
+                if excess > 0:
+                    ids = []
+                    for row in conn.execute(
+                        "SELECT id, LENGTH(data) AS size FROM triage_results ORDER BY created_at, id"
+                    ):
+                        if excess <= 0:
+                            break
+                        ids.append(row["id"])
+                        excess -= row["size"]
+                    self._evict(conn, ids, "max_bytes")
+                    evicted.extend(ids)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return evicted
+
+    def stats(self) -> dict:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(LENGTH(data)), 0) AS bytes, MIN(created_at) AS oldest "
+            "FROM triage_results"
+        ).fetchone()
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            "backend": "sqlite",
+            "entries": row["entries"],
+            "bytes": row["bytes"],
+            "file_bytes": page_count * page_size,
+            "oldest_created_at": row["oldest"],
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "ttl_seconds": self.ttl_seconds,
+            # Evictions made by this process's sweeper
+            "evictions": dict(self.evictions),
+        }
+
+
+def _create_backend(name: str):
+    if name == "memory":
+        return MemoryStorageBackend()
+    if name == "sqlite":
+        return SQLiteStorageBackend(STORAGE_DB_PATH)
+    raise ValueError(f"Unknown storage backend '{name}' (expected 'memory' or 'sqlite')")
+
+
+_backend = _create_backend(STORAGE_BACKEND)
+
+
+def set_backend(backend) -> None:
+    """
+    Replace the active storage backend (e.g. SQLiteStorageBackend("other.db")).
+    """
+    global _backend
+    _backend = backend
+
+
+def add_listener(listener: Callable[[str, str, Optional[dict]], None]) -> None:
+    """
+    Register listener(event, result_id, record) to be called after every result
+    change made through this module (event is one of LISTENER_EVENTS; record
+    is the new result for "stored" and "updated", None otherwise).
+    """
+    if listener not in _listeners:
+        _listeners.append(listener)
+
+
+def remove_listener(listener: Callable[[str, str, Optional[dict]], None]) -> None:
+    if listener in _listeners:
+        _listeners.remove(listener)
+
+
+def _notify(event: str, result_ids: List[str], record: Optional[dict] = None) -> None:
+    for listener in list(_listeners):
+        for result_id in result_ids:
+            try:
+                listener(event, result_id, record)
+            except Exception as e:
+                # A failing listener must never fail the storage operation
+                print(f"Storage listener failed on {event} {result_id}: {e}")
 
 
 def store_result(result: dict) -> str:
     """
     Store a triage result and return its unique ID.
-    
+
     Args:
         result: The triage result dictionary to store
-        
+
     Returns:
         The unique ID (UUID) assigned to this result
     """
     result_id = str(uuid.uuid4())
-    
+
     # Add metadata
     result_with_metadata = {
         **result,
         "id": result_id,
         "created_at": datetime.now().isoformat()
     }
-    
-    _storage[result_id] = result_with_metadata
+
+    with stage_timer("storage"):
+        evicted = _backend.store(result_id, result_with_metadata)
+    _notify("stored", [result_id], result_with_metadata)
+    _notify("evicted", evicted)
     return result_id
 
 
+def update_result(result_id: str, changes: dict) -> Optional[dict]:
+    """
+    Merge changes into a stored triage result (its id and created_at stay).
+
+    Args:
+        result_id: The unique ID of the result to update
+        changes: Fields to set
+
+    Returns:
+        The updated result if found, None otherwise
+    """
+    changes = {field: value for field, value in changes.items() if field not in IMMUTABLE_FIELDS}
+    updated, evicted = _backend.update(result_id, changes)
+    if updated is not None:
+        _notify("updated", [result_id], updated)
+    _notify("evicted", evicted)
+    return updated
+
+
 def get_result(result_id: str) -> Optional[dict]:
     """
     Retrieve a specific triage result by ID.
-    
+
     Args:
         result_id: The unique ID of the result to retrieve
-        
+
     Returns:
         The result dictionary if found, None otherwise
     """
-    return _storage.get(result_id)
+    return _backend.get(result_id)
 
 
 def get_all_results() -> List[dict]:
     """
     Retrieve all stored triage results.
-    
+
     Returns:
         List of all stored results, sorted by creation time (newest first)
     """
-    results = list(_storage.values())
-    # Sort by created_at timestamp, newest first
-    results.sort(key=lambda x: x.get("created_at", ""), reverse=True)
-    return results
+    return _backend.get_all()
+
+
+def encode_cursor(result: dict) -> str:
+    """
+    Build the opaque pagination cursor pointing just after `result`.
+    """
+    raw = json.dumps([result.get("created_at", ""), result["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a pagination cursor into its (created_at, id) key.
+
+    Raises:
+        ValueError: If the cursor is malformed
+    """
+    try:
+        created_at, result_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return str(created_at), str(result_id)
+    except Exception:
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def query_results(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    **filters: Optional[str]
+) -> Tuple[List[dict], Optional[str], int]:
+    """
+    Retrieve matching results, newest first, optionally one page at a time
+    (keyset pagination on created_at/id).
+
+    Args:
+        limit: Maximum number of results in the page (None for all matches)
+        cursor: Opaque cursor from a previous page (None for the first page)
+        **filters: Any of RESULT_FILTERS - exact triage_label / status,
+            error_file (matched on file name), test_name prefix,
+            created_after (inclusive) / created_before (exclusive) ISO timestamps
+
+    Returns:
+        (results, next_cursor, total_matches) - next_cursor is None on the last page
+
+    Raises:
+        ValueError: If the cursor is malformed or a filter is unknown
+    """
+    unknown = set(filters) - set(RESULT_FILTERS)
+    if unknown:
+        raise ValueError(f"Unknown filter(s): {', '.join(sorted(unknown))}")
+    active = {name: value for name, value in filters.items() if value is not None}
+
+    before = decode_cursor(cursor) if cursor else None
+    # Fetch one extra row to know whether another page exists
+    results, total = _backend.query(active, None if limit is None else limit + 1, before)
+    if limit is not None and len(results) > limit:
+        results = results[:limit]
+        return results, encode_cursor(results[-1]), total
+    return results, None, total
 
 
 def get_latest_result() -> Optional[dict]:
     """
     Retrieve the most recently created triage result.
-    
+
     Returns:
         The latest result dictionary if any exist, None otherwise
     """
-    results = get_all_results()
-    return results[0] if results else None
+    return _backend.get_latest()
 
 
 
 def delete_result(result_id: str) -> bool:
     """
     Delete a specific triage result by ID.
-    
+
     Args:
         result_id: The unique ID of the result to delete
-        
+
     Returns:
         True if deleted, False if not found
     """
-    if result_id in _storage:
-        del _storage[result_id]
-        return True
-    return False
+    deleted = _backend.delete(result_id)
+    if deleted:
+        _notify("deleted", [result_id])
+    return deleted
 
 
 def get_result_count() -> int:
     """
     Get the total number of stored results.
-    
+
     Returns:
         Count of stored results
     """
-    return len(_storage)
+    return _backend.count()
+
+
+def sweep_expired_results() -> int:
+    """
+    Run one retention pass (TTL expiry and entry/size limits) on the active backend.
+
+    Returns:
+        Number of evicted results
+    """
+    evicted = _backend.sweep()
+    _notify("evicted", evicted)
+    return len(evicted)
+
+
+def get_storage_stats() -> dict:
+    """
+    Current footprint of the result store (entries, estimated bytes, oldest
+    result), the retention limits and the eviction counts per reason.
+    """
+    return _backend.stats()
+
+
+def _sweeper_loop(interval: float) -> None:
+    while not _sweeper_stop.wait(interval):
+        try:
+            evicted = sweep_expired_results()
+            if evicted:
+                print(f"Result retention evicted {evicted} stored result(s)")
+        except Exception as e:
+            # Keep sweeping on the next tick (e.g. SQLite busy in another process)
+            print(f"Result retention sweep failed: {e}")
+
+
+def start_retention_sweeper(interval: float = STORAGE_SWEEP_INTERVAL) -> None:
+    """
+    Start the background thread that enforces result retention.
+    """
+    global _sweeper
+    if _sweeper is not None and _sweeper.is_alive():
+        return
+    _sweeper_stop.clear()
+    _sweeper = threading.Thread(target=_sweeper_loop, args=(interval,), name="triage-retention", daemon=True)
+    _sweeper.start()
+
+
+def stop_retention_sweeper(timeout: float = 5.0) -> None:
+    global _sweeper
+    _sweeper_stop.set()
+    if _sweeper is not None:
+        _sweeper.join(timeout)
+        _sweeper = None
@@ -1,98 +1,55 @@
-from typing import Any, Dict, Optional, List, Tuple
-import os
+from typing import Any, AsyncIterator, Dict, Optional, List, Set, Tuple
+import asyncio
+import contextvars
 
-from app.services.ollama_service import generate_bug_report
-from app.services.playwright_label_detector import detect_playwright_label
+from app.services import storage_service
+from app.services.failure_clustering import cluster_failures, member_description
+from app.services.failure_signature import compute_failure_signature, description_cache
+from app.services.metrics import stage_timer, timed_stage
+from app.services.ollama_service import (
+    generate_bug_report,
+    generate_bug_report_async,
+    stream_bug_description_async,
+    _heuristic_bug_title,
+    _templated_description,
+)
+from app.services.rule_engine import FeatureSet, extract_features
+from app.services.similarity_index import best_match
+from app.services.playwright_label_detector import (
+    detect_playwright_label,
+    detect_playwright_label_async,
+    _detect_playwright_assertion_type,
+)
+from app.services.scheduler import priority_scope, PRIORITY_BACKGROUND
 from app.schemas import FailureInput
 from app.utils.url_utils import format_file_url_with_line, extract_test_url_from_logs
+from app.utils.extraction import extract_failure_locations
+from app.utils.source_maps import resolve_failure_location
 
 
+# Upper bound on how many failures of one batch are triaged at the same time.
+# Each in-flight failure holds an Ollama generation, so this also caps LLM load.
+BATCH_MAX_CONCURRENCY = 8
 
+# description_status of a deferred result (process_failure_async(defer_description=True))
+DESCRIPTION_PENDING = "pending"
+DESCRIPTION_READY = "ready"
+DESCRIPTION_FAILED = "failed"
 
+# Background description generations, kept referenced until they finish
+_enrichment_tasks: Set["asyncio.Task"] = set()
 
-def _extract_error_message(failure_text: str) -> str:
-    for line in failure_text.splitlines():
-        if line.startswith("Error Message:"):
-            return line.split("Error Message:", 1)[1].strip()
-    return ""
 
-
-def _rule_based_category(failure_text: str) -> str:
+def _rule_based_category(failure_text: str, features: Optional[FeatureSet] = None) -> str:
     """
-    Basic rule-based triage using keywords in the failure text.
+    Basic rule-based triage using keywords in the failure text
+    ("categories" rules of the rule engine, first match wins).
     Returns one of: 'frontend_ui', 'backend_api', 'database',
     'performance', 'infrastructure', 'authentication', 'unknown'
     """
-    em = _extract_error_message(failure_text).lower()
-    full = failure_text.lower()
-
-    # Frontend / UI (Selenium, Playwright, React UI)
-    if (
-        "noselementexception" in em
-        or "unable to locate element" in em
-        or "selenium" in full
-        or "playwright" in full
-        or ("button" in full and "click" in full)
-        or "#edit-" in full
-        or "component" in full and ("render" in full or "props" in full)
-        or "cannot read properties of undefined" in em
-        or "cannot read property" in em
-    ):
-        return "frontend_ui"
-
-    # Database
-    if (
-        "psycopg2" in em
-        or "sql" in em
-        or "database" in em
-        or "connection timed out" in em
-        or ("timeout" in em and "query" in full)
-        or "deadlock" in full
-    ):
-        return "database"
-
-    # Authentication / auth
-    if (
-        "unauthorized" in em
-        or "forbidden" in em
-        or "authentication" in full
-        or "jwt" in full
-        or "token expired" in full
-    ):
-        return "authentication"
-
-    # Performance / timeout
-    if (
-        "timeout" in em
-        or "took too long" in full
-        or "slow response" in full
-        or "latency" in full
-    ):
-        return "performance"
-
-    # Backend / API
-    if (
-        "internal server error" in em
-        or "status code 500" in em
-        or "status code 5" in em
-        or "500" in em
-        or "api" in full
-        or "endpoint" in full
-        or "response code" in full
-    ):
-        return "backend_api"
-
-    # Infrastructure / network
-    if (
-        "connection refused" in em
-        or "host unreachable" in em
-        or "dns" in full
-        or "gateway" in full
-        or "service unavailable" in em
-    ):
-        return "infrastructure"
-
-    return "unknown"
+    if features is None:
+        features = extract_features(failure_text)
+    return features.rules.match_category(features) or "unknown"
 
 
 def _map_category_to_labels(category: str, labels: Optional[List[str]]) -> str:
@@ -131,8 +88,8 @@ def _map_category_to_labels(category: str, labels: Optional[List[str]]) -> str:
 
 
 
-def process_failure(payload: FailureInput) -> Dict[str, Any]:
-    failure_text = f"""
+def _build_failure_text(payload: FailureInput) -> str:
+    return f"""
 Test Name: {payload.test_name}
 File Path: {payload.file_path}
 Error Message: {payload.error_message}
@@ -140,144 +97,39 @@ Stack Trace: {payload.stack_trace}
 Logs: {payload.logs}
 """.strip()
 
-    # 1) Bug report via Ollama
-    try:
-        bug = generate_bug_report(payload.llm_model, failure_text)
-    except Exception as e:
-        bug = {
-            "title": "Bug Generation Error",
-            "description": f"Bug generator crashed: {str(e)}",
-        }
 
-    # 2) Extract extra structured fields INLINE
-    import os
-    import re
-    
-    # Extract error_line_number from stack trace using regex with FALLBACK logic
-    error_line_number = None
-    
-    # Try extracting from stack trace first
-    if payload.stack_trace:
-        # Try patterns: "line XXX", ":XXX:", ":XXX)", "at file.py:XXX"
-        line_match = re.search(r'line\s+(\d+)', payload.stack_trace, re.IGNORECASE)
-        if not line_match:
-            # Look for file.py:123 pattern (more specific)
-            line_match = re.search(r'\.(py|js|ts|jsx|tsx):(\d+)', payload.stack_trace)
-            if line_match:
-                error_line_number = int(line_match.group(2))
-        if not line_match:
-            line_match = re.search(r':(\d+)\)', payload.stack_trace)
-        if not line_match:
-            line_match = re.search(r'at\s+[^\s]+:(\d+)', payload.stack_trace)
-        if line_match and error_line_number is None:
-            error_line_number = int(line_match.group(1))
-    
-    # FALLBACK 1: Try extracting from error_message if stack trace didn't work
-    if error_line_number is None and payload.error_message:
-        line_match = re.search(r'line\s+(\d+)', payload.error_message, re.IGNORECASE)
-        if not line_match:
-            # Look for file.py:123 pattern
-            line_match = re.search(r'\.(py|js|ts|jsx|tsx):(\d+)', payload.error_message)
-            if line_match:
-                error_line_number = int(line_match.group(2))
-        if not line_match:
-            line_match = re.search(r':(\d+)\)', payload.error_message)
-        if line_match and error_line_number is None:
-            error_line_number = int(line_match.group(1))
-    
-    # FALLBACK 2: Try extracting from logs if still not found (but avoid timestamps)
-    if error_line_number is None and payload.logs:
-        # Only look for "line XXX" pattern in logs to avoid timestamp confusion
-        line_match = re.search(r'line\s+(\d+)', payload.logs, re.IGNORECASE)
-        if line_match:
-            error_line_number = int(line_match.group(1))
-    
-    # Validate extracted line number (should be reasonable, not from timestamp)
-    if error_line_number is not None and error_line_number > 10000:
-        error_line_number = None  # Likely a false positive
-    
-    # FALLBACK 3: Default to line 1 if still not found (ALWAYS populate)
+def _extract_structured_fields(payload: FailureInput) -> Dict[str, Any]:
+    """
+    Extract error line, error file, script link and test URL from the raw failure.
+    """
+    error_line_number, error_file_path = extract_failure_locations(
+        payload.stack_trace, payload.error_message, payload.logs
+    )
+
+    # Default to line 1 if nothing was found (ALWAYS populate)
     if error_line_number is None:
         error_line_number = 1
-    
-    # Extract error_file_path from stack trace with FALLBACK logic
-    error_file_path = None
-    
-    # Try extracting from stack trace first
-    if payload.stack_trace:
-        # PRIORITY 1: Look for test files specifically (test_*.py, *_test.py, *.spec.js, *.test.js)
-        test_file_match = re.search(r'(test_[^\s]+\.(?:py|js|ts)|[^\s]+_test\.(?:py|js|ts)|[^\s]+\.spec\.(?:js|ts)|[^\s]+\.test\.(?:js|ts))', payload.stack_trace, re.IGNORECASE)
-        if test_file_match:
-            error_file_path = test_file_match.group(1)
-        
-        # PRIORITY 2: Look for File "path" pattern
-        if not error_file_path:
-            file_match = re.search(r'File\s+"([^"]+)"', payload.stack_trace)
-            if file_match:
-                error_file_path = file_match.group(1)
-        
-        # PRIORITY 3: Look for "at file.py:line" pattern
-        if not error_file_path:
-            file_match = re.search(r'at\s+([^\s:]+\.(?:py|js|ts|spec\.js|spec\.ts))', payload.stack_trace)
-            if file_match:
-                error_file_path = file_match.group(1)
-        
-        # PRIORITY 4: Generic file pattern (but avoid __init__.py)
-        if not error_file_path:
-            # Find all matching files
-            all_files = re.findall(r'([^\s]+\.(?:py|js|ts|jsx|tsx|spec\.js|spec\.ts))', payload.stack_trace)
-            # Filter out __init__.py and prioritize test files
-            for file in all_files:
-                if '__init__.py' not in file:
-                    error_file_path = file
-                    break
-    
-    # FALLBACK 1: Try extracting from error_message if stack trace didn't work
-    if not error_file_path and payload.error_message:
-        # Look for test files first
-        test_file_match = re.search(r'(test_[^\s]+\.(?:py|js|ts)|[^\s]+_test\.(?:py|js|ts)|[^\s]+\.spec\.(?:js|ts))', payload.error_message, re.IGNORECASE)
-        if test_file_match:
-            error_file_path = test_file_match.group(1)
-        
-        if not error_file_path:
-            file_match = re.search(r'File\s+"([^"]+)"', payload.error_message)
-            if not file_match:
-                file_match = re.search(r'([^\s]+\.(?:py|js|ts|jsx|tsx|spec\.js|spec\.ts))', payload.error_message)
-            if file_match:
-                error_file_path = file_match.group(1)
-    
-    # FALLBACK 2: Try extracting from logs if still not found
-    if not error_file_path and payload.logs:
-        # Look for test files first
-        test_file_match = re.search(r'(test_[^\s]+\.(?:py|js|ts)|[^\s]+_test\.(?:py|js|ts)|[^\s]+\.spec\.(?:js|ts))', payload.logs, re.IGNORECASE)
-        if test_file_match:
-            error_file_path = test_file_match.group(1)
-        
-        if not error_file_path:
-            file_match = re.search(r'File\s+"([^"]+)"', payload.logs)
-            if not file_match:
-                file_match = re.search(r'([^\s]+\.(?:py|js|ts|jsx|tsx|spec\.js|spec\.ts))', payload.logs)
-            if file_match:
-                error_file_path = file_match.group(1)
-    
-    # FALLBACK 3: Use file_path from payload if still not found
+
+    # Use file_path from payload if nothing was found in the failure text
     if not error_file_path and payload.file_path:
         error_file_path = payload.file_path
     
-    # FALLBACK 4: Use test_name as file path if everything else failed (ALWAYS populate)
+    # Use test_name as file path if everything else failed (ALWAYS populate)
     if not error_file_path:
         if payload.test_name:
             error_file_path = f"{payload.test_name}.unknown"
         else:
             error_file_path = "unknown_test_file"
+
+    # Optional: map transpiled locations back to the original sources (.map files)
+    if payload.resolve_source_maps:
+        original = resolve_failure_location(payload.stack_trace, error_file_path, error_line_number)
+        if original is not None:
+            error_file_path, error_line_number = original
     
     # Truncate stack_trace to max 3000 characters
     stack_trace_truncated = payload.stack_trace[:3000] if payload.stack_trace else None
     
-    # Extract bug title and description for return
-    bug_title = bug.get("title", "No title")
-    bug_description = bug.get("description", "No description")
-    
     # Convert file path to clickable URL with line number anchor
     # Use playwright_script_url from payload if provided, otherwise auto-generate
     if payload.playwright_script_url:
@@ -297,24 +149,381 @@ Logs: {payload.logs}
     elif payload.error_message:
         test_url = extract_test_url_from_logs(payload.error_message)
     
-    # Generate intelligent triage label using BERT classification
-    triage_label = detect_playwright_label(
-        error_message=payload.error_message,
-        stack_trace=payload.stack_trace,
-        failure_text=failure_text,
-        bert_url=payload.bert_url
-    )
-
     return {
+        "error_line": error_line_number,
+        "error_file_path": error_file_path,
+        "stack_trace": stack_trace_truncated,
+        "playwright_script": playwright_script_url,
+        "test_url": test_url,
+    }
+
+
+async def _extract_structured_fields_async(payload: FailureInput) -> Dict[str, Any]:
+    # Source map lookups touch the filesystem (and may parse a large map): keep them off the event loop
+    if payload.resolve_source_maps:
+        return await asyncio.to_thread(_extract_structured_fields, payload)
+    return _extract_structured_fields(payload)
+
+
+def _assemble_result(
+    payload: FailureInput,
+    failure_text: str,
+    bug: Dict[str, Any],
+    fields: Dict[str, Any],
+    label: Tuple[str, str],
+    signature: str
+) -> Dict[str, Any]:
+    # Extract bug title and description for return
+    bug_title = bug.get("title", "No title")
+    bug_description = bug.get("description", "No description")
+    triage_label, label_source = label
+
+    result = {
         "title": bug_title,
         "description": bug_description,
         "raw_failure_text": failure_text,
-        "stack_trace": stack_trace_truncated,
+        "stack_trace": fields["stack_trace"],
         "status": "failed",
-        "error_line": error_line_number,
-        "playwright_script": playwright_script_url,
-        "test_url": test_url,
+        "error_line": fields["error_line"],
+        "playwright_script": fields["playwright_script"],
+        "test_url": fields["test_url"],
         "playwright_script_endpoint": payload.playwright_script_endpoint,
         "triage_label": triage_label,
+        "label_source": label_source,
+        "failure_signature": signature,
+        "test_name": payload.test_name,
+        "error_file": fields["error_file_path"],
+    }
+    return result
+
+
+def _attach_best_match(result: Dict[str, Any]) -> Dict[str, Any]:
+    # Closest previously stored failure ("have we seen this before?")
+    with stage_timer("similarity"):
+        match = best_match(result)
+    result["similar_result_id"], result["similarity"] = match if match else (None, None)
+    return result
+
+
+def process_failure(payload: FailureInput) -> Dict[str, Any]:
+    with stage_timer("features"):
+        failure_text = _build_failure_text(payload)
+        signature = compute_failure_signature(payload.error_message, payload.stack_trace)
+        # One keyword scan shared by the title and label heuristics
+        features = extract_features(failure_text, payload.error_message, payload.stack_trace)
+
+    # 1) Bug report via Ollama (reused for repeat failure signatures)
+    try:
+        with stage_timer("description"):
+            bug = generate_bug_report(payload.llm_model, failure_text, signature=signature, features=features)
+    except Exception as e:
+        bug = {
+            "title": "Bug Generation Error",
+            "description": f"Bug generator crashed: {str(e)}",
+        }
+
+    # 2) Extract extra structured fields
+    with stage_timer("extraction"):
+        fields = _extract_structured_fields(payload)
+
+    # 3) Generate intelligent triage label using BERT classification
+    with stage_timer("label"):
+        label = detect_playwright_label(
+            error_message=payload.error_message,
+            stack_trace=payload.stack_trace,
+            failure_text=failure_text,
+            bert_url=payload.bert_url,
+            features=features
+        )
+
+    return _attach_best_match(_assemble_result(payload, failure_text, bug, fields, label, signature))
+
+
+async def _cluster_bug_report(
+    cluster_report: "asyncio.Future",
+    payload: FailureInput,
+    failure_text: str,
+    features: FeatureSet
+) -> Dict[str, Any]:
+    # shield(): a member giving up must not cancel the generation its cluster shares
+    report = await asyncio.shield(cluster_report)
+    return {
+        "title": _heuristic_bug_title(failure_text, features),
+        "description": report["description"],
+        # Written for the cluster's first member: process_failure_async adds this member's header
+        "cluster_test_name": report.get("test_name"),
     }
 
+
+async def _deferred_bug_report(
+    payload: FailureInput,
+    failure_text: str,
+    signature: str,
+    features: FeatureSet
+) -> Dict[str, Any]:
+    cached = description_cache.get(payload.llm_model, signature)
+    if cached is not None:
+        return {**cached, "description_status": DESCRIPTION_READY}
+    title = _heuristic_bug_title(failure_text, features)
+    description = _templated_description(
+        failure_text,
+        title,
+        features,
+        assertion_type=_detect_playwright_assertion_type(payload.error_message, features),
+        test_url=payload.test_url,
+        note=None,
+    )
+    return {"title": title, "description": description, "description_status": DESCRIPTION_PENDING}
+
+
+async def process_failure_async(
+    payload: FailureInput,
+    cluster_report: Optional["asyncio.Future"] = None,
+    defer_description: bool = False
+) -> Dict[str, Any]:
+    """
+    Async triage pipeline: the Ollama generation and the BERT classification
+    start at the same moment, so latency is max(LLM, BERT) instead of their sum.
+
+    Args:
+        payload: Failure to triage
+        cluster_report: Bug report generated once for the failure's whole
+            cluster (batch triage). Its description is used instead of
+            generating one, under a header with this failure's own test name
+            and error location; the title is still this failure's own.
+        defer_description: Skip the LLM: the result gets a templated
+            description and description_status "pending" (or the cached
+            description and "ready"). Store it, then call
+            schedule_description_enrichment().
+    """
+    with stage_timer("features"):
+        failure_text = _build_failure_text(payload)
+        signature = compute_failure_signature(payload.error_message, payload.stack_trace)
+        # One keyword scan shared by the title and label heuristics
+        features = extract_features(failure_text, payload.error_message, payload.stack_trace)
+
+    if defer_description:
+        bug_report = _deferred_bug_report(payload, failure_text, signature, features)
+    elif cluster_report is None:
+        bug_report = generate_bug_report_async(payload.llm_model, failure_text, signature=signature, features=features)
+    else:
+        bug_report = _cluster_bug_report(cluster_report, payload, failure_text, features)
+    bug_task = asyncio.ensure_future(timed_stage("description", bug_report))
+    label_task = asyncio.ensure_future(timed_stage("label", detect_playwright_label_async(
+        error_message=payload.error_message,
+        stack_trace=payload.stack_trace,
+        failure_text=failure_text,
+        bert_url=payload.bert_url,
+        features=features
+    )))
+
+    try:
+        # Regex extraction runs while both network calls are in flight
+        with stage_timer("extraction"):
+            fields = await _extract_structured_fields_async(payload)
+    except BaseException:
+        bug_task.cancel()
+        label_task.cancel()
+        raise
+
+    bug, label = await asyncio.gather(bug_task, label_task, return_exceptions=True)
+    if isinstance(bug, BaseException):
+        bug = {
+            "title": "Bug Generation Error",
+            "description": f"Bug generator crashed: {str(bug)}",
+        }
+    elif cluster_report is not None:
+        bug["description"] = member_description(
+            bug["description"],
+            payload.test_name,
+            fields["error_file_path"],
+            fields["error_line"],
+            representative_test=bug.get("cluster_test_name"),
+        )
+    if isinstance(label, BaseException):
+        raise label
+
+    # Pure-Python MinHash: off the event loop
+    result = await asyncio.to_thread(
+        _attach_best_match, _assemble_result(payload, failure_text, bug, fields, label, signature)
+    )
+    if "description_status" in bug:
+        result["description_status"] = bug["description_status"]
+    return result
+
+
+async def _enrich_description(result_id: str, payload: FailureInput) -> None:
+    failure_text = _build_failure_text(payload)
+    signature = compute_failure_signature(payload.error_message, payload.stack_trace)
+    features = extract_features(failure_text, payload.error_message, payload.stack_trace)
+    # Interactive triage goes first for the Ollama slots
+    with priority_scope(PRIORITY_BACKGROUND):
+        try:
+            bug = await generate_bug_report_async(
+                payload.llm_model, failure_text, signature=signature, features=features, fallback=False
+            )
+            changes = {"description": bug["description"], "description_status": DESCRIPTION_READY}
+        except Exception as e:
+            # The templated description stays
+            print(f"Description enrichment of result {result_id} failed: {e}")
+            changes = {"description_status": DESCRIPTION_FAILED}
+    if await asyncio.to_thread(storage_service.update_result, result_id, changes) is None:
+        print(f"Description enrichment of result {result_id} dropped: result no longer stored")
+
+
+def schedule_description_enrichment(result_id: str, payload: FailureInput) -> None:
+    """
+    Generate the LLM description of a stored deferred result in the background;
+    it replaces the templated description (description_status "ready") when
+    done, or leaves it with description_status "failed".
+
+    Must be called from the event loop. Enrichments still running at shutdown
+    are lost (their results keep the templated description, status "pending").
+    """
+    # Fresh context: the enrichment outlives the request (and its timing collector)
+    task = contextvars.Context().run(asyncio.get_running_loop().create_task, _enrich_description(result_id, payload))
+    _enrichment_tasks.add(task)
+    task.add_done_callback(_enrichment_tasks.discard)
+
+
+def pending_enrichments() -> int:
+    return len(_enrichment_tasks)
+
+
+async def stream_failure_async(payload: FailureInput) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming triage pipeline, yielding (event, data) pairs as soon as each part is known:
+
+    - "title", "error_line", "test_url": immediately (heuristics + regex extraction)
+    - "triage_label": as soon as the BERT classification finishes
+    - "description": sanitized description chunks while Ollama generates them
+    - "result": the complete result dict (not yet stored), always last
+    """
+    with stage_timer("features"):
+        failure_text = _build_failure_text(payload)
+        signature = compute_failure_signature(payload.error_message, payload.stack_trace)
+        # One keyword scan shared by the title and label heuristics
+        features = extract_features(failure_text, payload.error_message, payload.stack_trace)
+
+    label_task = asyncio.ensure_future(timed_stage("label", detect_playwright_label_async(
+        error_message=payload.error_message,
+        stack_trace=payload.stack_trace,
+        failure_text=failure_text,
+        bert_url=payload.bert_url,
+        features=features
+    )))
+    description_stream = stream_bug_description_async(
+        payload.llm_model, failure_text, signature=signature, features=features
+    )
+    next_chunk = None
+
+    try:
+        title = _heuristic_bug_title(failure_text, features)
+        with stage_timer("extraction"):
+            fields = await _extract_structured_fields_async(payload)
+
+        yield "title", {"title": title}
+        yield "error_line", {"error_line": fields["error_line"], "playwright_script": fields["playwright_script"]}
+        yield "test_url", {"test_url": fields["test_url"]}
+
+        # Interleave the label with description chunks, whichever is ready first
+        parts = []
+        label_sent = False
+        next_chunk = asyncio.ensure_future(anext(description_stream))
+        while True:
+            waiting = {next_chunk} if label_sent else {next_chunk, label_task}
+            done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+            if not label_sent and label_task in done:
+                label_sent = True
+                yield "triage_label", {"triage_label": label_task.result()[0]}
+
+            if next_chunk in done:
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                parts.append(chunk)
+                yield "description", {"text": chunk}
+                next_chunk = asyncio.ensure_future(anext(description_stream))
+
+        label = await label_task
+        if not label_sent:
+            yield "triage_label", {"triage_label": label[0]}
+
+        bug = {"title": title, "description": "".join(parts)}
+        yield "result", await asyncio.to_thread(
+            _attach_best_match, _assemble_result(payload, failure_text, bug, fields, label, signature)
+        )
+    finally:
+        # Client went away or something failed: stop the in-flight calls
+        if next_chunk is not None and not next_chunk.done():
+            next_chunk.cancel()
+        if not label_task.done():
+            label_task.cancel()
+        await description_stream.aclose()
+
+
+async def process_failures_batch(
+    payloads: List[FailureInput],
+    max_concurrency: Optional[int] = None
+) -> List[Tuple[Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Run process_failure_async for many failures with bounded concurrency.
+
+    Failures are first grouped by probable root cause (failure_clustering):
+    each cluster gets one LLM generation, from its first member, and every
+    member result carries the cluster's `cluster_id`.
+
+    Args:
+        payloads: Failures to triage
+        max_concurrency: Optional cap on in-flight failures and on in-flight
+            LLM generations (defaults to BATCH_MAX_CONCURRENCY)
+
+    Returns:
+        One (result, error) tuple per payload, in input order.
+        Exactly one of the two is set for every item.
+    """
+    if not payloads:
+        return []
+
+    limit = max(1, min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    # Separate pools: members waiting for their cluster's description must not
+    # hold the slots the generations themselves need
+    semaphore = asyncio.Semaphore(limit)
+    generation_semaphore = asyncio.Semaphore(limit)
+
+    clusters = cluster_failures(payloads)
+    cluster_of = {index: cluster_id for cluster_id, members in clusters.items() for index in members}
+
+    async def _generate(representative: FailureInput) -> Dict[str, Any]:
+        async with generation_semaphore:
+            failure_text = _build_failure_text(representative)
+            report = await generate_bug_report_async(
+                representative.llm_model,
+                failure_text,
+                signature=compute_failure_signature(representative.error_message, representative.stack_trace),
+                features=extract_features(failure_text, representative.error_message, representative.stack_trace),
+            )
+            return {**report, "test_name": representative.test_name}
+
+    reports = {
+        cluster_id: asyncio.ensure_future(_generate(payloads[members[0]]))
+        for cluster_id, members in clusters.items()
+    }
+
+    async def _run(index: int, payload: FailureInput) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+        cluster_id = cluster_of[index]
+        async with semaphore:
+            try:
+                result = await process_failure_async(payload, cluster_report=reports[cluster_id])
+            except Exception as e:
+                return None, str(e)
+        result["cluster_id"] = cluster_id
+        return result, None
+
+    try:
+        return list(await asyncio.gather(*(_run(i, p) for i, p in enumerate(payloads))))
+    finally:
+        for report in reports.values():
+            report.cancel()
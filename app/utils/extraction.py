@@ -0,0 +1,251 @@
+"""
+Extraction of the error line, error file and test URL from failure text.
+
+All patterns are compiled once. The scans are arranged so that their cost stays
+linear in the size of the input, even for multi-megabyte logs:
+- case-insensitive patterns run case-sensitively on a lower-cased copy of the
+  text (made once per field, ASCII only so that offsets are unchanged), which
+  keeps the regex engine's fast literal-prefix search
+- patterns led by [^\\s]+ are anchored at token starts (they can only first
+  match there) and start at the line of the first literal they require,
+  instead of retrying the whole token from every character
+- a field without any "http" is not scanned for URLs at all
+
+The priority and fallback order (stack trace, then error message, then logs;
+the first pattern that matches anywhere wins) is the same as the original
+inline regex chains in triage_service.
+"""
+import re
+from typing import List, Optional, Pattern, Tuple
+
+
+# Larger "line numbers" are almost always timestamps or ids
+MAX_ERROR_LINE = 10000
+
+
+class _CIPattern:
+    """
+    A case-insensitive pattern: a lower-case variant for lowered ASCII text and
+    an IGNORECASE variant for everything else.
+    """
+
+    def __init__(self, pattern: str):
+        self.lower = re.compile(pattern)
+        self.ignorecase = re.compile(pattern, re.IGNORECASE)
+
+
+class _Field:
+    """
+    One input field (stack trace, error message or logs) prepared for scanning.
+    """
+
+    __slots__ = ("text", "lower")
+
+    def __init__(self, text: Optional[str]):
+        self.text = text or ""
+        # Lower-casing non-ASCII text can change offsets ("İ" -> "i̇")
+        self.lower = self.text.lower() if self.text.isascii() else None
+
+    def search_ci(self, pattern: _CIPattern, pos: int = 0) -> Optional[re.Match]:
+        if self.lower is not None:
+            return pattern.lower.search(self.lower, pos)
+        return pattern.ignorecase.search(self.text, pos)
+
+    def group(self, match: re.Match, group: int = 1) -> str:
+        # Spans of matches on the lowered copy index the original text too
+        return self.text[match.start(group):match.end(group)]
+
+    def find_first_ci(self, literals: Tuple[str, ...]) -> int:
+        """
+        Offset of the first of the (lower-case) literals, -1 if none occurs.
+        Without a lowered copy, returns 0 (scan everything).
+        """
+        if self.lower is None:
+            return 0
+        return _find_first(self.lower, literals)
+
+    def line_start(self, offset: int) -> int:
+        return self.text.rfind("\n", 0, offset) + 1
+
+
+def _find_first(text: str, literals: Tuple[str, ...]) -> int:
+    positions = [p for p in (text.find(literal) for literal in literals) if p >= 0]
+    return min(positions) if positions else -1
+
+
+# --- Error line --------------------------------------------------------------
+
+_LINE_WORD = _CIPattern(r'line\s+(\d+)')
+_LINE_EXT_RE = re.compile(r'\.(py|js|ts|jsx|tsx):(\d+)')
+_LINE_PAREN_RE = re.compile(r':(\d+)\)')
+_LINE_AT_RE = re.compile(r'at\s+[^\s]+:(\d+)')
+
+
+def _line_from_field(field: _Field, deep: bool) -> Optional[int]:
+    """
+    "line N", then "file.ext:N", then ":N)" (then "at x:N" when deep).
+    """
+    match = field.search_ci(_LINE_WORD)
+    if match:
+        return int(match.group(1))
+    match = _LINE_EXT_RE.search(field.text)
+    if match:
+        return int(match.group(2))
+    match = _LINE_PAREN_RE.search(field.text)
+    if match:
+        return int(match.group(1))
+    if deep:
+        match = _LINE_AT_RE.search(field.text)
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def _extract_error_line(stack_trace: _Field, error_message: _Field, logs: _Field) -> Optional[int]:
+    line = None
+    if stack_trace.text:
+        line = _line_from_field(stack_trace, deep=True)
+    if line is None and error_message.text:
+        line = _line_from_field(error_message, deep=False)
+    if line is None and logs.text:
+        # Only "line N" in logs, to avoid timestamps
+        match = logs.search_ci(_LINE_WORD)
+        if match:
+            line = int(match.group(1))
+    if line is not None and line > MAX_ERROR_LINE:
+        return None
+    return line
+
+
+# --- Error file --------------------------------------------------------------
+
+# Test files (test_*.py, *_test.py, *.spec.js, *.test.js); all but the first
+# alternative start with [^\s]+ and can only first match at a token start
+_TEST_FILE_FULL = _CIPattern(
+    r'(test_[^\s]+\.(?:py|js|ts)|(?<!\S)(?:[^\s]+_test\.(?:py|js|ts)|[^\s]+\.spec\.(?:js|ts)|[^\s]+\.test\.(?:js|ts)))'
+)
+_TEST_FILE_FULL_LITERALS = ("test_", "_test.", ".spec.", ".test.")
+# Error message and logs do not look for *.test.js
+_TEST_FILE = _CIPattern(
+    r'(test_[^\s]+\.(?:py|js|ts)|(?<!\S)(?:[^\s]+_test\.(?:py|js|ts)|[^\s]+\.spec\.(?:js|ts)))'
+)
+_TEST_FILE_LITERALS = ("test_", "_test.", ".spec.")
+_PY_FILE_RE = re.compile(r'File\s+"([^"]+)"')
+_AT_FILE_RE = re.compile(r'at\s+([^\s:]+\.(?:py|js|ts|spec\.js|spec\.ts))')
+_ANY_FILE_RE = re.compile(r'(?<!\S)([^\s]+\.(?:py|js|ts|jsx|tsx|spec\.js|spec\.ts))')
+_ANY_FILE_LITERALS = (".py", ".js", ".ts")
+
+
+def _search_test_file(field: _Field, pattern: _CIPattern, literals: Tuple[str, ...]) -> Optional[str]:
+    first = field.find_first_ci(literals)
+    if first < 0:
+        return None
+    match = field.search_ci(pattern, field.line_start(first))
+    return field.group(match) if match else None
+
+
+def _iter_any_files(field: _Field):
+    first = _find_first(field.text, _ANY_FILE_LITERALS)
+    if first < 0:
+        return
+    for match in _ANY_FILE_RE.finditer(field.text, field.line_start(first)):
+        yield match.group(1)
+
+
+def _extract_error_file(stack_trace: _Field, error_message: _Field, logs: _Field) -> Optional[str]:
+    if stack_trace.text:
+        # PRIORITY 1: test files, 2: File "path", 3: "at file.ext", 4: any file but __init__.py
+        path = _search_test_file(stack_trace, _TEST_FILE_FULL, _TEST_FILE_FULL_LITERALS)
+        if path:
+            return path
+        match = _PY_FILE_RE.search(stack_trace.text)
+        if match:
+            return match.group(1)
+        match = _AT_FILE_RE.search(stack_trace.text)
+        if match:
+            return match.group(1)
+        for path in _iter_any_files(stack_trace):
+            if '__init__.py' not in path:
+                return path
+
+    # FALLBACKS: error message, then logs (test files, File "path", any file)
+    for field in (error_message, logs):
+        if not field.text:
+            continue
+        path = _search_test_file(field, _TEST_FILE, _TEST_FILE_LITERALS)
+        if path:
+            return path
+        match = _PY_FILE_RE.search(field.text)
+        if match:
+            return match.group(1)
+        path = next(_iter_any_files(field), None)
+        if path:
+            return path
+    return None
+
+
+# --- Test URL ----------------------------------------------------------------
+
+# URLs following navigation keywords, in priority order
+_NAVIGATION_URLS: List[_CIPattern] = [
+    _CIPattern(r'navigating to\s+(https?://[^\s\]]+)'),
+    _CIPattern(r'opening\s+(https?://[^\s\]]+)'),
+    _CIPattern(r'url:\s+(https?://[^\s\]]+)'),
+    _CIPattern(r'visiting\s+(https?://[^\s\]]+)'),
+    _CIPattern(r'loading\s+(https?://[^\s\]]+)'),
+    _CIPattern(r'navigate to\s+(https?://[^\s\]]+)'),
+]
+_ANY_URL_RE: Pattern = re.compile(r'(https?://[^\s\]]+)')
+
+
+def _extract_test_url(field: _Field) -> Optional[str]:
+    if not field.text or field.find_first_ci(("http",)) < 0:
+        return None
+    for pattern in _NAVIGATION_URLS:
+        match = field.search_ci(pattern)
+        if match:
+            return field.group(match).rstrip('.,;')
+    match = _ANY_URL_RE.search(field.text)
+    if match:
+        return match.group(1).rstrip('.,;')
+    return None
+
+
+def extract_test_url(text: Optional[str]) -> Optional[str]:
+    """
+    Extract the test URL (http/https) from log text, preferring URLs that follow
+    navigation keywords ("Navigating to", "Opening", "URL:", ...).
+
+    Args:
+        text: Log text or error message
+
+    Returns:
+        The URL without trailing punctuation, or None if there is none
+    """
+    return _extract_test_url(_Field(text))
+
+
+def extract_failure_locations(
+    stack_trace: Optional[str],
+    error_message: Optional[str],
+    logs: Optional[str]
+) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Extract the error line number and error file path from a failure.
+
+    Args:
+        stack_trace: Raw stack trace (searched first)
+        error_message: Error message (first fallback)
+        logs: Test logs (last fallback)
+
+    Returns:
+        (error_line, error_file_path) - either is None when nothing was found
+        (a line number above MAX_ERROR_LINE also counts as not found)
+    """
+    stack_trace_field = _Field(stack_trace)
+    error_message_field = _Field(error_message)
+    logs_field = _Field(logs)
+    return (
+        _extract_error_line(stack_trace_field, error_message_field, logs_field),
+        _extract_error_file(stack_trace_field, error_message_field, logs_field),
+    )
@@ -0,0 +1,285 @@
+"""
+Source map resolution for transpiled stack frames.
+
+Maps a generated location (file, line, column) back to the original source
+using the `<file>.map` next to the generated file (source map v3). Parsed maps
+are kept in an LRU cache that is invalidated when the map file changes
+(mtime/size), so the VLQ decoding cost is paid once per map file.
+
+The file paths come from client-supplied stack traces, so maps are only read
+below TRIAGE_SOURCE_MAP_ROOT: relative paths are resolved under it, absolute,
+UNC and URL paths (and anything escaping the root, also through symlinks) are
+rejected. Without a configured root, nothing is resolved.
+"""
+import bisect
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+
+# Directory the generated files (and their .map files) are looked up in; empty disables resolution
+SOURCE_MAP_ROOT = os.environ.get("TRIAGE_SOURCE_MAP_ROOT", "")
+# Maximum number of parsed source maps kept in memory
+SOURCE_MAP_CACHE_SIZE = 64
+
+_BASE64_VALUES: Dict[str, int] = {
+    char: index
+    for index, char in enumerate("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/")
+}
+_URL_SCHEME_RE = re.compile(r'^[A-Za-z][A-Za-z0-9+.-]*://')
+# Rooted paths on any platform: /x, \x, UNC (\\server\share, //server/share), drives (C:\x, C:x)
+_ROOTED_PATH_RE = re.compile(r'^(?:[A-Za-z]:|[\\/])')
+
+
+def decode_vlq(segment: str) -> List[int]:
+    """
+    Decode one Base64 VLQ mapping segment into its signed integers.
+
+    Raises:
+        ValueError: On an invalid or truncated segment
+    """
+    values = []
+    value = shift = 0
+    for char in segment:
+        digit = _BASE64_VALUES.get(char)
+        if digit is None:
+            raise ValueError(f"Invalid VLQ character {char!r}")
+        value += (digit & 31) << shift
+        if digit & 32:
+            shift += 5
+        else:
+            values.append(-(value >> 1) if value & 1 else value >> 1)
+            value = shift = 0
+    if shift:
+        raise ValueError(f"Truncated VLQ segment {segment!r}")
+    return values
+
+
+class SourceMap:
+    """
+    A parsed source map: for every generated line, the sorted generated columns
+    and the original (source index, line, column) each of them maps to.
+    """
+
+    def __init__(self, data: dict, base_dir: str):
+        if "sections" in data:
+            raise ValueError("Indexed source maps are not supported")
+        source_root = data.get("sourceRoot") or ""
+        self.sources = [self._source_path(base_dir, source_root, source) for source in data.get("sources", [])]
+        self.lines: List[Tuple[List[int], List[Tuple[int, int, int]]]] = []
+
+        # Source index, original line and column are relative to the previous
+        # segment across the whole map; the generated column restarts every line
+        source = original_line = original_column = 0
+        for line in data.get("mappings", "").split(";"):
+            columns: List[int] = []
+            targets: List[Tuple[int, int, int]] = []
+            column = 0
+            for segment in line.split(","):
+                if not segment:
+                    continue
+                values = decode_vlq(segment)
+                column += values[0]
+                if len(values) >= 4:
+                    source += values[1]
+                    original_line += values[2]
+                    original_column += values[3]
+                    columns.append(column)
+                    targets.append((source, original_line, original_column))
+            self.lines.append((columns, targets))
+
+    @staticmethod
+    def _source_path(base_dir: str, source_root: str, source: str) -> str:
+        if source.startswith("file://"):
+            return source[len("file://"):]
+        path = source_root.rstrip("/") + "/" + source if source_root else source
+        if _URL_SCHEME_RE.match(path) or os.path.isabs(path):
+            return path
+        return os.path.normpath(os.path.join(base_dir, path))
+
+    def lookup(self, line: int, column: Optional[int] = None) -> Optional[Tuple[str, int, int]]:
+        """
+        Original location of a generated one (1-based line and column, as in
+        stack traces). Without a column, the first mapping of the line is used.
+
+        Returns:
+            (source path, line, column), all 1-based; None if the line is unmapped
+        """
+        if line < 1 or line > len(self.lines):
+            return None
+        columns, targets = self.lines[line - 1]
+        if not columns:
+            return None
+        index = bisect.bisect_right(columns, (column or 1) - 1) - 1
+        source, original_line, original_column = targets[max(index, 0)]
+        if not 0 <= source < len(self.sources):
+            return None
+        return self.sources[source], original_line + 1, original_column + 1
+
+
+def _file_signature(path: str) -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class SourceMapCache:
+    """
+    Thread-safe LRU cache of parsed source maps keyed by map path, invalidated
+    when the file's mtime or size changes. Unparseable maps are cached too
+    (as None) so they are not re-read on every failure.
+    """
+
+    def __init__(self, max_entries: int = SOURCE_MAP_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Tuple[int, int], Optional[SourceMap]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.parse_errors = 0
+
+    def get(self, map_path: str) -> Optional[SourceMap]:
+        """
+        Return the parsed map at map_path, or None if it is missing or invalid.
+        """
+        signature = _file_signature(map_path)
+        if signature is None:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(map_path)
+            if entry is not None:
+                if entry[0] == signature:
+                    self._entries.move_to_end(map_path)
+                    self.hits += 1
+                    return entry[1]
+                self.invalidations += 1
+            self.misses += 1
+
+        # Parse outside the lock; concurrent misses on one file just parse twice
+        try:
+            with open(map_path, encoding="utf-8") as f:
+                source_map = SourceMap(json.load(f), os.path.dirname(map_path))
+        except (OSError, ValueError) as e:
+            print(f"Could not load source map {map_path}: {e}")
+            source_map = None
+            with self._lock:
+                self.parse_errors += 1
+
+        with self._lock:
+            self._entries[map_path] = (signature, source_map)
+            self._entries.move_to_end(map_path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return source_map
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "parse_errors": self.parse_errors,
+            }
+
+
+source_map_cache = SourceMapCache()
+
+
+def _is_within(root: str, path: str) -> bool:
+    try:
+        return os.path.commonpath([root, path]) == root
+    except ValueError:
+        # Different drives (Windows)
+        return False
+
+
+def map_path_for(file_path: str, root: Optional[str] = None) -> Optional[str]:
+    """
+    Path of the source map of a generated file, confined to the source map root.
+
+    Args:
+        file_path: Generated file referenced by a stack frame, relative to the root
+        root: Root directory (defaults to SOURCE_MAP_ROOT)
+
+    Returns:
+        Real path of `<file_path>.map` under the root, or None if no root is
+        configured or the path is absolute, UNC, a URL or escapes the root
+    """
+    root = SOURCE_MAP_ROOT if root is None else root
+    if not root or not file_path or "\x00" in file_path:
+        return None
+    if os.path.isabs(file_path) or _ROOTED_PATH_RE.match(file_path) or _URL_SCHEME_RE.match(file_path):
+        return None
+
+    real_root = os.path.realpath(root)
+    candidate = os.path.normpath(os.path.join(real_root, file_path + ".map"))
+    # ".." escapes are rejected before touching the filesystem, symlinks escaping the root after
+    if not _is_within(real_root, candidate):
+        return None
+    candidate = os.path.realpath(candidate)
+    return candidate if _is_within(real_root, candidate) else None
+
+
+def resolve_location(
+    file_path: str,
+    line: int,
+    column: Optional[int] = None
+) -> Optional[Tuple[str, int, int]]:
+    """
+    Map a generated location to its original source via `<file_path>.map`
+    (looked up under SOURCE_MAP_ROOT, see map_path_for()).
+
+    Args:
+        file_path: Generated file referenced by the stack frame, relative to the root
+        line: 1-based line number
+        column: Optional 1-based column number
+
+    Returns:
+        (original path, line, column), or None if there is no usable map
+    """
+    map_path = map_path_for(file_path)
+    if map_path is None:
+        return None
+    source_map = source_map_cache.get(map_path)
+    if source_map is None:
+        return None
+    return source_map.lookup(line, column)
+
+
+def resolve_failure_location(
+    stack_trace: Optional[str],
+    file_path: Optional[str],
+    line: Optional[int]
+) -> Optional[Tuple[str, int]]:
+    """
+    Resolve the extracted error file/line of a failure through its source map.
+    The column is taken from the matching "file:line:column" stack frame.
+
+    Returns:
+        (original path, line), or None if the location could not be mapped
+    """
+    if not file_path or not line:
+        return None
+    path = file_path.strip("()[]'\"")
+    column = None
+    if stack_trace:
+        frame = re.search(re.escape(path) + rf':{line}:(\d+)', stack_trace)
+        if frame:
+            column = int(frame.group(1))
+    resolved = resolve_location(path, line, column)
+    if resolved is None:
+        return None
+    return resolved[0], resolved[1]
@@ -0,0 +1,30 @@
+"""
+SQLite helpers shared by the local databases (job queue, result store).
+"""
+import sqlite3
+import threading
+
+
+_local = threading.local()
+
+
+def get_thread_connection(db_path: str) -> sqlite3.Connection:
+    """
+    Return this thread's connection to db_path, opening it on first use.
+
+    Connections are in autocommit mode (explicit BEGIN for transactions), use
+    WAL journaling so readers never block the writer, and wait up to 30s on
+    locks held by other threads or processes.
+    """
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(db_path)
+    if conn is None:
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[db_path] = conn
+    return conn
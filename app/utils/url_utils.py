@@ -9,6 +9,8 @@ import os
 from typing import Optional
 from urllib.parse import quote
 
+from app.utils.extraction import extract_test_url
+
 
 def convert_path_to_url(file_path: str) -> str:
     """
@@ -120,29 +122,4 @@ def extract_test_url_from_logs(logs: str) -> Optional[str]:
         >>> extract_test_url_from_logs("Opening URL: http://localhost:3000/dashboard")
         'http://localhost:3000/dashboard'
     """
-    if not logs:
-        return None
-    
-    import re
-    
-    # Priority 1: Look for URLs after navigation keywords
-    navigation_patterns = [
-        r'Navigating to\s+(https?://[^\s\]]+)',
-        r'Opening\s+(https?://[^\s\]]+)',
-        r'URL:\s+(https?://[^\s\]]+)',
-        r'Visiting\s+(https?://[^\s\]]+)',
-        r'Loading\s+(https?://[^\s\]]+)',
-        r'Navigate to\s+(https?://[^\s\]]+)',
-    ]
-    
-    for pattern in navigation_patterns:
-        match = re.search(pattern, logs, re.IGNORECASE)
-        if match:
-            return match.group(1).rstrip('.,;')
-    
-    # Priority 2: Look for any http/https URL in the logs
-    url_match = re.search(r'(https?://[^\s\]]+)', logs)
-    if url_match:
-        return url_match.group(1).rstrip('.,;')
-    
-    return None
+    return extract_test_url(logs)
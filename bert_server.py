@@ -1,10 +1,34 @@
 # C:\bug-triage-engine\bert_server.py
 
+import asyncio
+import hashlib
+import os
+import re
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional, Dict
 import uvicorn
 
+# ---- Micro-batching config ----
+
+# Concurrent /predict calls are grouped into one inference of up to this many texts...
+BATCH_MAX_SIZE = int(os.environ.get("BERT_BATCH_MAX_SIZE", "32"))
+# ...waiting at most this long for the batch to fill up after the first call arrives
+BATCH_MAX_WAIT_MS = float(os.environ.get("BERT_BATCH_MAX_WAIT_MS", "5"))
+# Queue latencies kept for the percentiles in /batch/stats
+LATENCY_SAMPLES = 1024
+
+# ---- Response cache config ----
+
+# Distinct (text, label set) predictions kept; 0 disables the cache
+CACHE_MAX_ENTRIES = int(os.environ.get("BERT_CACHE_MAX_ENTRIES", "10000"))
+# Age after which a cached prediction is recomputed (0 = never expires)
+CACHE_TTL_SECONDS = float(os.environ.get("BERT_CACHE_TTL_SECONDS", "3600"))
+
 # ---- Request/Response Models ----
 
 class BertRequest(BaseModel):
@@ -18,9 +42,306 @@ class BertResponse(BaseModel):
     scores: Dict[str, float]
 
 
+class BertBatchRequest(BaseModel):
+    items: List[BertRequest]
+
+
+class BertBatchResponse(BaseModel):
+    results: List[BertResponse]
+
+
+# ---- Classifier ----
+
+def classify_batch(requests: List[BertRequest]) -> List[BertResponse]:
+    """
+    Dummy/Baseline classifier, one call per batch of texts.
+    You can later plug your real BERT model here: tokenize all texts together
+    and run a single forward pass, so throughput scales with the batch size.
+    """
+    results = []
+    for request in requests:
+        labels = request.labels or ["General"]
+
+        # Simple logic: pick the first label as the "best"
+        best_label = labels[0]
+        score_each = 1.0 / len(labels) if labels else 1.0
+
+        scores = {lbl: score_each for lbl in labels}
+
+        results.append(BertResponse(
+            label=best_label,
+            confidence=score_each,
+            scores=scores,
+        ))
+    return results
+
+
+def _classify_checked(requests: List[BertRequest]) -> List[BertResponse]:
+    """
+    classify_batch(), with one result per request guaranteed: results are
+    matched to requests by position, so a short (or long) result list would
+    leave callers without an answer or with someone else's.
+
+    Raises:
+        RuntimeError: If the classifier returned a different number of results
+    """
+    results = classify_batch(requests)
+    if len(results) != len(requests):
+        raise RuntimeError(f"Classifier returned {len(results)} result(s) for {len(requests)} text(s)")
+    return results
+
+
+_WHITESPACE_RE = re.compile(r'\s+')
+
+
+def _default_labels(request: BertRequest) -> List[str]:
+    return request.labels or ["General"]
+
+
+def _response_for(labels: List[str], scores: Dict[str, float]) -> BertResponse:
+    # Highest score wins; ties go to the earliest label of this request,
+    # like the classifier itself does
+    best_label = max(labels, key=lambda lbl: scores.get(lbl, 0.0))
+    return BertResponse(label=best_label, confidence=scores.get(best_label, 0.0), scores=dict(scores))
+
+
+class PredictionCache:
+    """
+    LRU + TTL cache of classification scores keyed by a hash of the
+    whitespace-normalized text and the sorted labels, so a hit skips the
+    model entirely. Duplicate labels are part of the key (they change the
+    scores); only the order is not, the label is re-picked from the cached
+    scores in the order of each request's labels.
+
+    Only used from the event loop, so no locking is needed.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(text: str, labels: List[str]) -> str:
+        normalized = _WHITESPACE_RE.sub(" ", text).strip()
+        material = normalized + "\0" + "\x1f".join(sorted(labels))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, request: BertRequest) -> Optional[BertResponse]:
+        if self.max_entries <= 0:
+            return None
+        labels = _default_labels(request)
+        key = self.key(request.text, labels)
+        entry = self._entries.get(key)
+        if entry is not None and self.ttl_seconds > 0 and time.monotonic() - entry[0] > self.ttl_seconds:
+            del self._entries[key]
+            self.expirations += 1
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return _response_for(labels, entry[1])
+
+    def put(self, request: BertRequest, response: BertResponse) -> None:
+        if self.max_entries <= 0:
+            return
+        key = self.key(request.text, _default_labels(request))
+        self._entries[key] = (time.monotonic(), dict(response.scores))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> int:
+        cleared = len(self._entries)
+        self._entries.clear()
+        return cleared
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+
+class _Pending:
+    __slots__ = ("request", "future", "enqueued_at")
+
+    def __init__(self, request: BertRequest, future: asyncio.Future):
+        self.request = request
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """
+    Collects concurrent single predictions for up to max_size items or
+    max_wait_ms and runs them as one classify_batch call (in a worker thread,
+    so the event loop keeps accepting requests while a batch is inferred).
+    Calls arriving during an inference simply make the next batch bigger.
+    """
+
+    def __init__(self, max_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        self.max_size = max(1, max_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: List[_Pending] = []
+
+        self.requests = 0
+        self.batches = 0
+        self.items = 0
+        self.max_batch_size = 0
+        self.batch_sizes: Dict[int, int] = {}
+        self.errors = 0
+        self._latencies = deque(maxlen=LATENCY_SAMPLES)
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+
+    def start(self) -> None:
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._worker is None:
+            return
+        self._worker.cancel()
+        try:
+            await self._worker
+        except asyncio.CancelledError:
+            pass
+        self._worker = None
+        # Fail whatever was still queued instead of leaving callers hanging
+        leftover = list(self._inflight)
+        while not self._queue.empty():
+            leftover.append(self._queue.get_nowait())
+        self._inflight = []
+        for pending in leftover:
+            if not pending.future.done():
+                pending.future.set_exception(RuntimeError("BERT server is shutting down"))
+
+    async def predict(self, request: BertRequest) -> BertResponse:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.requests += 1
+        await self._queue.put(_Pending(request, future))
+        return await future
+
+    async def _collect(self) -> List[_Pending]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_size:
+            # Take what is already queued without waiting
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        # Callers that went away do not need an inference
+        return [pending for pending in batch if not pending.future.done()]
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            if not batch:
+                continue
+
+            started = time.perf_counter()
+            self._record(batch, started)
+            self._inflight = batch
+            try:
+                results = await asyncio.to_thread(_classify_checked, [pending.request for pending in batch])
+            except Exception as e:
+                self._inflight = []
+                self.errors += 1
+                print(f"Batch classification failed: {e}")
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+
+            self._inflight = []
+            for pending, result in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+
+    def _record(self, batch: List[_Pending], started: float) -> None:
+        size = len(batch)
+        self.batches += 1
+        self.items += size
+        self.max_batch_size = max(self.max_batch_size, size)
+        self.batch_sizes[size] = self.batch_sizes.get(size, 0) + 1
+        for pending in batch:
+            latency = started - pending.enqueued_at
+            self._latencies.append(latency)
+            self._latency_total += latency
+            self._latency_max = max(self._latency_max, latency)
+
+    def stats(self) -> dict:
+        recent = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not recent:
+                return 0.0
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))] * 1000, 3)
+
+        return {
+            "batch_max_size": self.max_size,
+            "batch_max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "requests": self.requests,
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "batch_size": {
+                "avg": round(self.items / self.batches, 2) if self.batches else 0.0,
+                "max": self.max_batch_size,
+                "histogram": dict(sorted(self.batch_sizes.items())),
+            },
+            "queue_latency_ms": {
+                "avg": round(self._latency_total / self.items * 1000, 3) if self.items else 0.0,
+                "max": round(self._latency_max * 1000, 3),
+                "p50": percentile(0.50),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+            },
+        }
+
+
+batcher = MicroBatcher()
+prediction_cache = PredictionCache()
+
+
 # ---- FastAPI app ----
 
-app = FastAPI(title="BERT Classification Server")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    batcher.start()
+    yield
+    await batcher.stop()
+
+
+app = FastAPI(title="BERT Classification Server", lifespan=lifespan)
 
 
 @app.get("/")
@@ -31,22 +352,62 @@ async def root():
 @app.post("/predict", response_model=BertResponse)
 async def predict(request: BertRequest):
     """
-    Dummy/Baseline classifier.
-    You can later plug your real BERT model here.
+    Classify one text. Cached predictions are returned without inference;
+    concurrent misses are micro-batched into one inference.
     """
-    labels = request.labels or ["General"]
+    cached = prediction_cache.get(request)
+    if cached is not None:
+        return cached
+    try:
+        response = await batcher.predict(request)
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    prediction_cache.put(request, response)
+    return response
 
-    # Simple logic: pick the first label as the "best"
-    best_label = labels[0]
-    score_each = 1.0 / len(labels) if labels else 1.0
 
-    scores = {lbl: score_each for lbl in labels}
+@app.post("/predict_batch", response_model=BertBatchResponse)
+async def predict_batch(request: BertBatchRequest):
+    """
+    Classify many texts in one round-trip (results in request order). Cached
+    items are answered directly, the rest inferred in chunks of BATCH_MAX_SIZE.
+    """
+    results: List[Optional[BertResponse]] = [prediction_cache.get(item) for item in request.items]
+    missing = [index for index, result in enumerate(results) if result is None]
+    for start in range(0, len(missing), BATCH_MAX_SIZE):
+        chunk = missing[start:start + BATCH_MAX_SIZE]
+        try:
+            inferred = await asyncio.to_thread(_classify_checked, [request.items[index] for index in chunk])
+        except RuntimeError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+        for index, response in zip(chunk, inferred):
+            prediction_cache.put(request.items[index], response)
+            results[index] = response
+    return BertBatchResponse(results=results)
 
-    return BertResponse(
-        label=best_label,
-        confidence=score_each,
-        scores=scores,
-    )
+
+@app.get("/batch/stats")
+async def batch_stats():
+    """
+    Micro-batcher stats: batch sizes and time spent queued before inference.
+    """
+    return batcher.stats()
+
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """
+    Prediction cache stats: size, hit ratio, expirations and evictions.
+    """
+    return prediction_cache.stats()
+
+
+@app.delete("/cache")
+async def clear_cache():
+    """
+    Drop all cached predictions (e.g. after swapping the model).
+    """
+    return {"status": "cleared", "entries": prediction_cache.clear()}
 
 
 if __name__ == "__main__":
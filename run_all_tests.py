@@ -11,6 +11,8 @@ from datetime import datetime
 
 # Configuration
 API_URL = "http://192.168.1.13:8003/api/triage"
+BATCH_API_URL = f"{API_URL}/batch"
+BATCH_TIMEOUT = 1800  # whole run is triaged in one request
 LLM_MODEL = "gemma:2b"
 BERT_URL = "http://192.168.1.13:8001/triage"
 REPORT_FILE = "playwright-report.json"
@@ -140,15 +142,29 @@ def send_to_triage(failures):
     success = 0
     failed = 0
     
+    # Send the whole run in one batch request; the server triages failures concurrently
+    try:
+        response = requests.post(BATCH_API_URL, json=failures, timeout=BATCH_TIMEOUT)
+        response.raise_for_status()
+        items = response.json().get('results', [])
+    except requests.exceptions.ConnectionError:
+        print(f"[ERROR] ERROR: Cannot connect to {BATCH_API_URL}")
+        print("  Make sure the triage engine is running: python main.py")
+        items = [{"index": i, "error": "connection failed"} for i in range(len(failures))]
+    except Exception as e:
+        print(f"[ERROR] ERROR: {e}")
+        items = [{"index": i, "error": str(e)} for i in range(len(failures))]
+    
+    # Match results to failures by their index: a missing entry is a failure too
+    by_index = {item.get('index'): item for item in items}
+    
     for i, failure in enumerate(failures, 1):
         print(f"[{i}/{len(failures)}] {failure['test_name']}")
         print("-" * 80)
         
-        try:
-            response = requests.post(API_URL, json=failure, timeout=600)
-            response.raise_for_status()
-            result = response.json()
-            
+        item = by_index.get(i - 1) or {"error": "no result returned for this failure"}
+        result = item.get('result')
+        if result:
             print(f"[OK] SUCCESS")
             print(f"  Title: {result.get('title', 'N/A')}")
             print(f"  Error Line: {result.get('error_line', 'N/A')}")
@@ -156,14 +172,8 @@ def send_to_triage(failures):
             print(f"  Triage Label: {result.get('triage_label', 'N/A')}")
             print(f"  ID: {result.get('id', 'N/A')}")
             success += 1
-            
-        except requests.exceptions.ConnectionError:
-            print(f"[ERROR] ERROR: Cannot connect to {API_URL}")
-            print("  Make sure the triage engine is running: python main.py")
-            failed += 1
-            
-        except Exception as e:
-            print(f"[ERROR] ERROR: {e}")
+        else:
+            print(f"[ERROR] ERROR: {item.get('error', 'unknown error')}")
             failed += 1
         
         print()
@@ -0,0 +1,278 @@
+"""
+Circuit breaker state transitions (app/services/circuit_breaker.py): closed ->
+open on the failure or slow-call rate, open -> half_open after the cool-down,
+half_open -> closed on a good probe or back to open on a bad one; errors that
+are the caller's fault (4xx) never count.
+"""
+import asyncio
+
+import httpx
+import pytest
+import requests
+
+from app.services import circuit_breaker
+from app.services.circuit_breaker import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitOpenError,
+    is_dependency_failure,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(circuit_breaker, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker(
+        "test",
+        slow_call_seconds=5.0,
+        window_seconds=60.0,
+        min_calls=4,
+        failure_rate=0.5,
+        slow_call_rate=0.75,
+        open_seconds=30.0,
+        half_open_probes=1,
+    )
+
+
+def _http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status} error", response=response)
+
+
+def _httpx_error(status):
+    request = httpx.Request("POST", "http://localhost:8001/predict")
+    return httpx.HTTPStatusError(f"{status} error", request=request, response=httpx.Response(status, request=request))
+
+
+def _call(breaker, clock=None, error=None, duration=0.0):
+    """One call through the guard; returns the exception it raised, if any."""
+    try:
+        with breaker.guard():
+            if clock is not None:
+                clock.advance(duration)
+            if error is not None:
+                raise error
+    except Exception as e:
+        return e
+    return None
+
+
+def _state(breaker):
+    return breaker.stats()["state"]
+
+
+def _open(breaker):
+    for _ in range(breaker.min_calls):
+        _call(breaker, error=requests.ConnectionError("refused"))
+    assert _state(breaker) == STATE_OPEN
+
+
+@pytest.mark.parametrize("error, counts", [
+    (requests.ConnectionError("refused"), True),
+    (requests.Timeout("read timed out"), True),
+    (httpx.ConnectError("refused"), True),
+    (httpx.ReadTimeout("read timed out"), True),
+    (ConnectionResetError("reset"), True),
+    (TimeoutError(), True),
+    (_http_error(500), True),
+    (_http_error(503), True),
+    (_httpx_error(502), True),
+    (_http_error(400), False),
+    (_http_error(404), False),
+    (_httpx_error(422), False),
+    (ValueError("bad JSON from the model"), False),
+])
+def test_dependency_failure_classification(error, counts):
+    assert is_dependency_failure(error) is counts
+
+
+def test_stays_closed_below_min_calls(breaker):
+    for _ in range(breaker.min_calls - 1):
+        _call(breaker, error=requests.ConnectionError("refused"))
+
+    assert _state(breaker) == STATE_CLOSED
+    breaker.check()
+
+
+def test_opens_at_the_failure_rate(breaker):
+    _call(breaker)
+    _call(breaker)
+    _call(breaker, error=_http_error(503))
+    assert _state(breaker) == STATE_CLOSED
+
+    _call(breaker, error=requests.Timeout("read timed out"))
+
+    stats = breaker.stats()
+    assert stats["state"] == STATE_OPEN
+    assert stats["times_opened"] == 1
+    assert "2/4 calls failed" in stats["open_reason"]
+
+
+def test_opens_at_the_slow_call_rate(breaker, clock):
+    for _ in range(3):
+        _call(breaker, clock, duration=5.0)
+    _call(breaker, clock, duration=0.1)
+
+    assert _state(breaker) == STATE_OPEN
+    assert "took over 5s" in breaker.stats()["open_reason"]
+
+
+def test_client_errors_are_never_recorded(breaker):
+    for status in (400, 404, 422) * 3:
+        error = _call(breaker, error=_http_error(status))
+        # Re-raised unchanged for the caller to handle
+        assert error.response.status_code == status
+
+    stats = breaker.stats()
+    assert stats["state"] == STATE_CLOSED
+    assert stats["window"]["calls"] == 0
+
+
+def test_open_breaker_rejects_calls(breaker, clock):
+    _open(breaker)
+    clock.advance(10)
+
+    with pytest.raises(CircuitOpenError) as rejected:
+        breaker.check()
+    assert rejected.value.retry_in == pytest.approx(20)
+    assert isinstance(_call(breaker), CircuitOpenError)
+    assert breaker.stats()["rejected_calls"] == 2
+
+
+def test_old_failures_leave_the_window(breaker, clock):
+    for _ in range(3):
+        _call(breaker, error=requests.ConnectionError("refused"))
+    clock.advance(61)
+    for _ in range(3):
+        _call(breaker)
+
+    assert _state(breaker) == STATE_CLOSED
+    assert breaker.stats()["window"]["calls"] == 3
+
+
+def test_half_open_after_the_cool_down(breaker, clock):
+    _open(breaker)
+    clock.advance(29.9)
+    assert _state(breaker) == STATE_OPEN
+
+    clock.advance(0.1)
+
+    assert _state(breaker) == STATE_HALF_OPEN
+    breaker.check()
+
+
+def test_successful_probe_closes(breaker, clock):
+    _open(breaker)
+    clock.advance(30)
+
+    assert _call(breaker) is None
+
+    stats = breaker.stats()
+    assert stats["state"] == STATE_CLOSED
+    assert stats["window"]["calls"] == 0
+
+
+@pytest.mark.parametrize("error, duration", [
+    (requests.ConnectionError("refused"), 0.0),
+    (_http_error(500), 0.0),
+    (None, 6.0),
+])
+def test_failed_or_slow_probe_reopens(breaker, clock, error, duration):
+    _open(breaker)
+    clock.advance(30)
+
+    _call(breaker, clock, error=error, duration=duration)
+
+    stats = breaker.stats()
+    assert stats["state"] == STATE_OPEN
+    assert stats["times_opened"] == 2
+    assert stats["retry_in_seconds"] == pytest.approx(30)
+
+
+def test_only_one_probe_at_a_time(breaker, clock):
+    _open(breaker)
+    clock.advance(30)
+
+    with breaker.guard():
+        with pytest.raises(CircuitOpenError):
+            breaker.check()
+
+    assert _state(breaker) == STATE_CLOSED
+
+
+def test_client_error_probe_frees_the_probe_slot(breaker, clock):
+    _open(breaker)
+    clock.advance(30)
+
+    _call(breaker, error=_http_error(404))
+
+    # No verdict: still half-open, and the next probe is let through
+    assert _state(breaker) == STATE_HALF_OPEN
+    assert _call(breaker) is None
+    assert _state(breaker) == STATE_CLOSED
+
+
+def test_async_guard_transitions(breaker, clock):
+    async def call(error=None):
+        try:
+            async with breaker.async_guard():
+                await asyncio.sleep(0)
+                if error is not None:
+                    raise error
+        except Exception as e:
+            return e
+
+    async def main():
+        for _ in range(4):
+            await call(_httpx_error(422))
+        assert _state(breaker) == STATE_CLOSED
+        for _ in range(4):
+            await call(httpx.ConnectError("refused"))
+        assert _state(breaker) == STATE_OPEN
+        assert isinstance(await call(), CircuitOpenError)
+        clock.advance(30)
+        await call()
+        assert _state(breaker) == STATE_CLOSED
+
+    asyncio.run(main())
+
+
+def test_cancelled_probe_frees_the_probe_slot(breaker, clock):
+    _open(breaker)
+    clock.advance(30)
+
+    async def probe():
+        async with breaker.async_guard():
+            await asyncio.sleep(10)
+
+    async def main():
+        task = asyncio.ensure_future(probe())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    assert _state(breaker) == STATE_HALF_OPEN
+    breaker.check()
@@ -0,0 +1,51 @@
+"""
+Regression corpus for app/utils/extraction.py.
+
+tests/fixtures/extraction_corpus.json pins the error line, error file and test
+URL the original inline regex chains of triage_service produced for the demo
+suite's real failures, hand-picked edge cases and seeded random inputs. The
+precompiled extraction must keep producing exactly the same output.
+"""
+import json
+import os
+
+import pytest
+
+from app.utils.extraction import extract_failure_locations, extract_test_url
+from app.utils.url_utils import extract_test_url_from_logs
+
+
+CORPUS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "extraction_corpus.json")
+
+with open(CORPUS_FILE, encoding="utf-8") as f:
+    CORPUS = json.load(f)["cases"]
+
+FIELDS = ("stack_trace", "error_message", "logs")
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+def test_failure_locations_match_corpus(case):
+    line, file_path = extract_failure_locations(case["stack_trace"], case["error_message"], case["logs"])
+
+    # triage_service falls back to line 1, as the original code did inline
+    assert (line if line is not None else 1) == case["expected"]["error_line"]
+    assert file_path == case["expected"]["error_file"]
+
+
+@pytest.mark.parametrize("case", CORPUS, ids=[case["name"] for case in CORPUS])
+def test_test_url_matches_corpus(case):
+    for field in FIELDS:
+        expected = case["expected"]["test_url"][field]
+        assert extract_test_url(case[field]) == expected, field
+        assert extract_test_url_from_logs(case[field]) == expected, field
+
+
+def test_corpus_covers_every_outcome():
+    # Guards against a regenerated corpus that no longer exercises the fallbacks
+    expected = [case["expected"] for case in CORPUS]
+    assert len(CORPUS) >= 250
+    assert any(e["error_line"] == 1 for e in expected)
+    assert any(e["error_line"] > 1 for e in expected)
+    assert any(e["error_file"] is None for e in expected)
+    assert any(e["error_file"] and e["error_file"].lower().endswith(".spec.js") for e in expected)
+    assert any(url for e in expected for url in e["test_url"].values())
@@ -0,0 +1,169 @@
+"""
+Batch failure clustering (app/services/failure_clustering.py): failures with
+the same assertion type, first error line (numbers ignored), top stack frames
+and LLM model share a cluster id; anything else that differs does not matter.
+Members share the cluster's description under a header of their own.
+"""
+import asyncio
+
+import pytest
+
+from app.schemas import FailureInput
+from app.services import triage_service
+from app.services.failure_clustering import (
+    CLUSTER_STACK_FRAMES,
+    cluster_failures,
+    compute_cluster_id,
+    member_description,
+)
+
+
+ERROR = "TimeoutError: locator.click: Timeout 30000ms exceeded.\nCall log:\n  - waiting for locator('#submit')"
+STACK = "\n".join([
+    "TimeoutError: locator.click: Timeout 30000ms exceeded.",
+    "    at LoginPage.submit (/home/ci/build-1234/tests/pages/login.page.ts:42:17)",
+    "    at /home/ci/build-1234/tests/login.spec.ts:18:5",
+    "    at runTest (/home/ci/build-1234/tests/helpers.ts:7:3)",
+    "    at Object.<anonymous> (/home/ci/build-1234/tests/deep.ts:1:1)",
+])
+
+
+def _failure(**changes):
+    fields = {
+        "test_name": "login > submits the form",
+        "file_path": "tests/login.spec.ts",
+        "error_message": ERROR,
+        "stack_trace": STACK,
+        "logs": "2026-01-01T10:00:00Z navigating to /login",
+        "llm_model": "gemma:2b",
+        "bert_url": "http://localhost:8001/predict",
+    }
+    fields.update(changes)
+    return FailureInput(**fields)
+
+
+def test_cluster_id_is_a_short_digest():
+    cluster_id = compute_cluster_id(_failure())
+
+    assert len(cluster_id) == 16
+    int(cluster_id, 16)
+
+
+@pytest.mark.parametrize("changes", [
+    # Per-test and per-run details
+    {"test_name": "checkout > pays with a card", "file_path": "tests/checkout.spec.ts"},
+    {"logs": "something else entirely"},
+    {"logs": None},
+    {"bert_url": "http://bert:9000/predict", "labels": ["Timeout Error"]},
+    # Numbers in the first error line
+    {"error_message": ERROR.replace("30000", "15000")},
+    # Lines and columns, absolute paths of the top frames
+    {"stack_trace": STACK.replace(":42:17", ":44:9").replace("/home/ci/build-1234", "/runner/work/app")},
+    # Everything below the top frames
+    {"stack_trace": STACK.replace("deep.ts", "other.ts")},
+    # The rest of the error message after its first line
+    {"error_message": ERROR.replace("#submit", "#login-button")},
+])
+def test_same_root_cause_shares_a_cluster(changes):
+    assert compute_cluster_id(_failure(**changes)) == compute_cluster_id(_failure())
+
+
+@pytest.mark.parametrize("changes", [
+    # Members share the representative's description, so the model must match
+    {"llm_model": "llama3:8b"},
+    {"error_message": "TimeoutError: locator.fill: Timeout 30000ms exceeded."},
+    {"error_message": "Error: expect(page).toHaveTitle(expected) failed\nExpected: \"Dashboard\"\nReceived: \"Login\""},
+    {"stack_trace": STACK.replace("LoginPage.submit", "LoginPage.fill")},
+    {"stack_trace": STACK.replace("helpers.ts", "fixtures.ts")},
+])
+def test_different_root_cause_gets_its_own_cluster(changes):
+    assert compute_cluster_id(_failure(**changes)) != compute_cluster_id(_failure())
+
+
+def test_only_the_top_frames_count():
+    frames = STACK.splitlines()[1:]
+    assert len(frames) > CLUSTER_STACK_FRAMES
+
+    for index, frame in enumerate(frames):
+        changed = STACK.replace(frame, "    at somewhereElse (/tests/elsewhere.ts:1:1)")
+        same = compute_cluster_id(_failure(stack_trace=changed)) == compute_cluster_id(_failure())
+        assert same is (index >= CLUSTER_STACK_FRAMES), frame
+
+
+def test_cluster_failures_groups_in_input_order():
+    payloads = [
+        _failure(test_name="a"),
+        _failure(test_name="b", llm_model="llama3:8b"),
+        _failure(test_name="c", error_message=ERROR.replace("30000", "5000")),
+        _failure(test_name="d", error_message="Error: net::ERR_CONNECTION_REFUSED at http://localhost:3000/"),
+        _failure(test_name="e", llm_model="llama3:8b"),
+    ]
+
+    clusters = cluster_failures(payloads)
+
+    assert list(clusters.values()) == [[0, 2], [1, 4], [3]]
+    assert list(clusters) == [compute_cluster_id(payloads[index]) for index in (0, 1, 3)]
+
+
+def test_member_description_header():
+    description = member_description("The login form never submits.", "search", "search.spec.ts", 12, "login")
+
+    assert description == (
+        "Test: search\n"
+        "Error location: search.spec.ts:12\n"
+        "Root cause shared with other failures; description written for: login\n"
+        "\n"
+        "The login form never submits."
+    )
+    # The representative itself gets no "written for" line
+    assert member_description("text", "login", None, None, "login") == "Test: login\n\ntext"
+
+
+SHARED_DESCRIPTION = (
+    "The login test failed because the login button never became clickable. "
+    "login.spec.ts line 18 waits on #submit; the login page logs show a spinner overlay."
+)
+
+
+def test_batch_members_get_their_own_header_over_the_shared_text(monkeypatch):
+    generated = []
+
+    async def generate_bug_report_async(model, failure_text, signature=None, features=None):
+        generated.append(failure_text)
+        return {"title": "Login button not clickable", "description": SHARED_DESCRIPTION}
+
+    async def detect_playwright_label_async(**kwargs):
+        return "Timeout Error", "rules"
+
+    monkeypatch.setattr(triage_service, "generate_bug_report_async", generate_bug_report_async)
+    monkeypatch.setattr(triage_service, "detect_playwright_label_async", detect_playwright_label_async)
+
+    payloads = [
+        _failure(test_name="login", file_path="tests/login.spec.ts"),
+        _failure(
+            test_name="search",
+            stack_trace=STACK.replace(":42:17", ":57:3").replace(":18:5", ":31:9"),
+        ),
+    ]
+    # Same top frames apart from the line numbers: one cluster, one generation
+    assert len(cluster_failures(payloads)) == 1
+
+    (login, login_error), (search, search_error) = asyncio.run(triage_service.process_failures_batch(payloads))
+
+    assert login_error is None and search_error is None
+    assert len(generated) == 1
+    assert login["cluster_id"] == search["cluster_id"]
+
+    header, shared = search["description"].split("\n\n", 1)
+    # The shared LLM text is kept as written: no word of it is rewritten
+    assert shared == SHARED_DESCRIPTION
+    assert header.splitlines()[0] == "Test: search"
+    assert f"{search['error_file']}:{search['error_line']}" in header
+    assert header.splitlines()[-1].endswith("written for: login")
+
+    header, shared = login["description"].split("\n\n", 1)
+    assert shared == SHARED_DESCRIPTION
+    assert header.splitlines()[0] == "Test: login"
+    assert f"{login['error_file']}:{login['error_line']}" in header
+    assert "written for" not in header
+    assert login["error_line"] != search["error_line"]
@@ -0,0 +1,116 @@
+"""
+Local label classifier (app/services/local_classifier.py): it only answers once
+it has learned min_results BERT-labelled results and its best candidate clears
+the threshold; everything else goes to BERT.
+"""
+import pytest
+
+from app.services.local_classifier import LocalLabelClassifier, classification_text
+
+
+TIMEOUT = "Timeout Error"
+TITLE = "Assertion: Title Mismatch"
+CANDIDATES = [TIMEOUT, TITLE]
+
+TIMEOUT_MESSAGE = "TimeoutError: locator.click: Timeout 30000ms exceeded waiting for selector #submit"
+TITLE_MESSAGE = "Error: expect(page).toHaveTitle(expected) failed, expected title Dashboard received title Login"
+STACK_TRACE = "    at /tests/login.spec.js:42:17"
+
+
+def _record(result_id, message, label, label_source="bert"):
+    return {
+        "id": result_id,
+        "raw_failure_text": (
+            f"Test Name: login\nFile Path: tests/login.spec.js\nError Message: {message}\n"
+            f"Stack Trace: {STACK_TRACE}\nLogs: "
+        ),
+        "stack_trace": STACK_TRACE,
+        "triage_label": label,
+        "label_source": label_source,
+    }
+
+
+def _trained(threshold=0.9, min_results=10, per_label=5):
+    classifier = LocalLabelClassifier(threshold=threshold, min_results=min_results, enabled=True)
+    for i in range(per_label):
+        assert classifier.learn_record(_record(f"timeout-{i}", TIMEOUT_MESSAGE, TIMEOUT))
+        assert classifier.learn_record(_record(f"title-{i}", TITLE_MESSAGE, TITLE))
+    return classifier
+
+
+def _text(message):
+    return classification_text(message, STACK_TRACE)
+
+
+def test_confident_prediction_is_answered_locally():
+    classifier = _trained()
+
+    assert classifier.predict(_text(TIMEOUT_MESSAGE), CANDIDATES) == TIMEOUT
+    assert classifier.predict(_text(TITLE_MESSAGE), CANDIDATES) == TITLE
+    assert classifier.stats()["answered_locally"] == 2
+
+
+def test_nothing_is_answered_below_min_results():
+    classifier = _trained(min_results=11)
+
+    assert classifier.predict(_text(TIMEOUT_MESSAGE), CANDIDATES) is None
+    stats = classifier.stats()
+    assert (stats["predictions"], stats["sent_to_bert"]) == (1, 1)
+
+
+def test_threshold_decides_between_local_and_bert():
+    classifier = _trained()
+    # Words of both training texts: the model leans to the title label without being sure
+    ambiguous = _text("locator click expected title")
+    probability = classifier.model.probabilities(ambiguous, CANDIDATES)[TITLE]
+    assert 0.5 < probability < 0.9
+
+    assert classifier.predict(ambiguous, CANDIDATES) is None
+
+    classifier.threshold = probability
+    assert classifier.predict(ambiguous, CANDIDATES) == TITLE
+
+    classifier.threshold = probability + 1e-9
+    assert classifier.predict(ambiguous, CANDIDATES) is None
+    assert classifier.stats()["answered_locally"] == 1
+
+
+def test_unseen_candidates_are_not_confident():
+    classifier = _trained()
+
+    assert classifier.predict(_text(TIMEOUT_MESSAGE), ["Network Error", "Selector Not Found"]) is None
+
+
+def test_probabilities_sum_to_one_over_deduplicated_candidates():
+    classifier = _trained()
+
+    probabilities = classifier.model.probabilities(_text(TIMEOUT_MESSAGE), CANDIDATES)
+
+    assert set(probabilities) == set(CANDIDATES)
+    assert sum(probabilities.values()) == pytest.approx(1.0)
+    assert classifier.predict(_text(TIMEOUT_MESSAGE), [TIMEOUT, TIMEOUT, TITLE]) == TIMEOUT
+
+
+def test_disabled_classifier_never_answers():
+    classifier = _trained()
+    classifier.enabled = False
+
+    assert classifier.predict(_text(TIMEOUT_MESSAGE), CANDIDATES) is None
+
+
+@pytest.mark.parametrize("label_source", ["local", "bert_circuit_open", "bert_error", "rules", None])
+def test_only_bert_labels_are_learned(label_source):
+    classifier = LocalLabelClassifier(threshold=0.9, min_results=1, enabled=True)
+
+    assert not classifier.learn_record(_record("r1", TIMEOUT_MESSAGE, TIMEOUT, label_source))
+    assert classifier.model.trained == 0
+
+
+def test_each_result_is_learned_once():
+    classifier = LocalLabelClassifier(threshold=0.9, min_results=1, enabled=True)
+    record = _record("r1", TIMEOUT_MESSAGE, TIMEOUT)
+
+    assert classifier.learn_record(record)
+    assert not classifier.learn_record(record)
+    classifier.on_storage_event("stored", "r1", record)
+    assert classifier.model.trained == 1
@@ -0,0 +1,117 @@
+"""
+Keyset pagination of stored results (storage_service.query_results): walking
+the pages with next_cursor returns every match exactly once, newest first,
+on both storage backends, also when several results share a created_at.
+"""
+import pytest
+
+from app.services import storage_service
+from app.services.storage_service import (
+    MemoryStorageBackend,
+    SQLiteStorageBackend,
+    decode_cursor,
+    encode_cursor,
+    query_results,
+)
+
+
+LABELS = ("Timeout Error", "Assertion: Title Mismatch")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == "memory":
+        backend = MemoryStorageBackend(max_entries=0, max_bytes=0, ttl_seconds=0)
+    else:
+        backend = SQLiteStorageBackend(str(tmp_path / "results.db"), max_entries=0, max_bytes=0, ttl_seconds=0)
+    monkeypatch.setattr(storage_service, "_backend", backend)
+
+    for i in range(23):
+        # Groups of three results per timestamp: ties are broken by id
+        result_id = f"result-{i:02d}"
+        backend.store(result_id, {
+            "id": result_id,
+            "created_at": f"2026-01-01T00:00:{i // 3:02d}",
+            "title": f"Failure {i}",
+            "status": "success",
+            "triage_label": LABELS[i % 2],
+            "test_name": f"login test {i}" if i % 3 else f"checkout test {i}",
+        })
+    return backend
+
+
+def _walk(limit, **filters):
+    pages = []
+    cursor = None
+    while True:
+        results, cursor, total = query_results(limit=limit, cursor=cursor, **filters)
+        pages.append(results)
+        if cursor is None:
+            return pages, total
+
+
+def _newest_first(results):
+    return sorted(results, key=lambda result: (result["created_at"], result["id"]), reverse=True)
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 5, 22, 23, 100])
+def test_pages_cover_every_result_once(backend, limit):
+    everything, next_cursor, total = query_results()
+    assert next_cursor is None
+    assert total == 23
+
+    pages, page_total = _walk(limit)
+
+    walked = [result["id"] for page in pages for result in page]
+    assert walked == [result["id"] for result in everything]
+    assert walked == [result["id"] for result in _newest_first(everything)]
+    assert page_total == total
+    assert all(len(page) == limit for page in pages[:-1])
+    assert 0 < len(pages[-1]) <= limit
+
+
+@pytest.mark.parametrize("filters", [
+    {"triage_label": "Timeout Error"},
+    {"test_name": "login"},
+    {"created_after": "2026-01-01T00:00:02", "created_before": "2026-01-01T00:00:05"},
+    {"triage_label": "Assertion: Title Mismatch", "test_name": "checkout"},
+])
+def test_filtered_pages_cover_every_match_once(backend, filters):
+    matches, _, total = query_results(**filters)
+    assert total == len(matches) > 0
+
+    pages, page_total = _walk(2, **filters)
+
+    assert [result["id"] for page in pages for result in page] == [result["id"] for result in matches]
+    assert page_total == total
+
+
+def test_last_page_has_no_cursor(backend):
+    results, next_cursor, _ = query_results(limit=23)
+    assert len(results) == 23
+    assert next_cursor is None
+
+
+def test_cursor_points_after_the_last_result(backend):
+    first, next_cursor, _ = query_results(limit=4)
+
+    assert decode_cursor(next_cursor) == (first[-1]["created_at"], first[-1]["id"])
+    second, _, _ = query_results(limit=1, cursor=encode_cursor(first[1]))
+    assert second[0]["id"] == first[2]["id"]
+
+
+def test_cursor_round_trip():
+    result = {"id": "3f1c2a9e", "created_at": "2026-01-01T12:30:00.123456"}
+
+    assert decode_cursor(encode_cursor(result)) == ("2026-01-01T12:30:00.123456", "3f1c2a9e")
+
+
+@pytest.mark.parametrize("cursor", ["not base64!", "bm90IGpzb24=", encode_cursor({"id": "x"})[:-4]])
+def test_malformed_cursor_is_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_unknown_filter_is_rejected(backend):
+    with pytest.raises(ValueError):
+        query_results(label="Timeout Error")
@@ -0,0 +1,143 @@
+"""
+Prompt compaction (app/services/prompt_compaction.py): the compacted failure
+text stays within the token budget and in the "Test Name: ... Logs: ..."
+format, keeps what tells failures apart, and leaves small texts alone.
+"""
+import random
+import re
+
+import pytest
+
+from app.services.prompt_compaction import CHARS_PER_TOKEN, compact_failure_text, estimate_tokens
+
+
+FAILURE_TEXT_RE = re.compile(
+    r'\ATest Name: .*?\nFile Path: .*?\nError Message: .*?\nStack Trace: .*?\nLogs: .*\Z', re.DOTALL
+)
+
+
+def _failure_text(error_message="", stack_trace="", logs="", test_name="login > submits the form"):
+    return (
+        f"Test Name: {test_name}\nFile Path: tests/login.spec.ts\nError Message: {error_message}\n"
+        f"Stack Trace: {stack_trace}\nLogs: {logs}"
+    )
+
+
+def _random_failure(rng):
+    error_message = "Error: expect(locator).toHaveText(expected) failed\n" + "x" * rng.randint(0, 20000)
+    if rng.random() < 0.5:
+        error_message += "\nCall log:\n" + "\n".join(
+            f"  - attempt #{i}: waiting for locator('#total')" for i in range(rng.randint(0, 500))
+        )
+    stack_trace = "\n".join(
+        f"    at step{i} (/src/pages/page{i % 40}.ts:{i}:{i % 80})" for i in range(rng.randint(0, 2000))
+    )
+    logs = "\n".join(f"GET /api/items/{rng.randint(0, 10 ** 6)} -> {rng.choice((200, 404, 500))}"
+                     for _ in range(rng.randint(0, 3000)))
+    return _failure_text(error_message, stack_trace, logs)
+
+
+@pytest.mark.parametrize("budget", [64, 128, 256, 512, 1024, 4096])
+def test_compacted_text_fits_the_budget(budget):
+    rng = random.Random(budget)
+    for _ in range(10):
+        compacted = compact_failure_text(_random_failure(rng), budget)
+
+        assert estimate_tokens(compacted) <= budget
+        assert FAILURE_TEXT_RE.match(compacted)
+
+
+def test_text_in_another_format_fits_the_budget():
+    text = "\n".join(f"free-form line {i}" for i in range(5000))
+
+    compacted = compact_failure_text(text, 256)
+
+    assert estimate_tokens(compacted) <= 256
+    assert compacted.startswith("free-form line 0")
+    assert compacted.endswith("free-form line 4999")
+
+
+def test_small_text_is_unchanged():
+    text = _failure_text(
+        "TimeoutError: locator.click: Timeout 30000ms exceeded.",
+        "    at /tests/login.spec.ts:42:17",
+        "navigating to /login",
+    )
+
+    assert compact_failure_text(text, 1024) == text
+
+
+def test_zero_budget_only_compacts():
+    logs = "\n".join(["2026-01-01T10:00:00Z retrying request"] * 2000)
+
+    compacted = compact_failure_text(_failure_text("Error", "", logs), 0)
+
+    assert "retrying request  [repeated 2000x]" in compacted
+    assert estimate_tokens(compacted) < estimate_tokens(logs)
+
+
+def test_repeated_lines_differing_in_noise_are_kept_once():
+    logs = "\n".join(
+        f"2026-01-01T10:00:{i % 60:02d}.{i:03d}Z request 0x{i:04x} took {i}ms"
+        for i in range(100)
+    )
+
+    compacted = compact_failure_text(_failure_text("Error", "", logs), 4096)
+
+    assert compacted.count("request") == 1
+    assert "[repeated 100x]" in compacted
+
+
+def test_lines_differing_in_paths_and_numbers_are_kept():
+    logs = "\n".join([
+        "GET /api/users/1 -> 500",
+        "GET /api/orders/1 -> 500",
+        "GET /api/users/2 -> 500",
+        "build 12345678 failed",
+        "build 87654321 failed",
+    ])
+
+    compacted = compact_failure_text(_failure_text("Error", "", logs), 4096)
+
+    assert compacted.endswith("Logs: " + logs)
+
+
+def test_library_frames_are_dropped_and_recursion_collapsed():
+    stack_trace = "\n".join(
+        ["Error: boom", "    at /tests/login.spec.ts:42:17"]
+        + ["    at recurse (/tests/helpers.ts:7:3)"] * 50
+        + [f"    at lib{i} (/app/node_modules/@playwright/test/lib/x.js:{i}:1)" for i in range(30)]
+        + ["    at process.processTicksAndRejections (node:internal/process/task_queues:95:5)"]
+    )
+
+    compacted = compact_failure_text(_failure_text("Error: boom", stack_trace, ""), 4096)
+
+    assert "/tests/login.spec.ts:42:17" in compacted
+    assert compacted.count("recurse") == 1
+    assert "[previous frame repeated 49 more times]" in compacted
+    assert "/app/node_modules/" not in compacted
+    assert "[31 node_modules / internal frames omitted]" in compacted
+
+
+def test_expected_and_received_survive_truncation():
+    error_message = (
+        "Error: expect(locator).toHaveText(expected) failed\n\n"
+        "Expected string: \"Total: 42\"\nReceived string: \"Total: 41\"\n"
+        "Call log:\n" + "\n".join(f"  - attempt {i}: locator resolved to <span id=\"total{i}\">" for i in range(2000))
+    )
+
+    compacted = compact_failure_text(_failure_text(error_message, "", ""), 256)
+
+    assert estimate_tokens(compacted) <= 256
+    assert "Expected string: \"Total: 42\"" in compacted
+    assert "Received string: \"Total: 41\"" in compacted
+
+
+def test_long_single_fields_are_capped():
+    text = _failure_text("Error", "", "", test_name="t" * 5000)
+
+    compacted = compact_failure_text(text, 4096)
+
+    test_name = compacted.split("\n", 1)[0]
+    assert len(test_name) <= len("Test Name: ") + 300
+    assert len(compacted) <= 4096 * CHARS_PER_TOKEN
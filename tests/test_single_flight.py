@@ -0,0 +1,170 @@
+"""
+Single-flight coalescing (app/services/single_flight.py): concurrent callers of
+one key share the leader's result or exception, and a finished call (also a
+failed one) is forgotten so the next caller runs it again.
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.services.single_flight import SingleFlight
+
+
+class BoomError(Exception):
+    pass
+
+
+def _wait_for_waiters(flight, key, count):
+    # Followers register under the flight lock before blocking on the call
+    for _ in range(1000):
+        call = flight._calls.get(key)
+        if call is not None and call.waiters >= count:
+            return
+        time.sleep(0.001)
+    raise AssertionError(f"{count} waiters never joined {key!r}")
+
+
+def test_threads_share_the_leader_result():
+    flight = SingleFlight("test")
+    release = threading.Event()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        release.wait(5)
+        return "result"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do("key", fn))) for _ in range(5)]
+    threads[0].start()
+    _wait_for_waiters(flight, "key", 0)
+    for thread in threads[1:]:
+        thread.start()
+    _wait_for_waiters(flight, "key", 4)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert results == ["result"] * 5
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 4}
+
+
+def test_threads_share_the_leader_error():
+    flight = SingleFlight("test")
+    release = threading.Event()
+
+    def fn():
+        release.wait(5)
+        raise BoomError("ollama down")
+
+    errors = []
+
+    def caller():
+        try:
+            flight.do("key", fn)
+        except BoomError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=caller) for _ in range(4)]
+    threads[0].start()
+    _wait_for_waiters(flight, "key", 0)
+    for thread in threads[1:]:
+        thread.start()
+    _wait_for_waiters(flight, "key", 3)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 4
+    # Every follower gets the leader's exception, not a copy or a timeout
+    assert all(error is errors[0] for error in errors)
+    assert flight.stats()["in_flight"] == 0
+
+
+def test_failed_call_is_not_cached():
+    flight = SingleFlight("test")
+
+    def fail():
+        raise BoomError("first")
+
+    with pytest.raises(BoomError):
+        flight.do("key", fail)
+    assert flight.do("key", lambda: "second") == "second"
+    assert flight.stats()["executions"] == 2
+
+
+def test_async_waiters_share_the_leader_error():
+    flight = SingleFlight("test")
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise BoomError("bert down")
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async("key", fn) for _ in range(5)), return_exceptions=True)
+
+    results = asyncio.run(main())
+
+    assert len(calls) == 1
+    assert all(isinstance(result, BoomError) for result in results)
+    assert all(result is results[0] for result in results)
+    assert flight.stats() == {"in_flight": 0, "executions": 1, "coalesced": 4}
+
+
+def test_async_cancelled_leader_does_not_cancel_waiters():
+    flight = SingleFlight("test")
+
+    async def fn():
+        await asyncio.sleep(0.02)
+        return "result"
+
+    async def main():
+        leader = asyncio.ensure_future(flight.do_async("key", fn))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do_async("key", fn))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower, leader
+
+    result, leader = asyncio.run(main())
+
+    assert result == "result"
+    assert leader.cancelled()
+
+
+def test_thread_waits_on_async_leader():
+    flight = SingleFlight("test")
+    started = threading.Event()
+
+    async def fn():
+        started.set()
+        await asyncio.sleep(0.02)
+        raise BoomError("shared across threads and tasks")
+
+    errors = []
+
+    def thread_caller():
+        started.wait(5)
+        try:
+            flight.do("key", lambda: "not run")
+        except BoomError as e:
+            errors.append(e)
+
+    async def main():
+        thread = threading.Thread(target=thread_caller)
+        thread.start()
+        task = asyncio.ensure_future(flight.do_async("key", fn))
+        await asyncio.to_thread(_wait_for_waiters, flight, "key", 1)
+        with pytest.raises(BoomError) as leader_error:
+            await task
+        await asyncio.to_thread(thread.join, 5)
+        return leader_error.value
+
+    leader_error = asyncio.run(main())
+
+    assert errors == [leader_error]
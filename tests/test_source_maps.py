@@ -0,0 +1,199 @@
+"""
+Source map resolution (app/utils/source_maps.py): Base64 VLQ decoding, lookups
+in a parsed map, and the confinement of map files to TRIAGE_SOURCE_MAP_ROOT.
+"""
+import json
+import os
+
+import pytest
+
+from app.utils import source_maps
+from app.utils.source_maps import SourceMap, SourceMapCache, decode_vlq, map_path_for, resolve_location
+
+
+BASE64 = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+def encode_vlq(values):
+    """Reference encoder (source map v3): sign in the lowest bit, 5-bit groups, low group first."""
+    encoded = ""
+    for value in values:
+        value = (-value << 1) | 1 if value < 0 else value << 1
+        while True:
+            digit, value = value & 31, value >> 5
+            encoded += BASE64[digit | (32 if value else 0)]
+            if not value:
+                break
+    return encoded
+
+
+@pytest.mark.parametrize("segment, values", [
+    ("A", [0]),
+    ("C", [1]),
+    ("D", [-1]),
+    ("gB", [16]),
+    ("hB", [-16]),
+    ("2H", [123]),
+    ("3H", [-123]),
+    ("AAAA", [0, 0, 0, 0]),
+    ("AAgBC", [0, 0, 16, 1]),
+])
+def test_decode_known_segments(segment, values):
+    assert decode_vlq(segment) == values
+
+
+@pytest.mark.parametrize("values", [
+    [0, 0, 0, 0, 0],
+    [15, -15, 16, -16, 31, -31, 32, -32],
+    [1023, -1024, 65536, -65537],
+    [2 ** 31 - 1, -(2 ** 31)],
+])
+def test_decode_round_trips_the_reference_encoder(values):
+    assert decode_vlq(encode_vlq(values)) == values
+
+
+@pytest.mark.parametrize("segment", ["g", "AAg", "Ag", "A=", "A A", "A-", "AA,AA"])
+def test_decode_rejects_truncated_or_invalid_segments(segment):
+    with pytest.raises(ValueError):
+        decode_vlq(segment)
+
+
+def _mappings(lines):
+    """
+    Encode absolute (generated column, source, line, column) segments per
+    generated line into relative VLQ mappings.
+    """
+    previous_source = previous_line = previous_column = 0
+    encoded_lines = []
+    for segments in lines:
+        encoded = []
+        previous_generated = 0
+        for segment in segments:
+            if len(segment) == 1:
+                encoded.append(encode_vlq([segment[0] - previous_generated]))
+            else:
+                generated, source, line, column = segment
+                encoded.append(encode_vlq([
+                    generated - previous_generated,
+                    source - previous_source,
+                    line - previous_line,
+                    column - previous_column,
+                ]))
+                previous_source, previous_line, previous_column = source, line, column
+            previous_generated = segment[0]
+        encoded_lines.append(",".join(encoded))
+    return ";".join(encoded_lines)
+
+
+# 0-based (generated column, source, original line, original column) per generated line
+SEGMENTS = [
+    [(0, 0, 0, 0), (10, 0, 2, 4), (25, 1, 40, 8)],
+    [],
+    [(4, 1, 41, 2), (12,), (30, 0, 7, 0)],
+]
+MAP = {
+    "version": 3,
+    "sources": ["login.spec.ts", "helpers/page.ts"],
+    "sourceRoot": "../src",
+    "mappings": _mappings(SEGMENTS),
+}
+
+
+@pytest.mark.parametrize("line, column, expected", [
+    (1, None, ("login.spec.ts", 1, 1)),
+    (1, 1, ("login.spec.ts", 1, 1)),
+    (1, 10, ("login.spec.ts", 1, 1)),
+    (1, 11, ("login.spec.ts", 3, 5)),
+    (1, 25, ("login.spec.ts", 3, 5)),
+    (1, 26, ("helpers/page.ts", 41, 9)),
+    (1, 500, ("helpers/page.ts", 41, 9)),
+    (3, 1, ("helpers/page.ts", 42, 3)),
+    (3, 20, ("helpers/page.ts", 42, 3)),
+    (3, 31, ("login.spec.ts", 8, 1)),
+    (2, 1, None),
+    (4, 1, None),
+    (0, 1, None),
+])
+def test_lookup(tmp_path, line, column, expected):
+    source_map = SourceMap(MAP, str(tmp_path / "dist"))
+
+    resolved = source_map.lookup(line, column)
+
+    if expected is None:
+        assert resolved is None
+    else:
+        path, original_line, original_column = resolved
+        assert path == os.path.normpath(str(tmp_path / "src" / expected[0]))
+        assert (original_line, original_column) == expected[1:]
+
+
+def test_indexed_maps_are_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        SourceMap({"version": 3, "sections": []}, str(tmp_path))
+
+
+@pytest.fixture
+def root(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    (root / "dist").mkdir(parents=True)
+    (root / "dist" / "login.spec.js.map").write_text(json.dumps(MAP), encoding="utf-8")
+    monkeypatch.setattr(source_maps, "SOURCE_MAP_ROOT", str(root))
+    monkeypatch.setattr(source_maps, "source_map_cache", SourceMapCache())
+    return root
+
+
+def test_resolve_location_under_the_root(root):
+    path, line, column = resolve_location("dist/login.spec.js", 1, 26)
+
+    assert path == os.path.join(os.path.realpath(root), "src", "helpers", "page.ts")
+    assert (line, column) == (41, 9)
+
+
+def test_parsed_maps_are_cached_until_the_file_changes(root):
+    resolve_location("dist/login.spec.js", 1, 1)
+    resolve_location("dist/login.spec.js", 3, 1)
+    assert source_maps.source_map_cache.stats()["misses"] == 1
+    assert source_maps.source_map_cache.stats()["hits"] == 1
+
+    changed = dict(MAP, mappings=_mappings([[(0, 1, 99, 0)]]))
+    (root / "dist" / "login.spec.js.map").write_text(json.dumps(changed) + "\n", encoding="utf-8")
+
+    assert resolve_location("dist/login.spec.js", 1, 1)[1] == 100
+    assert source_maps.source_map_cache.stats()["invalidations"] == 1
+
+
+@pytest.mark.parametrize("file_path", [
+    "../outside.js",
+    "dist/../../outside.js",
+    "/etc/passwd",
+    "\\\\server\\share\\app.js",
+    "//server/share/app.js",
+    "C:\\build\\app.js",
+    "C:app.js",
+    "file:///etc/passwd",
+    "https://example.com/app.js",
+    "dist/app\x00.js",
+    "",
+])
+def test_paths_outside_the_root_are_rejected(root, file_path):
+    assert map_path_for(file_path) is None
+    assert resolve_location(file_path, 1, 1) is None
+
+
+def test_symlinks_escaping_the_root_are_rejected(root, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    (outside / "app.js.map").write_text(json.dumps(MAP), encoding="utf-8")
+    try:
+        os.symlink(outside, root / "linked")
+    except OSError:
+        pytest.skip("symlinks not available")
+
+    assert map_path_for("linked/app.js") is None
+
+
+def test_nothing_is_resolved_without_a_root(root, monkeypatch):
+    monkeypatch.setattr(source_maps, "SOURCE_MAP_ROOT", "")
+
+    assert map_path_for("dist/login.spec.js") is None
+    assert resolve_location("dist/login.spec.js", 1, 1) is None
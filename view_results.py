@@ -8,6 +8,7 @@ from datetime import datetime
 
 # Configuration
 API_URL = "http://192.168.1.13:8003/api/triage"
+PAGE_SIZE = 100
 
 def view_latest():
     """View the latest triage result"""
@@ -49,12 +50,23 @@ def view_all():
     print()
     
     try:
-        response = requests.get(API_URL, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-        
-        results = data.get('results', [])
-        total = data.get('total', 0)
+        # Page through the results instead of fetching the whole store at once
+        results = []
+        total = 0
+        cursor = None
+        while True:
+            params = {"limit": PAGE_SIZE}
+            if cursor:
+                params["cursor"] = cursor
+            response = requests.get(API_URL, params=params, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+            
+            results.extend(data.get('results', []))
+            total = data.get('total', 0)
+            cursor = data.get('next_cursor')
+            if not cursor:
+                break
         
         print(f"Total Results: {total}")
         print()